@@ -8,7 +8,6 @@ with the terms of the Adobe license agreement accompanying it.
 # pylint: disable=too-many-lines
 
 from collections import OrderedDict
-import fnmatch
 import importlib.metadata
 import inspect
 import json
@@ -18,6 +17,7 @@ import shutil
 import sys
 import tarfile
 import tempfile
+import threading
 import traceback
 from typing import List, Optional
 
@@ -28,16 +28,29 @@ from vcsinfo import detect_vcs, VCSUnsupported, VCSMissingRevision
 from docker.errors import ImageNotFound
 
 from buildrunner import docker, loggers
+from buildrunner.caches.backend import wait_for_remote_caches
+from buildrunner.caches.codec import get_codec
+from buildrunner.caches.eviction import CacheEvictor
+from buildrunner.caches.telemetry import format_cache_report
+from buildrunner.caches.volume import CacheVolumes
 from buildrunner.config import (
     BuildRunnerConfig,
 )
-from buildrunner.config.models import DEFAULT_CACHES_ROOT
+from buildrunner.config.models import DEFAULT_CACHES_ROOT, SOURCE_PROVIDER_VOLUME
 from buildrunner.errors import (
     BuildRunnerConfigurationError,
     BuildRunnerProcessingError,
     BuildRunnerError,
 )
+from buildrunner.source.archive import SourceArchiver
+from buildrunner.source.ignore import BUILDIGNORE_FILE, IgnoreMatcher
+from buildrunner.source.image import SourceImageCache
+from buildrunner.source.volume import SourceVolume
 from buildrunner.steprunner import BuildStepRunner
+from buildrunner.steprunner.tasks.run import SOURCE_VOLUME_MOUNT
+from buildrunner.docker.daemon import DockerDaemonProxy
+from buildrunner.docker.helper import HelperContainer
+from buildrunner.utils import sanitize_tag
 from buildrunner.docker.multiplatform_image_builder import MultiplatformImageBuilder
 import buildrunner.docker.builder
 
@@ -50,6 +63,9 @@ except importlib.metadata.PackageNotFoundError:
     __version__ = "DEVELOPMENT"
 
 SOURCE_DOCKERFILE = os.path.join(os.path.dirname(__file__), "SourceDockerfile")
+CACHED_SOURCE_DOCKERFILE = os.path.join(
+    os.path.dirname(__file__), "CachedSourceDockerfile"
+)
 
 
 class BuildRunner:
@@ -105,6 +121,16 @@ class BuildRunner:
         self.exit_code = None
         self._source_image = None
         self._source_archive = None
+        self._source_archiver = None
+        self._source_image_cache = None
+        self._source_volume = None
+        # Source creation may run in a background thread while other steps run
+        self._source_lock = threading.RLock()
+        self._source_thread = None
+        # The utility containers shared by every step of the build
+        self._helper_lock = threading.Lock()
+        self._helper_container = None
+        self._docker_daemon_proxy = None
         self._log = None
         self._step_runner = None
 
@@ -172,9 +198,11 @@ class BuildRunner:
     @staticmethod
     def get_cache_archive_ext():
         """
-        Returns the archive file extension used for cache archive files
+        Returns the archive file extension used for new cache archive files, which
+        depends on the configured cache codec
         """
-        return "tar"
+        caches_config = BuildRunnerConfig.get_instance().global_config.caches
+        return get_codec(caches_config.codec).extension
 
     def get_cache_archive_file(self, cache_name, project_name=""):
         """
@@ -212,6 +240,7 @@ class BuildRunner:
         """
         global_config = BuildRunnerConfig.get_instance().global_config
         cache_dir = os.path.expanduser(global_config.caches_root)
+        BuildRunner._prune_cache_volumes(remove_all=True)
         if os.path.exists(cache_dir):
             LOGGER.info(f'Cleaning cache dir "{cache_dir}"')
             shutil.rmtree(f"{cache_dir}/")
@@ -219,10 +248,71 @@ class BuildRunner:
         else:
             LOGGER.info(f'Cache dir "{cache_dir}" is already clean')
 
-    def add_artifact(self, artifact_file, properties):
+    @staticmethod
+    def _prune_cache_volumes(remove_all: bool = False):
+        """
+        Remove the cache volumes that are no longer used (or all of them)
+        """
+        caches_root = BuildRunnerConfig.get_instance().global_config.caches_root
+        try:
+            removed = CacheVolumes(docker.new_client(), caches_root).prune(
+                remove_all=remove_all
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            # Docker may not be available when only archives are used
+            LOGGER.warning(f"Unable to remove cache volumes: {exc}")
+            return
+        if removed:
+            LOGGER.info(f"Removed {len(removed)} cache volume(s)")
+
+    @staticmethod
+    def evict_cache():
+        """
+        Evict the least recently used caches until the cache dir is within the
+        configured quotas
+        """
+        global_config = BuildRunnerConfig.get_instance().global_config
+        caches_config = global_config.caches
+        BuildRunner._prune_cache_volumes()
+        if caches_config.max_size is None and caches_config.max_project_size is None:
+            LOGGER.warning(
+                'No cache quotas are configured ("max-size" or "max-project-size" in '
+                'the "caches" global configuration), only removing unreferenced '
+                "cache chunks"
+            )
+        evicted = CacheEvictor(
+            global_config.caches_root,
+            max_size=caches_config.max_size,
+            max_project_size=caches_config.max_project_size,
+        ).evict()
+        LOGGER.info(
+            f"Evicted {len(evicted)} cache(s) freeing "
+            f"{sum(archive.size for archive in evicted)} bytes"
+        )
+
+    @staticmethod
+    def report_cache():
+        """
+        Print the cache telemetry report of the cache dir
+        """
+        print(
+            format_cache_report(
+                os.path.expanduser(
+                    BuildRunnerConfig.get_instance().global_config.caches_root
+                )
+            )
+        )
+
+    def add_artifact(self, artifact_file, properties, checksums=None):
         """
-        Register a build artifact to be included in the artifacts manifest.
+        Register a build artifact to be included in the artifacts manifest, along
+        with the size and checksums of the artifact file (see
+        buildrunner.artifacts.HashingWriter) when they were computed while the file
+        was written.
         """
+        if checksums:
+            # the properties may be shared by all artifacts matching a pattern
+            properties = {**(properties or {}), **checksums}
         self.artifacts[artifact_file] = properties
 
     @retry(exceptions=FileNotFoundError, tries=5, delay=1, backoff=3, max_delay=10)
@@ -238,64 +328,221 @@ class BuildRunner:
         Create the source archive for use in remote builds or to build the
         source image.
         """
-        if not self._source_archive:
-            buildignore = os.path.join(self.build_dir, ".buildignore")
-            excludes = []
-            if os.path.exists(buildignore):
-                with open(buildignore, "r", encoding="utf-8") as _file:
-                    excludes = _file.read().splitlines()
-
-            def _filter_results_and_excludes(tarinfo):
-                """
-                Filter to exclude results dir and listed excludes from source archive.
-                """
-                if tarinfo.name == os.path.basename(self.build_results_dir):
-                    return None
-                for _ex in excludes:
-                    if _ex and _ex.strip() and fnmatch.fnmatch(tarinfo.name, _ex):
-                        return None
-                return tarinfo
-
-            self.log.write("Creating source archive\n")
-            _fileobj = None
-            try:
-                # pylint: disable=consider-using-with
-                _fileobj = tempfile.NamedTemporaryFile(
-                    delete=False,
-                    dir=BuildRunnerConfig.get_instance().global_config.temp_dir,
-                )
-                self._create_archive_tarfile(
-                    self.build_dir, _fileobj, _filter_results_and_excludes
+        with self._source_lock:
+            if not self._source_archive:
+                buildignore = IgnoreMatcher.from_file(
+                    os.path.join(self.build_dir, BUILDIGNORE_FILE)
                 )
-                self._source_archive = _fileobj.name
-            finally:
-                if _fileobj:
-                    _fileobj.close()
+                results_dir_name = os.path.basename(self.build_results_dir)
+
+                def _is_excluded(name, is_dir):
+                    """
+                    Determine if the results dir or listed excludes match the given path.
+                    """
+                    if not name:
+                        # The root of the archive
+                        return False
+                    return name == results_dir_name or buildignore.match(name, is_dir)
+
+                def _filter_results_and_excludes(tarinfo):
+                    """
+                    Filter to exclude results dir and listed excludes from source archive.
+                    Excluded directories are not descended into.
+                    """
+                    if _is_excluded(tarinfo.name, tarinfo.isdir()):
+                        return None
+                    return tarinfo
+
+                self.log.write("Creating source archive\n")
+                global_config = self.buildrunner_config.global_config
+                if global_config.source.incremental or global_config.source.reuse_image:
+                    vcs = self.buildrunner_config.vcs
+                    self._source_archiver = SourceArchiver(
+                        build_dir=self.build_dir,
+                        caches_root=global_config.caches_root,
+                        project_name=sanitize_tag(vcs.name) if vcs else "",
+                        exclude=_is_excluded,
+                        use_git_index=bool(vcs and vcs.vcs == "git"),
+                        include_git_ignored=global_config.source.include_git_ignored,
+                    )
+                    self._source_archive = self._source_archiver.create()
+                    return self._source_archive
+
+                _fileobj = None
+                try:
+                    # pylint: disable=consider-using-with
+                    _fileobj = tempfile.NamedTemporaryFile(
+                        delete=False,
+                        dir=global_config.temp_dir,
+                    )
+                    self._create_archive_tarfile(
+                        self.build_dir, _fileobj, _filter_results_and_excludes
+                    )
+                    self._source_archive = _fileobj.name
+                finally:
+                    if _fileobj:
+                        _fileobj.close()
         return self._source_archive
 
     def get_source_image(self):
         """
         Get and/or create the base image source containers will be created from.
         """
-        if not self._source_image:
-            self.log.write("Creating source image\n")
-            source_archive_path = self.get_source_archive_path()
-            inject = {
-                source_archive_path: "source.tar",
-                SOURCE_DOCKERFILE: "Dockerfile",
-            }
-            image = buildrunner.docker.builder.build_image(
-                temp_dir=self.buildrunner_config.global_config.temp_dir,
-                inject=inject,
-                timeout=self.docker_timeout,
-                docker_registry=self.buildrunner_config.global_config.docker_registry,
-                nocache=True,
-                pull=False,
-            )
-            self._source_image = image
+        with self._source_lock:
+            if not self._source_image:
+                global_config = self.buildrunner_config.global_config
+                source_archive_path = self.get_source_archive_path()
+                dockerfile = (
+                    CACHED_SOURCE_DOCKERFILE
+                    if global_config.source.reuse_image
+                    else SOURCE_DOCKERFILE
+                )
+
+                def _build_source_image():
+                    self.log.write("Creating source image\n")
+                    return buildrunner.docker.builder.build_image(
+                        temp_dir=global_config.temp_dir,
+                        inject={
+                            source_archive_path: "source.tar",
+                            dockerfile: "Dockerfile",
+                        },
+                        timeout=self.docker_timeout,
+                        docker_registry=global_config.docker_registry,
+                        # Cached source images have no unique layer, so the layer cache is safe to use
+                        nocache=not global_config.source.reuse_image,
+                        pull=False,
+                    )
+
+                if global_config.source.reuse_image:
+                    self._source_image_cache = SourceImageCache(
+                        docker.new_client(timeout=self.docker_timeout),
+                        global_config.caches_root,
+                        f"{global_config.docker_registry}/busybox:latest",
+                    )
+                    self._source_image = self._source_image_cache.get(
+                        self._source_archiver.digest, dockerfile, _build_source_image
+                    )
+                else:
+                    self._source_image = _build_source_image()
 
         return self._source_image
 
+    def get_source_volume(self) -> Optional[SourceVolume]:
+        """
+        Get and/or create the named volume holding the source tree, returns None unless
+        the volume source provider is configured.
+        """
+        global_config = self.buildrunner_config.global_config
+        if global_config.source.provider != SOURCE_PROVIDER_VOLUME:
+            return None
+        with self._source_lock:
+            if not self._source_volume:
+                source_archive_path = self.get_source_archive_path()
+                self.log.write("Creating source volume\n")
+                source_volume = SourceVolume(
+                    docker.new_client(timeout=self.docker_timeout),
+                    global_config.docker_registry,
+                    SOURCE_VOLUME_MOUNT,
+                    self.buildrunner_config.container_labels,
+                )
+                self._source_volume = source_volume
+                source_volume.create(source_archive_path)
+        return self._source_volume
+
+    def get_helper_container(self) -> HelperContainer:
+        """
+        Get the utility container shared by every step of the build, it is started on
+        first use. The source volume is mounted in it when the volume source provider
+        is configured.
+        """
+        source_volume = self.get_source_volume()
+        with self._helper_lock:
+            if not self._helper_container:
+                self._helper_container = HelperContainer(
+                    self.buildrunner_config.global_config.docker_registry,
+                    log=self.log,
+                    volumes={source_volume.name: f"{SOURCE_VOLUME_MOUNT}:ro"}
+                    if source_volume
+                    else None,
+                    working_dir=SOURCE_VOLUME_MOUNT,
+                )
+        return self._helper_container
+
+    def get_docker_daemon_proxy(self) -> DockerDaemonProxy:
+        """
+        Get and/or create the container giving the build containers of every step
+        access to the Docker daemon.
+        """
+        with self._helper_lock:
+            if not self._docker_daemon_proxy:
+                docker_daemon_proxy = DockerDaemonProxy(
+                    docker.new_client(timeout=self.docker_timeout),
+                    self.log,
+                    self.buildrunner_config.global_config.docker_registry,
+                    self.buildrunner_config.container_labels,
+                    # The container is only used for its volumes
+                    None,
+                )
+                docker_daemon_proxy.start()
+                self._docker_daemon_proxy = docker_daemon_proxy
+        return self._docker_daemon_proxy
+
+    def _plan_source(self) -> List[str]:
+        """
+        Return the names of the steps to run that need the source tree, in order. Only
+        run steps (mounting /source) and remote steps (uploading the source archive)
+        use it, build, push and commit steps do not.
+        """
+        return [
+            step_name
+            for step_name, step_config in self.buildrunner_config.run_config.steps.items()
+            if (not self.steps_to_run or step_name in self.steps_to_run)
+            and (step_config.run or step_config.remote)
+        ]
+
+    def _prepare_source(self, needs_container: bool):
+        """
+        Create the source archive and, if a run step needs it, the source volume or
+        image. Failures are ignored here, creation is attempted again by the first
+        step that needs the source.
+        """
+        try:
+            if needs_container and not self.get_source_volume():
+                self.get_source_image()
+            else:
+                self.get_source_archive_path()
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.debug(f"Unable to prepare the source in the background: {exc}")
+
+    def _start_source_preparation(self):
+        """
+        Start creating the source in the background if the first steps to run do not
+        need it, so that its creation overlaps with those steps. Otherwise the source is
+        created on demand by the first step that needs it, if any.
+        """
+        source_steps = self._plan_source()
+        if not source_steps:
+            self.log.write("No steps to run use the source tree\n")
+            return
+        first_step = next(
+            step_name
+            for step_name in self.buildrunner_config.run_config.steps
+            if not self.steps_to_run or step_name in self.steps_to_run
+        )
+        if first_step == source_steps[0]:
+            return
+        needs_container = any(
+            self.buildrunner_config.run_config.steps[step_name].run
+            for step_name in source_steps
+        )
+        self._source_thread = threading.Thread(
+            target=self._prepare_source,
+            args=(needs_container,),
+            name="buildrunner-source",
+            daemon=True,
+        )
+        self._source_thread.start()
+
     def _write_artifact_manifest(self):
         """
         If we have registered artifacts write the files and associated metadata
@@ -360,7 +607,7 @@ class BuildRunner:
                 cache_from=self.buildrunner_config.global_config.docker_build_cache.from_config,
                 cache_to=self.buildrunner_config.global_config.docker_build_cache.to_config,
             ) as multi_platform:
-                self.get_source_archive_path()
+                self._start_source_preparation()
                 # run each step
                 for (
                     step_name,
@@ -495,12 +742,30 @@ class BuildRunner:
             self.exit_code = 1
 
         finally:
+            if self._source_thread:
+                self._source_thread.join()
+            # Saved caches are uploaded in the background
+            wait_for_remote_caches()
             self._write_artifact_manifest()
 
             _docker_client = docker.new_client(timeout=self.docker_timeout)
 
+            if self._helper_container:
+                self.log.write("Destroying helper container\n")
+                self._helper_container.remove()
+            if self._docker_daemon_proxy:
+                self._docker_daemon_proxy.stop()
+
+            if self._source_volume:
+                self.log.write(f"Destroying source volume {self._source_volume.name}\n")
+                self._source_volume.remove()
+
             # cleanup the source image
-            if self._source_image:
+            if self._source_image_cache:
+                # Cached source images are kept for later runs, only unused ones are removed
+                self._source_image_cache.release()
+                self._source_image_cache.prune()
+            elif self._source_image:
                 self.log.write(f"Destroying source image {self._source_image}\n")
                 try:
                     _docker_client.remove_image(
@@ -532,7 +797,10 @@ class BuildRunner:
                         self.log.write(f"Unable to remove image {_image}: {str(_ex)}\n")
             else:
                 self.log.write("Keeping generated images\n")
-            if self._source_archive:
+            if self._source_archiver:
+                # Persistent archives are kept for later runs
+                self._source_archiver.release()
+            elif self._source_archive:
                 self.log.write("Destroying source archive\n")
                 os.remove(self._source_archive)
 
@@ -0,0 +1,421 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import bz2
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import logging
+import lzma
+import os
+import posixpath
+import shutil
+import tarfile
+from typing import (
+    Callable,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Union,
+)
+
+from buildrunner.caches.codec import CACHE_CODEC_ZSTD, get_codec
+from buildrunner.errors import (
+    BuildRunnerConfigurationError,
+    BuildRunnerProcessingError,
+)
+from buildrunner.utils import IterableReader
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Separates the fields of a line of the artifact listing
+ARTIFACT_INFO_DELIMITER = "~!~"
+ARTIFACT_TYPE_DIRECTORY = "directory"
+ARTIFACT_TYPE_FILE = "file"
+ARTIFACT_COPY_BUFFER_SIZE = 2**20
+# The checksums that can be computed while artifacts are written
+ARTIFACT_CHECKSUMS = ("sha256", "sha1", "md5")
+
+
+class ArtifactMatch(NamedTuple):
+    """
+    A file or directory matching an artifact pattern.
+    """
+
+    # The index of the matching pattern
+    index: int
+    # The path as matched by the pattern, relative to the working directory unless
+    # the pattern is absolute
+    path: str
+    # The absolute path with all symbolic links resolved
+    real_path: str
+    is_dir: bool
+
+
+def get_artifact_listing_command(patterns: Iterable[str]) -> str:
+    """
+    Returns a shell command listing the files and directories matching all the given
+    glob patterns in a single exec, one line per match (see parse_artifact_listing).
+    The patterns are expanded by the shell, so they are not quoted.
+    """
+    commands = []
+    for index, pattern in enumerate(patterns):
+        commands.append(
+            f"for f in {pattern}; do "
+            '[ -e "$f" ] || continue; '
+            f'if [ -d "$f" ]; then t={ARTIFACT_TYPE_DIRECTORY}; '
+            f"else t={ARTIFACT_TYPE_FILE}; fi; "
+            f"printf '%s{ARTIFACT_INFO_DELIMITER}%s{ARTIFACT_INFO_DELIMITER}%s"
+            f"{ARTIFACT_INFO_DELIMITER}%s\\n' "
+            f'{index} "$t" "$(readlink -f "$f")" "$f"; '
+            "done"
+        )
+    return "\n".join(commands)
+
+
+def parse_artifact_listing(output: str) -> Dict[int, List[ArtifactMatch]]:
+    """
+    Returns the matches of each pattern index in the output of the command returned
+    by get_artifact_listing_command.
+    """
+    matches: Dict[int, List[ArtifactMatch]] = {}
+    for line in output.splitlines():
+        fields = line.split(ARTIFACT_INFO_DELIMITER, 3)
+        if len(fields) != 4 or not fields[0].isdigit():
+            continue
+        index, file_type, real_path, path = fields
+        matches.setdefault(int(index), []).append(
+            ArtifactMatch(
+                int(index), path, real_path, file_type == ARTIFACT_TYPE_DIRECTORY
+            )
+        )
+    return matches
+
+
+class HashingWriter(io.RawIOBase):
+    """
+    A writable file object writing to the given file object, computing the size and
+    the checksums of the data while it is written, so that artifacts are not read
+    again to compute them.
+    """
+
+    def __init__(self, file_obj: io.IOBase, checksums: Iterable[str] = ()):
+        super().__init__()
+        self._file_obj = file_obj
+        self._hashes = {
+            # The checksums identify artifacts, they are not used for security
+            checksum: hashlib.new(checksum, usedforsecurity=False)
+            for checksum in checksums
+        }
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._file_obj.write(data)
+        for hasher in self._hashes.values():
+            hasher.update(data)
+        self.size += len(data)
+        return len(data)
+
+    def get_properties(self) -> Dict[str, Union[int, str]]:
+        """
+        Returns the size and checksums of the written data as artifact properties.
+        """
+        properties: Dict[str, Union[int, str]] = {"buildrunner.size": self.size}
+        for checksum, hasher in self._hashes.items():
+            properties[f"buildrunner.{checksum}"] = hasher.hexdigest()
+        return properties
+
+
+class ExtractedArtifact(NamedTuple):
+    """
+    A file extracted from an artifact archive.
+    """
+
+    # The path relative to the destination directory
+    path: str
+    # The size and checksums of the file (see HashingWriter.get_properties)
+    properties: Dict[str, Union[int, str]]
+
+
+def _get_member_path(name: str, strip: str, prefix: str) -> Optional[str]:
+    """
+    Returns the destination path (relative to the destination directory) of a member
+    of an archive of the path with the given base name, or None if the member is
+    outside of it.
+    """
+    name = posixpath.normpath(name.lstrip("/"))
+    if name == strip:
+        relative = ""
+    elif name.startswith(f"{strip}/"):
+        relative = name[len(strip) + 1 :]
+    else:
+        return None
+    path = posixpath.normpath(posixpath.join(prefix, relative))
+    if path.startswith("/") or path == ".." or path.startswith("../"):
+        return None
+    return path
+
+
+def _fix_ownership(path: str, uid: int, gid: int) -> None:
+    stat = os.lstat(path)
+    if (stat.st_uid, stat.st_gid) != (uid, gid):
+        os.chown(path, uid, gid, follow_symlinks=False)
+
+
+def extract_artifacts(
+    chunks: Iterable[bytes],
+    dest_dir: str,
+    dest_path: str,
+    uid: Optional[int] = None,
+    gid: Optional[int] = None,
+    checksums: Iterable[str] = (),
+) -> Iterator[ExtractedArtifact]:
+    """
+    Extract the archive of a single file or directory (as returned by get_archive)
+    into the destination directory while it is being streamed, placing the file or
+    directory at the given destination path (relative to the destination directory).
+
+    The files are owned by the given user and group ids (defaulting to the ids of
+    this process) as they are written. Only regular files are extracted, links to
+    files extracted earlier are copied and other members (e.g. symbolic links) are
+    skipped, matching the files gathered by the previous cp/find based retrieval.
+
+    Returns a generator of the extracted files, in the order of the archive, with
+    the given checksums computed while they were written.
+    """
+    uid = os.getuid() if uid is None else uid
+    gid = os.getgid() if gid is None else gid
+    dest_path = posixpath.normpath(dest_path)
+    strip = None
+    extracted: Dict[str, ExtractedArtifact] = {}
+    with tarfile.open(
+        fileobj=io.BufferedReader(IterableReader(chunks), ARTIFACT_COPY_BUFFER_SIZE),
+        mode="r|",
+    ) as tar:
+        for member in tar:
+            if strip is None:
+                strip = _get_root_name(member.name)
+            path = _get_member_path(member.name, strip, dest_path)
+            if path is None:
+                raise BuildRunnerProcessingError(
+                    f"Unexpected path {member.name} in the archive of {strip}"
+                )
+            local_path = os.path.join(dest_dir, path)
+            if member.isdir():
+                os.makedirs(local_path, exist_ok=True)
+                _fix_ownership(local_path, uid, gid)
+                continue
+            if not (member.isfile() or member.islnk()):
+                LOGGER.debug(f"Skipping {member.name} of type {member.type!r}")
+                continue
+
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            if os.path.islink(local_path):
+                os.remove(local_path)
+            if member.islnk():
+                target = extracted.get(posixpath.normpath(member.linkname.lstrip("/")))
+                if target is None:
+                    LOGGER.debug(f"Skipping link {member.name} to {member.linkname}")
+                    continue
+                # The copy has the same content as the file extracted earlier
+                shutil.copyfile(os.path.join(dest_dir, target.path), local_path)
+                properties = target.properties
+            else:
+                source = tar.extractfile(member)
+                with open(local_path, "wb") as file_obj:
+                    writer = HashingWriter(file_obj, checksums)
+                    shutil.copyfileobj(source, writer, ARTIFACT_COPY_BUFFER_SIZE)
+                properties = writer.get_properties()
+            os.chmod(local_path, member.mode & 0o777)
+            os.utime(local_path, (member.mtime, member.mtime))
+            _fix_ownership(local_path, uid, gid)
+            artifact = ExtractedArtifact(path, properties)
+            extracted[posixpath.normpath(member.name.lstrip("/"))] = artifact
+            yield artifact
+
+
+def _compress_gzip(block: bytes) -> bytes:
+    # A fixed mtime keeps the output identical for identical directories
+    return gzip.compress(block, compresslevel=6, mtime=0)
+
+
+def _compress_bzip2(block: bytes) -> bytes:
+    return bz2.compress(block, 9)
+
+
+def _compress_xz(block: bytes) -> bytes:
+    return lzma.compress(block, format=lzma.FORMAT_XZ)
+
+
+# The compressions (as set by the "compression" archive property) of blocks that are
+# compressed independently, each block is a complete stream and concatenated streams
+# decompress to the concatenated data
+_BLOCK_COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "gz": _compress_gzip,
+    "bz2": _compress_bzip2,
+    "xz": _compress_xz,
+}
+# The compressions of directory artifacts that can be done on the host, zstd is only
+# supported on the host and requires the optional zstandard package
+ARTIFACT_HOST_COMPRESSIONS = (*_BLOCK_COMPRESSORS, "zst")
+ARTIFACT_COMPRESSION_BLOCK_SIZE = 2**22
+
+
+class ParallelBlockWriter(io.RawIOBase):
+    """
+    A writable file object compressing blocks of the written data on a pool of
+    threads, the compressed blocks are written to the given file object in order.
+    The compression functions release the GIL, so the blocks are compressed in
+    parallel (like pigz or pbzip2).
+    """
+
+    def __init__(
+        self,
+        file_obj: io.IOBase,
+        compress: Callable[[bytes], bytes],
+        threads: int,
+        block_size: int = ARTIFACT_COMPRESSION_BLOCK_SIZE,
+    ):
+        super().__init__()
+        self._file_obj = file_obj
+        self._compress = compress
+        self._threads = threads
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self._pending: Deque[concurrent.futures.Future] = collections.deque()
+
+    def writable(self) -> bool:
+        return True
+
+    def _write_completed(self, max_pending: int) -> None:
+        while len(self._pending) > max_pending:
+            self._file_obj.write(self._pending.popleft().result())
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[: self._block_size])
+            del self._buffer[: self._block_size]
+            self._pending.append(self._executor.submit(self._compress, block))
+            # Bound the memory used by blocks waiting to be written
+            self._write_completed(self._threads * 2)
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._buffer or not self._pending:
+                self._pending.append(
+                    self._executor.submit(self._compress, bytes(self._buffer))
+                )
+                self._buffer.clear()
+            self._write_completed(0)
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            super().close()
+
+
+def open_artifact_compressor(
+    file_obj: io.IOBase, compression: str, threads: int = 0
+) -> ContextManager:
+    """
+    Returns a context manager for a writable file object compressing into the given
+    file object with the given compression and number of threads (0 uses one per
+    CPU).
+    """
+    threads = threads or os.cpu_count() or 1
+    if compression == "zst":
+        return get_codec(CACHE_CODEC_ZSTD, threads=threads).open_writer(file_obj)
+    if compression not in _BLOCK_COMPRESSORS:
+        raise BuildRunnerConfigurationError(
+            f'Compression "{compression}" is not supported on the host, must be one '
+            f"of: {', '.join(ARTIFACT_HOST_COMPRESSIONS)}"
+        )
+    return ParallelBlockWriter(file_obj, _BLOCK_COMPRESSORS[compression], threads)
+
+
+class ArchiveSummary(NamedTuple):
+    """
+    The number of entries written to an artifact archive.
+    """
+
+    files: int
+    directories: int
+    others: int
+
+
+def _get_root_name(member_name: str) -> str:
+    # The archive of a path is rooted at its base name
+    return posixpath.normpath(member_name.lstrip("/")).split("/")[0]
+
+
+def _copy_members(
+    source: tarfile.TarFile, dest: tarfile.TarFile, name: str
+) -> ArchiveSummary:
+    files = directories = others = 0
+    strip = None
+    for member in source:
+        if strip is None:
+            strip = _get_root_name(member.name)
+        path = _get_member_path(member.name, strip, name)
+        if path is None:
+            raise BuildRunnerProcessingError(
+                f"Unexpected path {member.name} in the archive of {strip}"
+            )
+        member.name = path
+        if member.islnk():
+            member.linkname = (
+                _get_member_path(member.linkname, strip, name) or member.linkname
+            )
+        if member.isfile():
+            files += 1
+            dest.addfile(member, source.extractfile(member))
+            continue
+        if member.isdir():
+            directories += 1
+        else:
+            others += 1
+        dest.addfile(member)
+    return ArchiveSummary(files, directories, others)
+
+
+def compress_artifacts(
+    chunks: Iterable[bytes],
+    file_obj: io.IOBase,
+    name: str,
+    compression: str,
+    threads: int = 0,
+) -> ArchiveSummary:
+    """
+    Write the archive of a single directory (as returned by get_archive) to the given
+    file object while it is being streamed, compressed on the host. The directory is
+    renamed to the given name in the archive, the same as the --xform of the tar
+    command used in the container.
+    """
+    reader = io.BufferedReader(IterableReader(chunks), ARTIFACT_COPY_BUFFER_SIZE)
+    with open_artifact_compressor(file_obj, compression, threads) as writer:
+        with tarfile.open(fileobj=reader, mode="r|") as source:
+            with tarfile.open(
+                fileobj=writer, mode="w|", bufsize=ARTIFACT_COPY_BUFFER_SIZE
+            ) as dest:
+                return _copy_members(source, dest, name)
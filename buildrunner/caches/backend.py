@@ -0,0 +1,557 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import concurrent.futures
+import email.utils
+import io
+import logging
+import os
+import sqlite3
+import threading
+import urllib.parse
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from buildrunner.caches.codec import (
+    ChunkedCacheCodec,
+    is_archive_file,
+    is_valid_archive,
+    strip_archive_extension,
+)
+from buildrunner.caches.index import CacheIndex
+from buildrunner.errors import BuildRunnerConfigurationError
+from buildrunner.source.archive import hold_shared_lock, release_shared_lock
+
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_BACKEND_HTTP = "http"
+CACHE_BACKEND_S3 = "s3"
+CACHE_BACKENDS = (CACHE_BACKEND_HTTP, CACHE_BACKEND_S3)
+# The HTTP status codes of a server that does not support listing objects
+_LIST_UNSUPPORTED_STATUSES = (400, 404, 405, 501)
+_DOWNLOAD_CHUNK_SIZE = 2**20
+
+_remote_caches: Dict[Tuple[str, str], "RemoteCache"] = {}
+_remote_caches_lock = threading.Lock()
+
+
+def validate_cache_backend(value: str) -> str:
+    """
+    Validate a cache backend type.
+    """
+    if value not in CACHE_BACKENDS:
+        raise ValueError(
+            f'Invalid cache backend "{value}", must be one of: {", ".join(CACHE_BACKENDS)}'
+        )
+    return value
+
+
+class RemoteCacheObject:  # pylint: disable=too-few-public-methods
+    """
+    A cache archive in a remote cache backend.
+    """
+
+    __slots__ = ("name", "size", "mtime")
+
+    def __init__(self, name: str, size: int, mtime: float):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+
+
+class CacheBackend:
+    """
+    A shared store of cache archives, keyed by the path of the archive relative to the
+    caches root.
+    """
+
+    def list(self, prefix: str) -> Optional[List[RemoteCacheObject]]:
+        """
+        Returns the objects whose name starts with the prefix, or None if the backend
+        cannot list objects.
+        """
+        raise NotImplementedError()
+
+    def stat(self, name: str) -> Optional[RemoteCacheObject]:
+        """
+        Returns the object with the given name, or None if it does not exist.
+        """
+        raise NotImplementedError()
+
+    def download(self, remote_object: RemoteCacheObject, file_obj: io.IOBase) -> None:
+        """
+        Download the object into the given file object, which must be seekable.
+        """
+        raise NotImplementedError()
+
+    def upload(self, file_obj: io.IOBase, name: str) -> Optional[float]:
+        """
+        Upload the given file object as the named object, returns the modification time
+        of the object if the backend reports it.
+        """
+        raise NotImplementedError()
+
+    def find_latest(self, prefix: str, name: str) -> Optional[RemoteCacheObject]:
+        """
+        Returns the most recently written archive starting with the prefix, or the
+        archive with the given name if the backend cannot list objects.
+        """
+        remote_objects = self.list(prefix)
+        if remote_objects is None:
+            remote_object = self.stat(name)
+            remote_objects = [remote_object] if remote_object else []
+        archives = [
+            remote_object
+            for remote_object in remote_objects
+            if is_archive_file(remote_object.name)
+            and not os.path.basename(remote_object.name).startswith(".")
+        ]
+        if not archives:
+            return None
+        return max(archives, key=lambda remote_object: remote_object.mtime)
+
+
+class HttpCacheBackend(CacheBackend):
+    """
+    Stores cache archives on a plain HTTP server, each archive is an object under the
+    base URL that is read with GET (and HEAD) and written with PUT. Large objects are
+    downloaded as parallel ranges when the server supports ranges.
+
+    Prefix matching requires the server to list the objects when the base URL is
+    requested with a ``prefix`` query parameter, as a JSON list of objects with a
+    ``name``, ``size`` and ``mtime`` (seconds since the epoch). Servers that do not
+    support listing only match the exact cache keys.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        part_size: int = 64 * 2**20,
+        concurrency: int = 8,
+        timeout: int = 60,
+    ):
+        self.url = url.rstrip("/")
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+
+    def _get_url(self, name: str) -> str:
+        return f"{self.url}/{urllib.parse.quote(name)}"
+
+    def list(self, prefix: str) -> Optional[List[RemoteCacheObject]]:
+        response = self.session.get(
+            f"{self.url}/", params={"prefix": prefix}, timeout=self.timeout
+        )
+        if response.status_code in _LIST_UNSUPPORTED_STATUSES:
+            return None
+        response.raise_for_status()
+        try:
+            return [
+                RemoteCacheObject(item["name"], int(item["size"]), float(item["mtime"]))
+                for item in response.json()
+            ]
+        except (ValueError, TypeError, KeyError):
+            # Not a listing, e.g. an index page
+            return None
+
+    def stat(self, name: str) -> Optional[RemoteCacheObject]:
+        response = self.session.head(self._get_url(name), timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        last_modified = response.headers.get("Last-Modified")
+        return RemoteCacheObject(
+            name,
+            int(response.headers.get("Content-Length", 0)),
+            email.utils.parsedate_to_datetime(last_modified).timestamp()
+            if last_modified
+            else 0,
+        )
+
+    def _download_range(self, name: str, fileno: int, start: int, end: int) -> None:
+        response = self.session.get(
+            self._get_url(name),
+            headers={"Range": f"bytes={start}-{end}"},
+            stream=True,
+            timeout=self.timeout,
+        )
+        with response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise IOError(f"Range requests are not supported for {name}")
+            offset = start
+            for chunk in response.iter_content(_DOWNLOAD_CHUNK_SIZE):
+                os.pwrite(fileno, chunk, offset)
+                offset += len(chunk)
+        if offset != end + 1:
+            raise IOError(f"Incomplete range {start}-{end} of {name}")
+
+    def download(self, remote_object: RemoteCacheObject, file_obj: io.IOBase) -> None:
+        if remote_object.size > self.part_size and self.concurrency > 1:
+            try:
+                self._download_parts(remote_object, file_obj)
+                return
+            except IOError as exc:
+                LOGGER.debug(f"Downloading {remote_object.name} in one part: {exc}")
+                file_obj.seek(0)
+                file_obj.truncate()
+        response = self.session.get(
+            self._get_url(remote_object.name), stream=True, timeout=self.timeout
+        )
+        with response:
+            response.raise_for_status()
+            for chunk in response.iter_content(_DOWNLOAD_CHUNK_SIZE):
+                file_obj.write(chunk)
+
+    def _download_parts(
+        self, remote_object: RemoteCacheObject, file_obj: io.IOBase
+    ) -> None:
+        file_obj.flush()
+        fileno = file_obj.fileno()
+        os.ftruncate(fileno, remote_object.size)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="buildrunner-cache-get"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self._download_range,
+                    remote_object.name,
+                    fileno,
+                    start,
+                    min(start + self.part_size, remote_object.size) - 1,
+                )
+                for start in range(0, remote_object.size, self.part_size)
+            ]
+        for future in futures:
+            future.result()
+        file_obj.seek(remote_object.size)
+
+    def upload(self, file_obj: io.IOBase, name: str) -> Optional[float]:
+        response = self.session.put(
+            self._get_url(name), data=file_obj, timeout=self.timeout
+        )
+        response.raise_for_status()
+        last_modified = response.headers.get("Last-Modified")
+        if last_modified:
+            return email.utils.parsedate_to_datetime(last_modified).timestamp()
+        remote_object = self.stat(name)
+        return remote_object.mtime if remote_object else None
+
+
+class S3CacheBackend(CacheBackend):
+    """
+    Stores cache archives in an S3 compatible object store, which requires the optional
+    boto3 package. Objects are uploaded and downloaded in parallel parts.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        part_size: int = 64 * 2**20,
+        concurrency: int = 8,
+        client=None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.concurrency = concurrency
+        self.client = client or self._get_module().client(
+            "s3", endpoint_url=endpoint_url, region_name=region
+        )
+
+    @staticmethod
+    def _get_module():
+        try:
+            import boto3  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise BuildRunnerConfigurationError(
+                'The "s3" cache backend requires the boto3 package, '
+                "install it with: pip install 'buildrunner[s3]'"
+            ) from exc
+        return boto3
+
+    def _get_transfer_config(self):
+        # pylint: disable=import-outside-toplevel
+        from boto3.s3.transfer import TransferConfig
+
+        return TransferConfig(
+            multipart_threshold=self.part_size,
+            multipart_chunksize=self.part_size,
+            max_concurrency=self.concurrency,
+        )
+
+    def list(self, prefix: str) -> Optional[List[RemoteCacheObject]]:
+        remote_objects = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for item in page.get("Contents", []):
+                remote_objects.append(
+                    RemoteCacheObject(
+                        item["Key"][len(self.prefix) :],
+                        item["Size"],
+                        item["LastModified"].timestamp(),
+                    )
+                )
+        return remote_objects
+
+    def stat(self, name: str) -> Optional[RemoteCacheObject]:
+        try:
+            response = self.client.head_object(
+                Bucket=self.bucket, Key=self.prefix + name
+            )
+        except self.client.exceptions.ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise
+        return RemoteCacheObject(
+            name, response["ContentLength"], response["LastModified"].timestamp()
+        )
+
+    def download(self, remote_object: RemoteCacheObject, file_obj: io.IOBase) -> None:
+        self.client.download_fileobj(
+            self.bucket,
+            self.prefix + remote_object.name,
+            file_obj,
+            Config=self._get_transfer_config(),
+        )
+
+    def upload(self, file_obj: io.IOBase, name: str) -> Optional[float]:
+        self.client.upload_fileobj(
+            file_obj,
+            self.bucket,
+            self.prefix + name,
+            Config=self._get_transfer_config(),
+        )
+        remote_object = self.stat(name)
+        return remote_object.mtime if remote_object else None
+
+
+class RemoteCache:
+    """
+    Shares the cache archives of the caches root through a cache backend. The caches
+    root is a read-through tier: archives are downloaded into it when the remote
+    archive matching a cache key is newer than the local one, and are restored from
+    there as usual. Saved archives are uploaded in the background (write-behind), and
+    wait() waits for the pending uploads before the build ends.
+
+    Chunked archives are only manifests of the local chunk store and are never
+    uploaded.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        caches_root: str,
+        write_behind: bool = True,
+    ):
+        self.backend = backend
+        self.caches_root = os.path.expanduser(caches_root)
+        self.write_behind = write_behind
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="buildrunner-cache-put"
+        )
+        self._pending: List[concurrent.futures.Future] = []
+        self._lock = threading.Lock()
+
+    def _get_name(self, local_cache_archive_file: str) -> Optional[str]:
+        name = os.path.relpath(local_cache_archive_file, self.caches_root)
+        if name.startswith(os.pardir) or name.endswith(
+            f".{ChunkedCacheCodec.extension}"
+        ):
+            return None
+        return name.replace(os.sep, "/")
+
+    def _get_archive_file(self, name: str, prefix: str) -> Optional[str]:
+        """
+        Returns the local archive file of a remote archive name, or None if the name
+        does not start with the requested prefix or would resolve outside of the
+        caches root (e.g. with ".." or absolute components).
+        """
+        parts = name.split("/")
+        if not name.startswith(prefix) or any(
+            part in ("", os.curdir, os.pardir)
+            or os.sep in part
+            or (os.altsep and os.altsep in part)
+            for part in parts
+        ):
+            return None
+        archive_file = os.path.join(self.caches_root, *parts)
+        caches_root = os.path.realpath(self.caches_root)
+        if (
+            os.path.commonpath([caches_root, os.path.realpath(archive_file)])
+            != caches_root
+        ):
+            return None
+        return archive_file
+
+    def fetch(
+        self, logger, local_cache_archive_file: str, local_match: Optional[str]
+    ) -> Optional[str]:
+        """
+        Download the remote archive matching the cache key if there is no local match
+        or the remote archive is newer, returns the archive to restore.
+        """
+        name = self._get_name(local_cache_archive_file)
+        if not name:
+            return local_match
+        prefix = strip_archive_extension(name)
+        try:
+            remote_object = self.backend.find_latest(prefix, name)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(f"Unable to look up remote cache {name}: {exc}")
+            return local_match
+        if (
+            not remote_object
+            or remote_object.name.endswith(f".{ChunkedCacheCodec.extension}")
+            or (local_match and os.path.getmtime(local_match) >= remote_object.mtime)
+        ):
+            return local_match
+
+        archive_file = self._get_archive_file(remote_object.name, prefix)
+        if not archive_file:
+            logger.warning(
+                f"Ignoring remote cache {remote_object.name!r}, which does not match "
+                f"{name} or is outside of the caches root"
+            )
+            return local_match
+        cache_dir, file_name = os.path.split(archive_file)
+        tmp_file_name = os.path.join(
+            cache_dir, f".{file_name}.{uuid.uuid4().hex[:12]}.tmp"
+        )
+        logger.info(
+            f"Downloading remote cache {remote_object.name} "
+            f"({remote_object.size} bytes) to {archive_file}"
+        )
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(tmp_file_name, "xb") as file_obj:
+                self.backend.download(remote_object, file_obj)
+            if not is_valid_archive(tmp_file_name):
+                raise IOError(f"{remote_object.name} is not a valid cache archive")
+            # Keep the remote modification time so that the archive is not downloaded
+            # again and compares correctly with local archives
+            os.utime(tmp_file_name, (remote_object.mtime, remote_object.mtime))
+            os.replace(tmp_file_name, archive_file)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(
+                f"Unable to download remote cache {remote_object.name}: {exc}"
+            )
+            return local_match
+        finally:
+            if os.path.exists(tmp_file_name):
+                os.remove(tmp_file_name)
+        try:
+            CacheIndex(cache_dir).add(archive_file)
+        except sqlite3.Error as exc:
+            logger.warning(f"Unable to update the cache index: {exc}")
+        return archive_file
+
+    def _upload(self, logger, local_cache_archive_file: str, name: str) -> None:
+        # The shared lock keeps the archive from being evicted while it is uploaded,
+        # an archive replaced in the meantime is uploaded by the save replacing it
+        lock_file_obj = hold_shared_lock(local_cache_archive_file)
+        if lock_file_obj is None:
+            logger.info(f"Cache {local_cache_archive_file} was removed before upload")
+            return
+        try:
+            inode = os.fstat(lock_file_obj.fileno()).st_ino
+            mtime = self.backend.upload(lock_file_obj, name)
+            if mtime and os.stat(local_cache_archive_file).st_ino == inode:
+                # The local archive is as new as the uploaded one
+                os.utime(local_cache_archive_file, (mtime, mtime))
+            logger.info(f"Uploaded cache {local_cache_archive_file} as {name}")
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(f"Unable to upload cache {name}: {exc}")
+        finally:
+            release_shared_lock(lock_file_obj)
+
+    def publish(self, logger, local_cache_archive_file: str) -> None:
+        """
+        Upload the saved cache archive, in the background unless write-behind is
+        disabled.
+        """
+        name = self._get_name(local_cache_archive_file)
+        if not name:
+            return
+        if not self.write_behind:
+            self._upload(logger, local_cache_archive_file, name)
+            return
+        with self._lock:
+            self._pending.append(
+                self._executor.submit(
+                    self._upload, logger, local_cache_archive_file, name
+                )
+            )
+
+    def wait(self) -> None:
+        """
+        Wait for the pending uploads to finish.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if pending:
+            LOGGER.info(f"Waiting for {len(pending)} cache upload(s) to finish")
+            concurrent.futures.wait(pending)
+
+
+def create_cache_backend(backend_config) -> CacheBackend:
+    """
+    Create the cache backend for the backend global configuration.
+    """
+    if backend_config.type == CACHE_BACKEND_S3:
+        return S3CacheBackend(
+            backend_config.bucket,
+            prefix=backend_config.prefix,
+            endpoint_url=backend_config.url,
+            region=backend_config.region,
+            part_size=backend_config.part_size,
+            concurrency=backend_config.concurrency,
+        )
+    return HttpCacheBackend(
+        backend_config.url,
+        headers=backend_config.headers,
+        part_size=backend_config.part_size,
+        concurrency=backend_config.concurrency,
+    )
+
+
+def get_remote_cache(caches_root: str, backend_config) -> Optional[RemoteCache]:
+    """
+    Returns the remote cache for the caches root and backend global configuration,
+    shared by all steps of the process, or None if no backend is configured.
+    """
+    if backend_config is None:
+        return None
+    key = (caches_root, backend_config.model_dump_json())
+    with _remote_caches_lock:
+        if key not in _remote_caches:
+            _remote_caches[key] = RemoteCache(
+                create_cache_backend(backend_config),
+                caches_root,
+                write_behind=backend_config.write_behind,
+            )
+        return _remote_caches[key]
+
+
+def wait_for_remote_caches() -> None:
+    """
+    Wait for the pending uploads of all remote caches.
+    """
+    with _remote_caches_lock:
+        remote_caches = list(_remote_caches.values())
+    for remote_cache in remote_caches:
+        remote_cache.wait()
@@ -0,0 +1,306 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+import zlib
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from buildrunner.utils import IterableReader
+
+
+LOGGER = logging.getLogger(__name__)
+
+# The chunk store of the cache manifests in a cache directory, kept in that directory
+CHUNK_DIR = ".chunks"
+CHUNK_MANIFEST_VERSION = 1
+# Chunk boundaries are only placed between tar blocks. Files in a tar stream always
+# start on a block boundary, so adding or removing a file shifts the following
+# content by whole blocks and the chunking resynchronizes right after the change.
+CHUNK_BLOCK_SIZE = 512
+CHUNK_MIN_SIZE = 2**18
+CHUNK_AVERAGE_SIZE = 2**20
+CHUNK_MAX_SIZE = 2**23
+# A block ends a chunk when the low bits of its checksum are all set
+_CHUNK_MASK = CHUNK_AVERAGE_SIZE // CHUNK_BLOCK_SIZE - 1
+# Unreferenced chunks (and temporary chunk files) are kept for this long since they
+# may belong to a cache that is still being saved
+CHUNK_RETENTION_SECONDS = 24 * 3600
+
+
+def get_chunk_dir(cache_dir: str) -> str:
+    """
+    Returns the chunk store directory of the given cache directory.
+    """
+    return os.path.join(cache_dir, CHUNK_DIR)
+
+
+def _get_chunk_file(chunk_dir: str, digest: str) -> str:
+    return os.path.join(chunk_dir, digest[:2], digest)
+
+
+def _find_boundary(data: memoryview, start: int) -> int:
+    """
+    Returns the end of the chunk starting at the beginning of the data, or -1 if the
+    data does not contain a complete chunk. Blocks before the start offset have
+    already been checked.
+    """
+    offset = max(start, CHUNK_MIN_SIZE - CHUNK_BLOCK_SIZE)
+    end = min(len(data), CHUNK_MAX_SIZE)
+    while offset + CHUNK_BLOCK_SIZE <= end:
+        block_end = offset + CHUNK_BLOCK_SIZE
+        if zlib.crc32(data[offset:block_end]) & _CHUNK_MASK == _CHUNK_MASK:
+            return block_end
+        offset = block_end
+    if len(data) >= CHUNK_MAX_SIZE:
+        return CHUNK_MAX_SIZE
+    return -1
+
+
+def store_chunk(chunk_dir: str, data: bytes) -> str:
+    """
+    Store the chunk if it is not stored yet and return its digest. The modification
+    time of a chunk that is already stored is updated so that it is not garbage
+    collected before the manifest referencing it is published.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    chunk_file = _get_chunk_file(chunk_dir, digest)
+    try:
+        os.utime(chunk_file)
+        return digest
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+    tmp_file = os.path.join(
+        os.path.dirname(chunk_file),
+        f".{digest}.{uuid.uuid4().hex[:12]}.tmp",
+    )
+    try:
+        with open(tmp_file, "xb") as file_obj:
+            file_obj.write(data)
+        os.replace(tmp_file, chunk_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return digest
+
+
+def copy_chunks(manifest_file: str, cache_dir: str) -> None:
+    """
+    Add the chunks of the given manifest to the chunk store of another cache
+    directory, so that the manifest can be linked into that directory. Chunks are hard
+    linked when the chunk stores are on the same file system and copied otherwise.
+    """
+    source_chunk_dir = get_chunk_dir(os.path.dirname(os.path.abspath(manifest_file)))
+    chunk_dir = get_chunk_dir(cache_dir)
+    with open(manifest_file, "rb") as file_obj:
+        chunks = read_manifest(file_obj)
+    for digest, _ in chunks:
+        chunk_file = _get_chunk_file(chunk_dir, digest)
+        try:
+            # Keep chunks that are already stored from being garbage collected
+            os.utime(chunk_file)
+            continue
+        except FileNotFoundError:
+            pass
+        source_chunk_file = _get_chunk_file(source_chunk_dir, digest)
+        os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
+        tmp_file = os.path.join(
+            os.path.dirname(chunk_file),
+            f".{digest}.{uuid.uuid4().hex[:12]}.tmp",
+        )
+        try:
+            try:
+                os.link(source_chunk_file, tmp_file)
+            except OSError:
+                shutil.copyfile(source_chunk_file, tmp_file)
+            # The chunk is new to this store, it must outlive the garbage collection
+            # retention until the manifest is linked
+            os.utime(tmp_file)
+            os.replace(tmp_file, chunk_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+
+class ChunkWriter(io.RawIOBase):
+    """
+    A writable file object that splits the tar stream written to it into content
+    defined chunks, stores each chunk once in the chunk store and writes the manifest
+    listing the chunks to the given file object when it is closed.
+    """
+
+    def __init__(self, file_obj: io.IOBase, chunk_dir: str):
+        super().__init__()
+        self._file_obj = file_obj
+        self._chunk_dir = chunk_dir
+        self._buffer = bytearray()
+        # The part of the buffer that has already been checked for a chunk boundary
+        self._scanned = 0
+        self._size = 0
+        self.chunks: List[Tuple[str, int]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def _store(self, length: int) -> None:
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        self.chunks.append((store_chunk(self._chunk_dir, data), length))
+        self._size += length
+
+    def write(self, data) -> int:
+        self._buffer.extend(data)
+        while True:
+            with memoryview(self._buffer) as view:
+                boundary = _find_boundary(view, self._scanned)
+            if boundary < 0:
+                self._scanned = len(self._buffer) - len(self._buffer) % CHUNK_BLOCK_SIZE
+                return len(data)
+            self._store(boundary)
+            self._scanned = 0
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            # The manifest is only written for a complete stream
+            if exc_type is None:
+                self.finish()
+        finally:
+            self.close()
+
+    def finish(self) -> None:
+        """
+        Store the last chunk and write the manifest.
+        """
+        if self._buffer:
+            self._store(len(self._buffer))
+        self._file_obj.write(
+            json.dumps(
+                {
+                    "version": CHUNK_MANIFEST_VERSION,
+                    "size": self._size,
+                    "chunks": self.chunks,
+                },
+                separators=(",", ":"),
+            ).encode("utf-8")
+        )
+
+
+def read_manifest(file_obj: io.IOBase) -> List[Tuple[str, int]]:
+    """
+    Returns the digests and sizes of the chunks listed in a cache manifest.
+    """
+    try:
+        manifest = json.loads(file_obj.read())
+    except ValueError as exc:
+        raise ValueError(f"Invalid cache manifest: {exc}") from exc
+    if not isinstance(manifest, dict) or (
+        manifest.get("version") != CHUNK_MANIFEST_VERSION
+    ):
+        raise ValueError("Unsupported cache manifest version")
+    return [(digest, size) for digest, size in manifest["chunks"]]
+
+
+def iter_chunks(chunk_dir: str, chunks: Iterable[Tuple[str, int]]) -> Iterator[bytes]:
+    """
+    Returns a generator of the data of the given chunks, raises FileNotFoundError if a
+    chunk has been garbage collected.
+    """
+    for digest, size in chunks:
+        with open(_get_chunk_file(chunk_dir, digest), "rb") as chunk_file:
+            data = chunk_file.read()
+        if len(data) != size:
+            raise ValueError(f"Chunk {digest} is {len(data)} bytes instead of {size}")
+        yield data
+
+
+class ChunkReader(IterableReader):
+    """
+    A readable file object reassembling the tar stream of a cache manifest.
+    """
+
+    def __init__(self, file_obj: io.IOBase, chunk_dir: str):
+        super().__init__(iter_chunks(chunk_dir, read_manifest(file_obj)))
+
+
+def get_shared_sizes(manifest_files: Iterable[str]) -> Dict[str, int]:
+    """
+    Returns the size of the chunks referenced by each of the given manifests, where
+    the size of a chunk referenced by several manifests of the same chunk store is
+    split between them. The sizes add up to the size of the referenced chunks.
+    """
+    references: Dict[Tuple[str, str], int] = {}
+    manifests: Dict[str, List[Tuple[str, int]]] = {}
+    for manifest_file in manifest_files:
+        try:
+            with open(manifest_file, "rb") as file_obj:
+                chunks = read_manifest(file_obj)
+        except (OSError, ValueError) as exc:
+            LOGGER.debug(f"Unable to read cache manifest {manifest_file}: {exc}")
+            continue
+        chunk_dir = get_chunk_dir(os.path.dirname(manifest_file))
+        manifests[manifest_file] = chunks
+        for digest in {digest for digest, _ in chunks}:
+            references[(chunk_dir, digest)] = references.get((chunk_dir, digest), 0) + 1
+    sizes = {}
+    for manifest_file, chunks in manifests.items():
+        chunk_dir = get_chunk_dir(os.path.dirname(manifest_file))
+        sizes[manifest_file] = int(
+            sum(
+                size / references[(chunk_dir, digest)]
+                for digest, size in dict(chunks).items()
+            )
+        )
+    return sizes
+
+
+def collect_garbage(cache_dir: str, manifest_files: Iterable[str]) -> Tuple[int, int]:
+    """
+    Remove the chunks of the cache directory's chunk store that are not referenced by
+    any of the given manifests, which must be all the manifests in the directory.
+    Recently written chunks are kept since they may belong to a manifest that is
+    still being written. Returns the number of removed chunks and their size.
+    """
+    chunk_dir = get_chunk_dir(cache_dir)
+    referenced: Set[str] = set()
+    for manifest_file in manifest_files:
+        try:
+            with open(manifest_file, "rb") as file_obj:
+                referenced.update(digest for digest, _ in read_manifest(file_obj))
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError) as exc:
+            LOGGER.debug(f"Unable to read cache manifest {manifest_file}: {exc}")
+    removed = 0
+    freed = 0
+    for dir_path, _, file_names in os.walk(chunk_dir):
+        for file_name in file_names:
+            if file_name in referenced:
+                continue
+            path = os.path.join(dir_path, file_name)
+            try:
+                stat_result = os.stat(path)
+                if time.time() - stat_result.st_mtime < CHUNK_RETENTION_SECONDS:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat_result.st_size
+    if removed:
+        LOGGER.info(
+            f"Removed {removed} unreferenced cache chunk(s) from {chunk_dir} "
+            f"freeing {freed} bytes"
+        )
+    return removed, freed
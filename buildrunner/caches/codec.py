@@ -0,0 +1,247 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import contextlib
+import gzip
+import io
+import logging
+import os
+import tarfile
+from typing import ContextManager, Iterator, Optional
+
+from buildrunner.caches.chunks import (
+    ChunkReader,
+    ChunkWriter,
+    get_chunk_dir,
+    iter_chunks,
+    read_manifest,
+)
+from buildrunner.errors import BuildRunnerConfigurationError
+
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_CODEC_NONE = "none"
+CACHE_CODEC_GZIP = "gzip"
+CACHE_CODEC_ZSTD = "zstd"
+CACHE_CODEC_CHUNKED = "chunked"
+CACHE_CODECS = (
+    CACHE_CODEC_NONE,
+    CACHE_CODEC_GZIP,
+    CACHE_CODEC_ZSTD,
+    CACHE_CODEC_CHUNKED,
+)
+CACHE_CHUNK_SIZE = 2**20
+
+
+class CacheCodec:
+    """
+    Compresses cache archives while they are streamed out of a container and
+    decompresses them while they are streamed back in. The codec is recorded in the
+    archive file extension so that archives written with a different codec (including
+    uncompressed archives from older versions) can still be restored.
+    """
+
+    name = CACHE_CODEC_NONE
+    extension = "tar"
+
+    def __init__(self, level: Optional[int] = None, threads: Optional[int] = None):
+        self.level = level
+        self.threads = threads
+
+    def open_writer(self, file_obj: io.IOBase) -> ContextManager:
+        """
+        Returns a context manager for a writable file object that compresses into the
+        given file object, the given file object is left open.
+        """
+        return contextlib.nullcontext(file_obj)
+
+    def open_reader(self, file_obj: io.IOBase) -> ContextManager:
+        """
+        Returns a context manager for a readable file object that decompresses from the
+        given file object, the given file object is left open.
+        """
+        return contextlib.nullcontext(file_obj)
+
+    def get_put_archive_data(self, file_obj: io.IOBase) -> Iterator[bytes]:
+        """
+        Returns a generator of the uncompressed tar data chunks for the docker
+        put_archive call.
+        """
+        with self.open_reader(file_obj) as reader:
+            while True:
+                chunk = reader.read(CACHE_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class GzipCacheCodec(CacheCodec):
+    """
+    Compresses cache archives with gzip.
+    """
+
+    name = CACHE_CODEC_GZIP
+    extension = "tar.gz"
+    default_level = 6
+
+    def open_writer(self, file_obj: io.IOBase) -> ContextManager:
+        # A fixed mtime keeps the output identical for identical archives
+        return gzip.GzipFile(
+            fileobj=file_obj,
+            mode="wb",
+            compresslevel=self.default_level if self.level is None else self.level,
+            mtime=0,
+        )
+
+    def open_reader(self, file_obj: io.IOBase) -> ContextManager:
+        return gzip.GzipFile(fileobj=file_obj, mode="rb")
+
+
+class ZstdCacheCodec(CacheCodec):
+    """
+    Compresses cache archives with zstandard, which requires the optional zstandard
+    package.
+    """
+
+    name = CACHE_CODEC_ZSTD
+    extension = "tar.zst"
+    default_level = 3
+
+    @staticmethod
+    def _get_module():
+        try:
+            import zstandard  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise BuildRunnerConfigurationError(
+                'The "zstd" cache codec requires the zstandard package, '
+                "install it with: pip install 'buildrunner[zstd]'"
+            ) from exc
+        return zstandard
+
+    def open_writer(self, file_obj: io.IOBase) -> ContextManager:
+        zstandard = self._get_module()
+        compressor = zstandard.ZstdCompressor(
+            level=self.default_level if self.level is None else self.level,
+            threads=self.threads or 0,
+        )
+        return compressor.stream_writer(file_obj, closefd=False)
+
+    def open_reader(self, file_obj: io.IOBase) -> ContextManager:
+        zstandard = self._get_module()
+        return zstandard.ZstdDecompressor().stream_reader(file_obj, closefd=False)
+
+    def get_put_archive_data(self, file_obj: io.IOBase) -> Iterator[bytes]:
+        # Resolve the module before streaming so that a missing package is reported
+        # before the docker call is made
+        self._get_module()
+        return super().get_put_archive_data(file_obj)
+
+
+class ChunkedCacheCodec(CacheCodec):
+    """
+    Splits cache archives into content defined chunks kept in a chunk store next to
+    the archive (see buildrunner.caches.chunks), the archive file itself is only a
+    manifest of its chunks. Chunks shared with earlier saves or with other caches in
+    the same directory are stored once, so saving a cache that changed a little only
+    writes the changed chunks. The chunks are not compressed.
+    """
+
+    name = CACHE_CODEC_CHUNKED
+    extension = "tar.chunks"
+
+    @staticmethod
+    def _get_chunk_dir(file_obj: io.IOBase) -> str:
+        # The chunk store is found from the manifest file being written or read
+        return get_chunk_dir(os.path.dirname(os.path.abspath(file_obj.name)))
+
+    def open_writer(self, file_obj: io.IOBase) -> ContextManager:
+        return ChunkWriter(file_obj, self._get_chunk_dir(file_obj))
+
+    def open_reader(self, file_obj: io.IOBase) -> ContextManager:
+        return ChunkReader(file_obj, self._get_chunk_dir(file_obj))
+
+    def get_put_archive_data(self, file_obj: io.IOBase) -> Iterator[bytes]:
+        # The manifest is read before streaming so that an invalid manifest is reported
+        # before the docker call is made, the chunks are passed on as they are
+        return iter_chunks(self._get_chunk_dir(file_obj), read_manifest(file_obj))
+
+
+_CODEC_CLASSES = {
+    codec_class.name: codec_class
+    for codec_class in (CacheCodec, GzipCacheCodec, ZstdCacheCodec, ChunkedCacheCodec)
+}
+# Longest extensions first so that "tar.gz" is not mistaken for "tar"
+_EXTENSIONS = sorted(
+    ((codec_class.extension, codec_class) for codec_class in _CODEC_CLASSES.values()),
+    key=lambda item: len(item[0]),
+    reverse=True,
+)
+
+
+def get_codec(
+    name: str, level: Optional[int] = None, threads: Optional[int] = None
+) -> CacheCodec:
+    """
+    Returns the codec with the given name.
+    """
+    if name not in _CODEC_CLASSES:
+        raise BuildRunnerConfigurationError(
+            f'Invalid cache codec "{name}", must be one of: {", ".join(CACHE_CODECS)}'
+        )
+    return _CODEC_CLASSES[name](level=level, threads=threads)
+
+
+def get_codec_for_path(
+    file_name: str, level: Optional[int] = None, threads: Optional[int] = None
+) -> CacheCodec:
+    """
+    Returns the codec for the given archive file based on its extension, files
+    without a known extension are treated as uncompressed.
+    """
+    for extension, codec_class in _EXTENSIONS:
+        if file_name.endswith(f".{extension}"):
+            return codec_class(level=level, threads=threads)
+    return CacheCodec(level=level, threads=threads)
+
+
+def is_archive_file(file_name: str) -> bool:
+    """
+    Returns true if the given file name has a cache archive extension.
+    """
+    return any(file_name.endswith(f".{extension}") for extension, _ in _EXTENSIONS)
+
+
+def strip_archive_extension(file_name: str) -> str:
+    """
+    Returns the given file name without its cache archive extension.
+    """
+    for extension, _ in _EXTENSIONS:
+        if file_name.endswith(f".{extension}"):
+            return file_name[: -len(extension) - 1]
+    return file_name
+
+
+def is_valid_archive(file_name: str, codec: Optional[CacheCodec] = None) -> bool:
+    """
+    Returns true if the given file contains a tar archive compressed with the given
+    codec, or with the codec matching its extension if no codec is given.
+    """
+    if codec is None:
+        codec = get_codec_for_path(file_name)
+    try:
+        with open(file_name, "rb") as file_obj, codec.open_reader(file_obj) as reader:
+            with tarfile.open(fileobj=reader, mode="r|") as tar:
+                tar.next()
+        return True
+    except BuildRunnerConfigurationError:
+        raise
+    except Exception as exc:  # pylint: disable=broad-except
+        # The compression libraries raise their own exception types for corrupt data
+        LOGGER.debug(f"{file_name} is not a valid cache archive: {exc}")
+        return False
@@ -0,0 +1,339 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import portalocker
+
+from buildrunner.caches.chunks import CHUNK_DIR, collect_garbage, get_shared_sizes
+from buildrunner.caches.codec import ChunkedCacheCodec, is_archive_file
+from buildrunner.caches.index import CacheIndex
+from buildrunner.source.archive import SOURCE_ARCHIVE_DIR, remove_if_unused
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Suffix of the temporary files caches are written to before they are published
+CACHE_TEMP_SUFFIX = ".tmp"
+# Temporary files older than this were left behind by a save that did not finish
+CACHE_TEMP_RETENTION_SECONDS = 24 * 3600
+# Records the project that last saved each cache archive, relative to the caches root
+CACHE_USAGE_FILE = ".cache-usage.json"
+# Held while evicting so that only one process evicts at a time
+CACHE_EVICTION_LOCK_FILE = ".cache-eviction.lock"
+
+_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 2**10, "m": 2**20, "g": 2**30, "t": 2**40}
+
+
+def parse_size(value: Union[int, str, None]) -> Optional[int]:
+    """
+    Parse a size in bytes, given as an integer or as a string with an optional binary
+    unit suffix (e.g. "500M", "20G" or "1.5TiB").
+    """
+    if value is None or isinstance(value, int):
+        return value
+    match = _SIZE_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(
+            f'Invalid size "{value}", must be a number of bytes or e.g. 20G'
+        )
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).lower()])
+
+
+def mark_cache_used(archive_file: str) -> None:
+    """
+    Record that the cache archive was restored by setting its access time, the
+    modification time (which is used for prefix matching) is left unchanged. The
+    access time is set explicitly so that it does not depend on the mount options.
+    """
+    try:
+        os.utime(archive_file, (time.time(), os.stat(archive_file).st_mtime))
+    except OSError as exc:
+        # The archive may be owned by another user or removed in the meantime
+        LOGGER.debug(f"Unable to mark cache {archive_file} as used: {exc}")
+
+
+def _update_usage(caches_root: str, updates: Dict[str, Optional[str]]) -> None:
+    """
+    Update the projects recorded in the usage file, a value of None removes the entry.
+    """
+    usage_file = os.path.join(caches_root, CACHE_USAGE_FILE)
+    with open(usage_file, "a+", encoding="utf-8") as fobj:
+        portalocker.lock(fobj, portalocker.LockFlags.EXCLUSIVE)
+        try:
+            fobj.seek(0)
+            try:
+                usage = json.loads(fobj.read() or "{}")
+            except ValueError:
+                LOGGER.debug(f"Ignoring invalid cache usage file {usage_file}")
+                usage = {}
+            for archive, project in updates.items():
+                if project is None:
+                    usage.pop(archive, None)
+                else:
+                    usage[archive] = project
+            fobj.seek(0)
+            fobj.truncate()
+            json.dump(usage, fobj, separators=(",", ":"))
+        finally:
+            portalocker.unlock(fobj)
+
+
+def record_cache_project(caches_root: str, archive_file: str, project: str) -> None:
+    """
+    Record the project that saved the cache archive, used by the per-project quota.
+    """
+    caches_root = os.path.expanduser(caches_root)
+    archive = os.path.relpath(archive_file, caches_root)
+    if archive.startswith(os.pardir):
+        return
+    try:
+        _update_usage(caches_root, {archive: project})
+    except OSError as exc:
+        LOGGER.debug(f"Unable to record the project for cache {archive_file}: {exc}")
+
+
+class CacheArchive:  # pylint: disable=too-few-public-methods
+    """
+    A cache archive in the caches root.
+    """
+
+    __slots__ = ("path", "archive", "size", "last_used", "project")
+
+    def __init__(
+        self,
+        path: str,
+        archive: str,
+        size: int,
+        last_used: float,
+        project: Optional[str],
+    ):
+        self.path = path
+        self.archive = archive
+        self.size = size
+        self.last_used = last_used
+        self.project = project
+
+
+class CacheEvictor:
+    """
+    Removes the least recently used cache archives until the caches root is within the
+    configured quotas, and garbage collects the chunks no longer referenced by any
+    chunked archive.
+
+    An archive is last used when it was last saved or restored, whichever is later. The
+    per-project quota applies to the archives each project saved last, and the global
+    quota to all archives. Archives that are being restored hold a shared lock and are
+    skipped, the same as source archives (see remove_if_unused).
+    """
+
+    def __init__(
+        self,
+        caches_root: str,
+        max_size: Optional[int] = None,
+        max_project_size: Optional[int] = None,
+    ):
+        self.caches_root = os.path.expanduser(caches_root)
+        self.max_size = max_size
+        self.max_project_size = max_project_size
+        # The cache directories with a chunk store, found by the last scan
+        self.chunk_dirs: List[str] = []
+
+    def _load_usage(self) -> Dict[str, str]:
+        usage_file = os.path.join(self.caches_root, CACHE_USAGE_FILE)
+        try:
+            with open(usage_file, "r", encoding="utf-8") as fobj:
+                portalocker.lock(fobj, portalocker.LockFlags.SHARED)
+                try:
+                    return json.loads(fobj.read() or "{}")
+                finally:
+                    portalocker.unlock(fobj)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOGGER.debug(f"Ignoring invalid cache usage file {usage_file}")
+            return {}
+
+    def _walk(self) -> Iterator[Tuple[str, bool, List[str]]]:
+        """
+        Yields the path of each cache directory, whether it has a chunk store and the
+        names of its files.
+        """
+        for dir_path, dir_names, file_names in os.walk(self.caches_root):
+            if dir_path == self.caches_root and SOURCE_ARCHIVE_DIR in dir_names:
+                # Source archives are pruned by the source archiver
+                dir_names.remove(SOURCE_ARCHIVE_DIR)
+            has_chunk_dir = CHUNK_DIR in dir_names
+            if has_chunk_dir:
+                # Chunks are garbage collected once their manifests are evicted
+                dir_names.remove(CHUNK_DIR)
+            yield dir_path, has_chunk_dir, file_names
+
+    def scan(self) -> List[CacheArchive]:
+        """
+        Returns the cache archives in the caches root, removing temporary files left
+        behind by saves that did not finish.
+        """
+        usage = self._load_usage()
+        archives = []
+        # Archives saved to several cache keys are hard links of the same file
+        links: Dict[tuple, List[CacheArchive]] = {}
+        self.chunk_dirs = []
+        for dir_path, has_chunk_dir, file_names in self._walk():
+            if has_chunk_dir:
+                self.chunk_dirs.append(dir_path)
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                if file_name.startswith(".") and file_name.endswith(CACHE_TEMP_SUFFIX):
+                    if remove_if_unused(path, CACHE_TEMP_RETENTION_SECONDS):
+                        LOGGER.info(f"Removed incomplete cache {path}")
+                    continue
+                if file_name.startswith(".") or not is_archive_file(file_name):
+                    continue
+                try:
+                    stat_result = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                archive = os.path.relpath(path, self.caches_root)
+                archives.append(
+                    CacheArchive(
+                        path,
+                        archive,
+                        stat_result.st_size,
+                        max(stat_result.st_atime, stat_result.st_mtime),
+                        usage.get(archive),
+                    )
+                )
+                links.setdefault((stat_result.st_dev, stat_result.st_ino), []).append(
+                    archives[-1]
+                )
+        # The size of a file linked by several archives is split between them, so the
+        # sizes add up to the disk usage
+        for linked in links.values():
+            for archive in linked:
+                archive.size //= len(linked)
+        # Chunked archives are manifests, they are sized by the chunks they reference
+        shared_sizes = get_shared_sizes(
+            archive.path
+            for archive in archives
+            if archive.path.endswith(f".{ChunkedCacheCodec.extension}")
+        )
+        for archive in archives:
+            if archive.path in shared_sizes:
+                archive.size += shared_sizes[archive.path]
+        return archives
+
+    @staticmethod
+    def _evict_to(archives: List[CacheArchive], max_size: int) -> List[CacheArchive]:
+        total = sum(archive.size for archive in archives)
+        evicted = []
+        for archive in sorted(archives, key=lambda archive: archive.last_used):
+            if total <= max_size:
+                break
+            if remove_if_unused(archive.path, 0):
+                LOGGER.info(
+                    f"Evicted cache {archive.path} ({archive.size} bytes, last used "
+                    f"{time.ctime(archive.last_used)})"
+                )
+                total -= archive.size
+                evicted.append(archive)
+                try:
+                    CacheIndex(os.path.dirname(archive.path)).remove(archive.path)
+                except sqlite3.Error as exc:
+                    LOGGER.debug(
+                        f"Unable to remove {archive.path} from the index: {exc}"
+                    )
+            else:
+                LOGGER.debug(f"Cache {archive.path} is in use, not evicting it")
+        return evicted
+
+    def evict(self) -> List[CacheArchive]:
+        """
+        Evict cache archives until the quotas are met, returning the evicted archives.
+        Returns without evicting anything if another process is already evicting.
+        """
+        if not os.path.isdir(self.caches_root):
+            return []
+        if (
+            self.max_size is None
+            and self.max_project_size is None
+            and not any(has_chunk_dir for _, has_chunk_dir, _ in self._walk())
+        ):
+            # Without quotas there is nothing to do, unless chunks need to be collected
+            return []
+        lock_file = os.path.join(self.caches_root, CACHE_EVICTION_LOCK_FILE)
+        with open(lock_file, "a", encoding="utf-8") as lock_file_obj:
+            try:
+                portalocker.lock(
+                    lock_file_obj,
+                    portalocker.LockFlags.EXCLUSIVE
+                    | portalocker.LockFlags.NON_BLOCKING,
+                )
+            except portalocker.LockException:
+                LOGGER.debug("Cache eviction is already running in another process")
+                return []
+            try:
+                return self._evict()
+            finally:
+                portalocker.unlock(lock_file_obj)
+
+    def _evict(self) -> List[CacheArchive]:
+        archives = self.scan()
+        evicted = []
+        if self.max_project_size is not None:
+            projects: Dict[str, List[CacheArchive]] = {}
+            for archive in archives:
+                if archive.project:
+                    projects.setdefault(archive.project, []).append(archive)
+            for project_archives in projects.values():
+                evicted.extend(self._evict_to(project_archives, self.max_project_size))
+        if self.max_size is not None:
+            evicted_paths = {archive.path for archive in evicted}
+            evicted.extend(
+                self._evict_to(
+                    [
+                        archive
+                        for archive in archives
+                        if archive.path not in evicted_paths
+                    ],
+                    self.max_size,
+                )
+            )
+
+        evicted_paths = {archive.path for archive in evicted}
+        for cache_dir in self.chunk_dirs:
+            collect_garbage(
+                cache_dir,
+                [
+                    archive.path
+                    for archive in archives
+                    if os.path.dirname(archive.path) == cache_dir
+                    and archive.path.endswith(f".{ChunkedCacheCodec.extension}")
+                    and archive.path not in evicted_paths
+                ],
+            )
+
+        # Forget the projects of archives that no longer exist
+        stale = {
+            archive: None
+            for archive in self._load_usage()
+            if not os.path.exists(os.path.join(self.caches_root, archive))
+        }
+        if stale:
+            try:
+                _update_usage(self.caches_root, stale)
+            except OSError as exc:
+                LOGGER.debug(f"Unable to update the cache usage file: {exc}")
+        return evicted
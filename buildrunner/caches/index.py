@@ -0,0 +1,167 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import contextlib
+import logging
+import os
+import sqlite3
+import stat
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from buildrunner.caches.codec import is_archive_file
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Index of the cache archives in a cache directory, kept in that directory
+CACHE_INDEX_FILE = ".cache-index.sqlite"
+CACHE_INDEX_VERSION = 1
+# The index is rebuilt from the directory listing when it is older than this, which
+# picks up archives written or removed by other tools (or older buildrunner versions)
+CACHE_INDEX_MAX_AGE_SECONDS = 3600
+CACHE_INDEX_TIMEOUT_SECONDS = 30
+# Appended to a prefix to get the upper bound of the names starting with it
+_MAX_CHAR = "\U0010ffff"
+
+
+def scan_archives(cache_dir: str) -> List[Tuple[str, int, float]]:
+    """
+    Returns the name, size and modification time of every cache archive in the
+    given directory.
+    """
+    archives = []
+    for file_name in os.listdir(cache_dir):
+        if file_name.startswith(".") or not is_archive_file(file_name):
+            continue
+        try:
+            stat_result = os.stat(os.path.join(cache_dir, file_name))
+        except FileNotFoundError:
+            continue
+        if stat.S_ISREG(stat_result.st_mode):
+            archives.append((file_name, stat_result.st_size, stat_result.st_mtime))
+    return archives
+
+
+class CacheIndex:
+    """
+    An sqlite index of the cache archives in a cache directory, so that finding the
+    most recent archive matching a cache key prefix is a range query instead of a
+    listing of the whole directory.
+
+    The index is updated when caches are saved or evicted, and rebuilt from the
+    directory listing when it is missing, from another version or too old.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.index_file = os.path.join(cache_dir, CACHE_INDEX_FILE)
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(
+            self.index_file, timeout=CACHE_INDEX_TIMEOUT_SECONDS
+        )
+        try:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS archives ("
+                    "file_name TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                    "mtime REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)"
+                )
+            yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _get_meta(connection: sqlite3.Connection, name: str):
+        row = connection.execute(
+            "SELECT value FROM meta WHERE name = ?", (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _is_current(self, connection: sqlite3.Connection) -> bool:
+        if self._get_meta(connection, "version") != CACHE_INDEX_VERSION:
+            return False
+        scanned_at = self._get_meta(connection, "scanned_at")
+        return (
+            scanned_at is not None
+            and time.time() - scanned_at < CACHE_INDEX_MAX_AGE_SECONDS
+        )
+
+    def _rebuild(self, connection: sqlite3.Connection) -> None:
+        # Take the write lock first so that only one process rebuilds the index
+        connection.execute("BEGIN IMMEDIATE")
+        if self._is_current(connection):
+            connection.commit()
+            return
+        scanned_at = time.time()
+        archives = scan_archives(self.cache_dir)
+        connection.execute("DELETE FROM archives")
+        connection.executemany(
+            "INSERT INTO archives (file_name, size, mtime) VALUES (?, ?, ?)", archives
+        )
+        connection.executemany(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+            [("version", CACHE_INDEX_VERSION), ("scanned_at", scanned_at)],
+        )
+        connection.commit()
+        LOGGER.debug(f"Indexed {len(archives)} cache archive(s) in {self.cache_dir}")
+
+    def find_latest(self, prefix: str) -> Optional[str]:
+        """
+        Returns the path of the most recently written archive whose name starts with
+        the given prefix, or None if there is none.
+        """
+        with self._connect() as connection:
+            if not self._is_current(connection):
+                self._rebuild(connection)
+            rows = connection.execute(
+                "SELECT file_name FROM archives WHERE file_name >= ? AND file_name < ? "
+                "ORDER BY mtime DESC",
+                (prefix, prefix + _MAX_CHAR),
+            ).fetchall()
+            for (file_name,) in rows:
+                archive_file = os.path.join(self.cache_dir, file_name)
+                if os.path.isfile(archive_file):
+                    return archive_file
+                # The archive was removed without updating the index
+                with connection:
+                    connection.execute(
+                        "DELETE FROM archives WHERE file_name = ?", (file_name,)
+                    )
+        return None
+
+    def add(self, archive_file: str) -> None:
+        """
+        Add (or update) the given archive in the index.
+        """
+        stat_result = os.stat(archive_file)
+        with self._connect() as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO archives (file_name, size, mtime) "
+                "VALUES (?, ?, ?)",
+                (
+                    os.path.basename(archive_file),
+                    stat_result.st_size,
+                    stat_result.st_mtime,
+                ),
+            )
+
+    def remove(self, archive_file: str) -> None:
+        """
+        Remove the given archive from the index.
+        """
+        with self._connect() as connection, connection:
+            connection.execute(
+                "DELETE FROM archives WHERE file_name = ?",
+                (os.path.basename(archive_file),),
+            )
@@ -0,0 +1,229 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+from typing import Iterable, Iterator, Optional
+
+import portalocker
+
+from buildrunner.caches.eviction import CacheEvictor
+
+
+LOGGER = logging.getLogger(__name__)
+
+# One JSON record per cache restored or saved by any build, kept in the caches root
+CACHE_TELEMETRY_FILE = ".cache-telemetry.jsonl"
+# The telemetry file is rotated once it grows past this size, the previous records are
+# kept in a single file with a ".1" suffix
+CACHE_TELEMETRY_MAX_SIZE = 2**24
+
+CACHE_OPERATION_RESTORE = "restore"
+CACHE_OPERATION_SAVE = "save"
+# Restore results: the cache key that hit (the tier, see the "tier" and "tier_key" of
+# the record) matched an archive exactly or by prefix, or nothing was restored
+CACHE_RESULT_EXACT = "exact"
+CACHE_RESULT_PREFIX = "prefix"
+CACHE_RESULT_MISS = "miss"
+# Save results: the archive was written, or skipped since nothing changed
+CACHE_RESULT_SAVED = "saved"
+CACHE_RESULT_UNCHANGED = "unchanged"
+# The restore or save failed
+CACHE_RESULT_ERROR = "error"
+
+
+def create_cache_event(
+    operation: str, docker_path: str, key: str, env_vars: Optional[dict]
+) -> dict:
+    """
+    Returns a new telemetry record for restoring or saving the given docker path, the
+    key is the archive file of the first cache key.
+    """
+    env_vars = env_vars or {}
+    return {
+        "time": time.time(),
+        "operation": operation,
+        "path": docker_path,
+        "key": key,
+        "archive": None,
+        # The position (starting at 1) and archive file of the cache key that hit
+        "tier": None,
+        "tier_key": None,
+        # The other cache keys a saved archive was linked to
+        "linked_keys": [],
+        "result": None,
+        "remote": False,
+        "bytes": 0,
+        "seconds": 0.0,
+        "lock_wait_seconds": 0.0,
+        "step": env_vars.get("BUILDRUNNER_STEP_NAME"),
+        "project": env_vars.get("VCSINFO_NAME"),
+        "host": socket.gethostname(),
+    }
+
+
+def record_cache_event(caches_root: str, event: dict) -> None:
+    """
+    Append the record to the telemetry file of the caches root. Failing to record it
+    does not fail the build.
+    """
+    telemetry_file = os.path.join(os.path.expanduser(caches_root), CACHE_TELEMETRY_FILE)
+    try:
+        with open(telemetry_file, "a", encoding="utf-8") as fobj:
+            portalocker.lock(fobj, portalocker.LockFlags.EXCLUSIVE)
+            try:
+                fobj.write(f"{json.dumps(event, separators=(',', ':'))}\n")
+                fobj.flush()
+                if fobj.tell() > CACHE_TELEMETRY_MAX_SIZE:
+                    os.replace(telemetry_file, f"{telemetry_file}.1")
+            finally:
+                portalocker.unlock(fobj)
+    except OSError as exc:
+        LOGGER.debug(f"Unable to record cache telemetry in {telemetry_file}: {exc}")
+
+
+def read_cache_events(caches_root: str) -> Iterator[dict]:
+    """
+    Returns a generator of the telemetry records of the caches root, oldest first.
+    """
+    telemetry_file = os.path.join(os.path.expanduser(caches_root), CACHE_TELEMETRY_FILE)
+    for path in (f"{telemetry_file}.1", telemetry_file):
+        try:
+            with open(path, "r", encoding="utf-8") as fobj:
+                for line in fobj:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # A record cut short, e.g. when the disk was full
+                        continue
+                    if isinstance(event, dict):
+                        yield event
+        except FileNotFoundError:
+            continue
+
+
+def _get_rate(part: float, total: float) -> float:
+    return part / total if total else 0.0
+
+
+def summarize_cache_events(events: Iterable[dict]) -> dict:
+    """
+    Summarize the hit rates and throughput of the given telemetry records, overall and
+    for each cache (the docker path of a project).
+    """
+    summary = {
+        "restores": 0,
+        "hits": 0,
+        "results": {},
+        "saves": 0,
+        "bytes_restored": 0,
+        "seconds_restoring": 0.0,
+        "bytes_saved": 0,
+        "seconds_saving": 0.0,
+        "lock_wait_seconds": 0.0,
+        "tiers": {},
+        "caches": {},
+    }
+    for event in events:
+        result = event.get("result")
+        summary["results"][result] = summary["results"].get(result, 0) + 1
+        summary["lock_wait_seconds"] += event.get("lock_wait_seconds") or 0.0
+        cache = summary["caches"].setdefault(
+            f"{event.get('project') or '-'} {event.get('path')}",
+            {"restores": 0, "hits": 0, "saves": 0, "skipped": 0},
+        )
+        if event.get("operation") == CACHE_OPERATION_RESTORE:
+            summary["restores"] += 1
+            cache["restores"] += 1
+            if result in (CACHE_RESULT_EXACT, CACHE_RESULT_PREFIX):
+                summary["hits"] += 1
+                cache["hits"] += 1
+                tier = event.get("tier") or 1
+                summary["tiers"][tier] = summary["tiers"].get(tier, 0) + 1
+                summary["bytes_restored"] += event.get("bytes") or 0
+                summary["seconds_restoring"] += event.get("seconds") or 0.0
+        elif event.get("operation") == CACHE_OPERATION_SAVE:
+            summary["saves"] += 1
+            cache["saves"] += 1
+            if result == CACHE_RESULT_UNCHANGED:
+                cache["skipped"] += 1
+            elif result == CACHE_RESULT_SAVED:
+                summary["bytes_saved"] += event.get("bytes") or 0
+                summary["seconds_saving"] += event.get("seconds") or 0.0
+    summary["hit_rate"] = _get_rate(summary["hits"], summary["restores"])
+    for cache in summary["caches"].values():
+        cache["hit_rate"] = _get_rate(cache["hits"], cache["restores"])
+    return summary
+
+
+def _format_size(size: float) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def format_cache_report(caches_root: str, top: int = 10) -> str:
+    """
+    Returns a report of the cache hit rates and throughput recorded in the caches
+    root, and of the largest cache archives it currently holds.
+    """
+    summary = summarize_cache_events(read_cache_events(caches_root))
+    lines = [
+        f"Cache report for {caches_root}",
+        "",
+        f"Restores: {summary['restores']}, hit rate {summary['hit_rate']:.0%} "
+        f"({summary['results'].get(CACHE_RESULT_EXACT, 0)} exact, "
+        f"{summary['results'].get(CACHE_RESULT_PREFIX, 0)} prefix, "
+        f"{summary['results'].get(CACHE_RESULT_MISS, 0)} miss)",
+        "Hits by cache key tier: "
+        + (
+            ", ".join(
+                f"{tier}: {count}" for tier, count in sorted(summary["tiers"].items())
+            )
+            or "-"
+        ),
+        f"Saves: {summary['saves']} "
+        f"({summary['results'].get(CACHE_RESULT_SAVED, 0)} saved, "
+        f"{summary['results'].get(CACHE_RESULT_UNCHANGED, 0)} unchanged)",
+        f"Errors: {summary['results'].get(CACHE_RESULT_ERROR, 0)}",
+        f"Restored {_format_size(summary['bytes_restored'])} at "
+        f"{_format_size(_get_rate(summary['bytes_restored'], summary['seconds_restoring']))}/s",
+        f"Saved {_format_size(summary['bytes_saved'])} at "
+        f"{_format_size(_get_rate(summary['bytes_saved'], summary['seconds_saving']))}/s",
+        f"Waited {summary['lock_wait_seconds']:.1f}s for cache locks",
+    ]
+    if summary["caches"]:
+        lines.extend(["", "Caches by hit rate (project, docker path):"])
+        caches = sorted(
+            summary["caches"].items(),
+            key=lambda item: (item[1]["hit_rate"], -item[1]["restores"]),
+        )
+        for name, cache in caches[:top]:
+            lines.append(
+                f"  {cache['hit_rate']:>4.0%} of {cache['restores']} restore(s), "
+                f"{cache['skipped']} of {cache['saves']} save(s) unchanged: {name}"
+            )
+
+    archives = sorted(
+        CacheEvictor(caches_root).scan(), key=lambda archive: -archive.size
+    )
+    if archives:
+        lines.extend([
+            "",
+            f"Cache archives: {len(archives)}, "
+            f"{_format_size(sum(archive.size for archive in archives))}",
+            "Largest cache archives:",
+        ])
+        for archive in archives[:top]:
+            lines.append(f"  {_format_size(archive.size):>8} {archive.archive}")
+    return "\n".join(lines)
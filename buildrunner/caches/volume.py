@@ -0,0 +1,308 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Iterator, List, Optional, Tuple
+
+import portalocker
+from docker.errors import APIError, ImageNotFound, NotFound
+
+from buildrunner.cleanup import register_container, unregister_container
+
+
+LOGGER = logging.getLogger(__name__)
+
+# How caches are stored: as archives in the caches root (restored with put_archive and
+# saved with get_archive) or as named volumes mounted directly into the step container
+CACHE_STORAGE_ARCHIVE = "archive"
+CACHE_STORAGE_VOLUME = "volume"
+CACHE_STORAGES = (CACHE_STORAGE_ARCHIVE, CACHE_STORAGE_VOLUME)
+
+CACHE_VOLUME_PREFIX = "buildrunner-cache"
+# Set on every cache volume, the value is the cache key the volume was created for
+CACHE_VOLUME_LABEL = "com.adobe.buildrunner.cache"
+# Records the volume holding each cache key and the volumes claimed by running steps,
+# kept in the caches root
+CACHE_VOLUME_STATE_FILE = ".cache-volumes.json"
+# Claimed volumes are protected from pruning for this long, a step that was killed
+# before releasing its volume does not protect it forever
+CACHE_VOLUME_CLAIM_SECONDS = 24 * 3600
+# Copies a cache volume into the new volume of a step
+CACHE_VOLUME_HELPER_IMAGE = "busybox:latest"
+
+
+def validate_cache_storage(value: str) -> str:
+    """
+    Validate a cache storage name, used by the global and step configurations.
+    """
+    if value not in CACHE_STORAGES:
+        raise ValueError(
+            f'Invalid cache storage "{value}", must be one of: {", ".join(CACHE_STORAGES)}'
+        )
+    return value
+
+
+class CacheVolumes:
+    """
+    Keeps caches in labeled named volumes that are mounted directly into the step
+    containers, so neither restoring nor saving a cache transfers any archive.
+
+    A step claims a new volume holding a copy of the current volume of the first of its
+    cache keys that has one, the copy is made with a helper container so the data never
+    leaves the docker daemon. When the step succeeds its volume is atomically promoted to
+    be the current volume of the key, otherwise it is discarded along with any changes
+    made by the failed step and the current volume is left as it was. Steps using the
+    same cache at the same time each work on their own copy. A step that finds no volume
+    for any of its keys starts from a new, empty volume.
+    """
+
+    def __init__(
+        self, docker_client, caches_root: str, docker_registry: str = "docker.io"
+    ):
+        self.docker_client = docker_client
+        self.state_file = os.path.join(
+            os.path.expanduser(caches_root), CACHE_VOLUME_STATE_FILE
+        )
+        self.helper_image = f"{docker_registry}/{CACHE_VOLUME_HELPER_IMAGE}"
+
+    @contextlib.contextmanager
+    def _state(self) -> Iterator[dict]:
+        """
+        Yields the state for updating while holding an exclusive lock on it.
+        """
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        with open(self.state_file, "a+", encoding="utf-8") as fobj:
+            portalocker.lock(fobj, portalocker.LockFlags.EXCLUSIVE)
+            try:
+                fobj.seek(0)
+                try:
+                    state = json.loads(fobj.read() or "{}")
+                except ValueError:
+                    LOGGER.debug(
+                        f"Ignoring invalid cache volume file {self.state_file}"
+                    )
+                    state = {}
+                state.setdefault("caches", {})
+                state.setdefault("claimed", {})
+                # The claimed volumes being copied, volume -> copied volume
+                state.setdefault("cloning", {})
+                yield state
+                fobj.seek(0)
+                fobj.truncate()
+                json.dump(state, fobj, separators=(",", ":"))
+            finally:
+                portalocker.unlock(fobj)
+
+    def _exists(self, volume: str) -> bool:
+        try:
+            self.docker_client.inspect_volume(volume)
+            return True
+        except NotFound:
+            return False
+
+    def _remove(self, volume: str) -> bool:
+        try:
+            self.docker_client.remove_volume(volume)
+            return True
+        except NotFound:
+            return True
+        except APIError as exc:
+            # The volume is still in use by a container
+            LOGGER.debug(f"Unable to remove cache volume {volume}: {exc}")
+            return False
+
+    @staticmethod
+    def _find(caches: dict, cache_key: str) -> Optional[str]:
+        """
+        Returns the cache key matching the given key exactly or, failing that, the most
+        recently saved cache key starting with it (the same as cache archives).
+        """
+        if cache_key in caches:
+            return cache_key
+        matches = [key for key in caches if key.startswith(cache_key)]
+        if not matches:
+            return None
+        return max(matches, key=lambda key: caches[key]["saved"])
+
+    def _ensure_helper_image(self) -> None:
+        try:
+            self.docker_client.inspect_image(self.helper_image)
+        except ImageNotFound:
+            LOGGER.info(f"Pulling cache volume helper image {self.helper_image}")
+            self.docker_client.pull(self.helper_image)
+
+    def _clone(self, source: str, volume: str) -> bool:
+        """
+        Copy the contents of the source volume into the given volume, returns whether
+        the copy succeeded.
+        """
+        self._ensure_helper_image()
+        container = self.docker_client.create_container(
+            self.helper_image,
+            command=["cp", "-a", "/cache/.", "/clone/"],
+            labels={CACHE_VOLUME_LABEL: volume},
+            host_config=self.docker_client.create_host_config(
+                binds={
+                    source: {"bind": "/cache", "ro": True},
+                    volume: {"bind": "/clone", "ro": False},
+                }
+            ),
+        )["Id"]
+        register_container(container)
+        try:
+            self.docker_client.start(container)
+            status_code = self.docker_client.wait(container).get("StatusCode")
+            if status_code:
+                LOGGER.warning(
+                    f"Unable to copy cache volume {source} to {volume}, "
+                    f"exit code {status_code}"
+                )
+            return not status_code
+        finally:
+            try:
+                self.docker_client.remove_container(container, force=True)
+            except APIError as exc:
+                LOGGER.debug(f"Unable to remove container {container}: {exc}")
+            unregister_container(container)
+
+    def _create(self, volume: str, cache_key: str) -> None:
+        self.docker_client.create_volume(
+            name=volume, labels={CACHE_VOLUME_LABEL: cache_key}
+        )
+
+    def claim(self, cache_keys: List[str]) -> Tuple[str, Optional[str]]:
+        """
+        Claim a new volume holding a copy of the volume of the first of the given cache
+        keys that has one, or an empty volume if none does. Returns the volume name and
+        the matched cache key, or None for an empty volume.
+        """
+        volume = f"{CACHE_VOLUME_PREFIX}-{uuid.uuid4().hex[:12]}"
+        source = None
+        matched_key = None
+        with self._state() as state:
+            for cache_key in cache_keys:
+                while not source:
+                    matched_key = self._find(state["caches"], cache_key)
+                    if not matched_key:
+                        break
+                    if self._exists(state["caches"][matched_key]["volume"]):
+                        source = state["caches"][matched_key]["volume"]
+                    else:
+                        LOGGER.debug(
+                            f"Cache volume {state['caches'].pop(matched_key)['volume']}"
+                            " no longer exists"
+                        )
+                if source:
+                    break
+
+            self._create(volume, cache_keys[0])
+            state["claimed"][volume] = time.time()
+            if not source:
+                return volume, None
+            # The copied volume is kept until the copy completes, even if it is replaced
+            state["cloning"][volume] = source
+
+        try:
+            cloned = self._clone(source, volume)
+        except APIError as exc:
+            LOGGER.warning(f"Unable to copy cache volume {source} to {volume}: {exc}")
+            cloned = False
+        finally:
+            with self._state() as state:
+                state["cloning"].pop(volume, None)
+                is_unused = source not in state["cloning"].values() and not any(
+                    cache["volume"] == source for cache in state["caches"].values()
+                )
+            if is_unused:
+                self._remove(source)
+        if not cloned:
+            # Start over from an empty volume rather than a partial copy
+            self._remove(volume)
+            self._create(volume, cache_keys[0])
+            return volume, None
+        return volume, matched_key
+
+    def promote(self, cache_key: str, volume: str) -> None:
+        """
+        Make the claimed volume the current volume of the given cache key, removing
+        the volume it replaces unless it is still being copied.
+        """
+        with self._state() as state:
+            state["claimed"].pop(volume, None)
+            previous = state["caches"].get(cache_key)
+            state["caches"][cache_key] = {"volume": volume, "saved": time.time()}
+            is_unused = (
+                previous
+                and previous["volume"] != volume
+                and previous["volume"] not in state["cloning"].values()
+                and not any(
+                    cache["volume"] == previous["volume"]
+                    for cache in state["caches"].values()
+                )
+            )
+        if is_unused:
+            self._remove(previous["volume"])
+
+    def discard(self, volume: str) -> None:
+        """
+        Remove a claimed volume that was not promoted, the container using it must have
+        been removed.
+        """
+        with self._state() as state:
+            state["claimed"].pop(volume, None)
+        self._remove(volume)
+
+    def prune(self, remove_all: bool = False) -> List[str]:
+        """
+        Remove the cache volumes that are neither the current volume of a cache key nor
+        claimed by a step (or all cache volumes not in use), returning their names.
+        """
+        volumes = (
+            self.docker_client.volumes(filters={"label": CACHE_VOLUME_LABEL}).get(
+                "Volumes"
+            )
+            or []
+        )
+        with self._state() as state:
+            keep = set()
+            if not remove_all:
+                keep.update(cache["volume"] for cache in state["caches"].values())
+                keep.update(
+                    volume
+                    for volume, claimed_at in state["claimed"].items()
+                    if time.time() - claimed_at < CACHE_VOLUME_CLAIM_SECONDS
+                )
+                keep.update(state["cloning"].values())
+            removed = [
+                volume["Name"]
+                for volume in volumes
+                if volume["Name"] not in keep and self._remove(volume["Name"])
+            ]
+            state["caches"] = {
+                cache_key: cache
+                for cache_key, cache in state["caches"].items()
+                if cache["volume"] not in removed
+            }
+            state["claimed"] = {
+                volume: claimed_at
+                for volume, claimed_at in state["claimed"].items()
+                if volume not in removed
+            }
+            state["cloning"] = {
+                volume: source
+                for volume, source in state["cloning"].items()
+                if volume not in removed
+            }
+        for volume in removed:
+            LOGGER.info(f"Removed cache volume {volume}")
+        return removed
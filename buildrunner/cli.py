@@ -157,6 +157,25 @@ def parse_args(argv):
         "~/.buildrunner/caches",
     )
 
+    parser.add_argument(
+        "--evict",
+        default=False,
+        action="store_true",
+        dest="evict_cache",
+        help="Used with buildrunner-cleanup, evict the least recently used caches until the "
+        'configured quotas ("max-size" and "max-project-size" in the "caches" global config) are met '
+        "instead of removing all caches",
+    )
+
+    parser.add_argument(
+        "--report",
+        default=False,
+        action="store_true",
+        dest="report_cache",
+        help="Used with buildrunner-cleanup, print the cache hit rates and throughput "
+        "recorded by previous builds and the largest caches instead of removing all caches",
+    )
+
     parser.add_argument(
         "-s",
         "--steps",
@@ -292,7 +311,12 @@ def clean_cache():
         global_config_overrides=_get_global_config_overrides(args),
         platform=args.platform,
     )
-    BuildRunner.clean_cache()
+    if args.report_cache:
+        BuildRunner.report_cache()
+    elif args.evict_cache:
+        BuildRunner.evict_cache()
+    else:
+        BuildRunner.clean_cache()
 
 
 def _create_results_dir(cleanup_step_artifacts: bool, build_results_dir: str) -> None:
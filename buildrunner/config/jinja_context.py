@@ -9,13 +9,22 @@ with the terms of the Adobe license agreement accompanying it.
 import codecs
 import copy
 import datetime
+import logging
+import os
 import re
 from io import StringIO
-from typing import Callable
+from typing import Callable, List, Optional
 
 import jinja2
 
-from buildrunner.utils import load_config
+from buildrunner.utils import find_lockfiles, hash_lockfiles, load_config
+
+LOGGER = logging.getLogger(__name__)
+
+# Characters kept in the components of cache keys, "/" is kept as "~" (which git does
+# not allow in branch names) and "_" is never kept since it ends the branch component,
+# so that the key prefix of a branch never matches the keys of another branch
+_CACHE_KEY_INVALID_CHARS = re.compile(r"[^A-Za-z0-9.~-]+")
 
 
 def read_yaml_file(
@@ -50,6 +59,51 @@ def strftime(_build_time: int, _format="%Y-%m-%d", _ts=None):
     return _date.strftime(_format)
 
 
+def cache_keys(
+    env: dict,
+    name: str,
+    *lockfile_globs: str,
+    branch: Optional[str] = None,
+    default_branch: str = "main",
+) -> List[str]:
+    """
+    Returns a fallback chain of cache keys: the exact hash of the lockfiles on the
+    current branch, then the most recent cache of the current branch, then the most
+    recent cache of the default branch. The exact key is left out when no lockfile
+    matches the globs, since the hash would then be the same for every build.
+    :param env: The configuration context. This is bound with functools.partial and is not required to pass in.
+    :param name: The name of the cache, e.g. "m2"
+    :param lockfile_globs: Globs of the files the cache content depends on, e.g. "**/pom.xml"
+    :param branch: The current branch - default VCSINFO_BRANCH
+    :param default_branch: The branch to fall back to - default "main"
+    :return: The cache keys, the first one is the key the cache is saved to
+    """
+
+    def _sanitize(value):
+        # Keeps keys valid file names and valid YAML when the list is rendered as is
+        return _CACHE_KEY_INVALID_CHARS.sub("-", str(value).replace("/", "~")).strip(
+            "-"
+        )
+
+    name = _sanitize(name)
+    branch = _sanitize(branch if branch is not None else env.get("VCSINFO_BRANCH", ""))
+    default_branch = _sanitize(default_branch)
+    keys = []
+    if lockfile_globs:
+        file_names = find_lockfiles(*lockfile_globs)
+        if file_names:
+            keys.append(f"{name}-{branch}_{hash_lockfiles(file_names)}")
+        else:
+            LOGGER.warning(
+                f"No lockfile matches {', '.join(lockfile_globs)} in {os.getcwd()}, "
+                f"leaving the exact key out of the {name} cache keys"
+            )
+    keys.append(f"{name}-{branch}_")
+    if default_branch != branch:
+        keys.append(f"{name}-{default_branch}_")
+    return keys
+
+
 def raise_exception_jinja(message):
     """
     Raises an exception from a jinja template.
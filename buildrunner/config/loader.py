@@ -28,6 +28,7 @@ from buildrunner.errors import (
 from buildrunner.utils import (
     checksum,
     hash_sha1,
+    lockfile_hash,
     load_config,
 )
 
@@ -230,7 +231,7 @@ def _fetch_template(
         jenv.filters["re_sub"] = jinja_context.re_sub_filter
         jenv.filters["re_split"] = jinja_context.re_split_filter
 
-        jenv.globals.update(checksum=checksum)
+        jenv.globals.update(checksum=checksum, lockfile_hash=lockfile_hash)
         jtemplate = jenv.from_string(contents)
 
         config_context = copy.deepcopy(env)
@@ -242,6 +243,7 @@ def _fetch_template(
             ),
             "raise": jinja_context.raise_exception_jinja,
             "strftime": functools.partial(jinja_context.strftime, build_time),
+            "cache_keys": functools.partial(jinja_context.cache_keys, env),
             "env": os.environ,
             # This is stored after the initial env is set
             "DOCKER_REGISTRY": global_config.docker_registry if global_config else None,
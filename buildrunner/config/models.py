@@ -11,8 +11,19 @@ import tempfile
 from copy import deepcopy
 from typing import Any, Dict, List, Optional, Tuple, Union
 
-from pydantic import BaseModel, Field, field_validator, ValidationError
+from pydantic import (
+    BaseModel,
+    Field,
+    ValidationError,
+    field_validator,
+    model_validator,
+)
 
+from buildrunner.artifacts import ARTIFACT_CHECKSUMS
+from buildrunner.caches.backend import CACHE_BACKEND_S3, validate_cache_backend
+from buildrunner.caches.codec import CACHE_CODEC_NONE, CACHE_CODECS
+from buildrunner.caches.eviction import parse_size
+from buildrunner.caches.volume import CACHE_STORAGE_ARCHIVE, validate_cache_storage
 from .models_step import Step, StepPushSecurityScanConfig
 from .validation import (
     get_validation_errors,
@@ -23,6 +34,8 @@ from .validation import (
 
 
 DEFAULT_CACHES_ROOT = "~/.buildrunner/caches"
+SOURCE_PROVIDER_IMAGE = "image"
+SOURCE_PROVIDER_VOLUME = "volume"
 # Marker for using the local registry instead of an upstream registry
 MP_LOCAL_REGISTRY = "local"
 DEFAULT_TO_LEGACY_BUILDER = True
@@ -92,6 +105,181 @@ class GlobalSecurityScanConfig(BaseModel, extra="forbid"):
         return cloned_config
 
 
+class GlobalSourceConfig(BaseModel, extra="forbid"):
+    """
+    Configures how the source tree is archived and provided to build containers.
+    """
+
+    # Keep a deterministic, content-addressed source archive in the caches root
+    # and reuse it between runs when the source tree has not changed
+    incremental: bool = False
+    # Tag the source image with the digest of the source archive and reuse it between
+    # runs instead of building it for every run (implies incremental)
+    reuse_image: bool = Field(False, alias="reuse-image")
+    # Whether files ignored by git are archived in git work trees, which requires
+    # walking the whole build directory instead of listing the files with git
+    include_git_ignored: bool = Field(False, alias="include-git-ignored")
+    # How /source is provided to containers: "image" builds a source image and creates a
+    # source container per step, "volume" extracts the source archive once per build into
+    # a named volume that is mounted by every container
+    provider: str = SOURCE_PROVIDER_IMAGE
+    # Whether the source volume is mounted read-only (only used by the volume provider)
+    volume_read_only: bool = Field(True, alias="volume-read-only")
+
+    @field_validator("provider")
+    @classmethod
+    def validate_provider(cls, val) -> str:
+        if val not in (SOURCE_PROVIDER_IMAGE, SOURCE_PROVIDER_VOLUME):
+            raise ValueError(
+                f'Invalid source provider "{val}", must be one of: '
+                f"{SOURCE_PROVIDER_IMAGE}, {SOURCE_PROVIDER_VOLUME}"
+            )
+        return val
+
+
+class GlobalArtifactsConfig(BaseModel, extra="forbid"):
+    """
+    Configures how artifacts are gathered from run steps.
+    """
+
+    # Stream directories archived as tar out of the container and compress them on the
+    # host with several threads instead of with tar in the container
+    compress_on_host: bool = Field(False, alias="compress-on-host")
+    # The number of compression threads used on the host, 0 uses one per CPU
+    threads: int = 0
+    # The checksums computed while artifacts are written and recorded in the
+    # artifacts manifest with their size: "sha256", "sha1" and/or "md5"
+    checksums: List[str] = ["sha256"]
+
+    @field_validator("threads")
+    @classmethod
+    def validate_threads(cls, val) -> int:
+        if val < 0:
+            raise ValueError(
+                f'Invalid artifact compression threads "{val}", must be at least 0'
+            )
+        return val
+
+    @field_validator("checksums")
+    @classmethod
+    def validate_checksums(cls, vals) -> List[str]:
+        for val in vals:
+            if val not in ARTIFACT_CHECKSUMS:
+                raise ValueError(
+                    f'Invalid artifact checksum "{val}", must be one of: '
+                    f"{', '.join(ARTIFACT_CHECKSUMS)}"
+                )
+        return vals
+
+
+class GlobalCacheBackendConfig(BaseModel, extra="forbid"):
+    """
+    Configures the remote backend caches are shared through.
+    """
+
+    # "http" or "s3"
+    type: str
+    # The base URL of the http backend, or the endpoint URL of the s3 backend
+    url: Optional[str] = None
+    # The bucket and key prefix of the s3 backend
+    bucket: Optional[str] = None
+    prefix: str = ""
+    region: Optional[str] = None
+    # Headers sent with every request of the http backend (e.g. Authorization)
+    headers: Optional[Dict[str, str]] = None
+    # Archives are transferred in parts of this size, in bytes (e.g. 64M)
+    part_size: int = Field(64 * 2**20, alias="part-size")
+    # The maximum number of parts transferred at the same time
+    concurrency: int = 8
+    # Upload saved caches in the background, the build waits for the uploads at the end
+    write_behind: bool = Field(True, alias="write-behind")
+
+    @field_validator("type")
+    @classmethod
+    def validate_type(cls, val) -> str:
+        return validate_cache_backend(val)
+
+    @field_validator("part_size", mode="before")
+    @classmethod
+    def validate_part_size(cls, val) -> int:
+        return parse_size(val)
+
+    @field_validator("concurrency")
+    @classmethod
+    def validate_concurrency(cls, val) -> int:
+        if val < 1:
+            raise ValueError(
+                f'Invalid cache backend concurrency "{val}", must be at least 1'
+            )
+        return val
+
+    @model_validator(mode="after")
+    def validate_location(self):
+        if self.type == CACHE_BACKEND_S3:
+            if not self.bucket:
+                raise ValueError('The "s3" cache backend requires a bucket')
+        elif not self.url:
+            raise ValueError(f'The "{self.type}" cache backend requires a url')
+        return self
+
+
+class GlobalCachesConfig(BaseModel, extra="forbid"):
+    """
+    Configures how step caches are stored in the caches root.
+    """
+
+    # Compression used for new cache archives: "none", "gzip" or "zstd"
+    codec: str = CACHE_CODEC_NONE
+    # The compression level, defaults to the codec's default level
+    level: Optional[int] = None
+    # The number of compression threads (zstd only), -1 uses one per CPU
+    threads: int = 0
+    # Evict the least recently used cache archives once the caches root exceeds this
+    # size in bytes (e.g. 20G)
+    max_size: Optional[int] = Field(None, alias="max-size")
+    # Evict the least recently used cache archives saved by a project once they exceed
+    # this size in bytes
+    max_project_size: Optional[int] = Field(None, alias="max-project-size")
+    # The maximum number of caches restored or saved at the same time by a step
+    concurrency: int = 4
+    # How step caches are stored by default: "archive" or "volume"
+    storage: str = CACHE_STORAGE_ARCHIVE
+    # Share cache archives with other hosts through a remote backend
+    backend: Optional[GlobalCacheBackendConfig] = None
+    # Skip saving a cache archive when the files in the container did not change
+    # since the same archive was restored
+    skip_unchanged: bool = Field(True, alias="skip-unchanged")
+    # Save each step cache to all of its keys instead of only the first one, from a
+    # single transfer out of the container
+    save_all_keys: bool = Field(False, alias="save-all-keys")
+
+    @field_validator("codec")
+    @classmethod
+    def validate_codec(cls, val) -> str:
+        if val not in CACHE_CODECS:
+            raise ValueError(
+                f'Invalid cache codec "{val}", must be one of: {", ".join(CACHE_CODECS)}'
+            )
+        return val
+
+    @field_validator("storage")
+    @classmethod
+    def validate_storage(cls, val) -> str:
+        return validate_cache_storage(val)
+
+    @field_validator("concurrency")
+    @classmethod
+    def validate_concurrency(cls, val) -> int:
+        if val < 1:
+            raise ValueError(f'Invalid cache concurrency "{val}", must be at least 1')
+        return val
+
+    @field_validator("max_size", "max_project_size", mode="before")
+    @classmethod
+    def validate_size(cls, val) -> Optional[int]:
+        return parse_size(val)
+
+
 class GlobalConfig(BaseModel, extra="forbid"):
     """Top level global config model"""
 
@@ -106,6 +294,7 @@ class GlobalConfig(BaseModel, extra="forbid"):
         alias="docker-build-cache", default=DockerBuildCacheConfig()
     )
     caches_root: Optional[str] = Field(alias="caches-root", default=DEFAULT_CACHES_ROOT)
+    caches: GlobalCachesConfig = Field(GlobalCachesConfig(), alias="caches")
     # Default to docker.io if none is configured
     docker_registry: Optional[str] = Field(alias="docker-registry", default="docker.io")
     """
@@ -130,6 +319,8 @@ class GlobalConfig(BaseModel, extra="forbid"):
     security_scan: GlobalSecurityScanConfig = Field(
         GlobalSecurityScanConfig(), alias="security-scan"
     )
+    source: GlobalSourceConfig = Field(GlobalSourceConfig(), alias="source")
+    artifacts: GlobalArtifactsConfig = Field(GlobalArtifactsConfig(), alias="artifacts")
 
     @field_validator("ssh_keys", mode="before")
     @classmethod
@@ -18,6 +18,8 @@ from pydantic import (
 )
 from typing_extensions import Annotated
 
+from buildrunner.caches.volume import validate_cache_storage
+
 
 def _validate_artifact_type(value) -> Any:
     if value and not Artifact.model_validate(value):
@@ -83,6 +85,33 @@ class StepBuild(StepTask):
     secrets: Optional[List[str]] = None
 
 
+class StepCache(BaseModel, extra="forbid"):
+    """
+    A cache of the docker path it is configured for, with its local cache keys
+    """
+
+    keys: List[str]
+    # "archive" or "volume", defaults to the storage of the caches global config
+    storage: Optional[str] = None
+    # Save the cache to every key instead of only the first one (archives only),
+    # defaults to the save-all-keys of the caches global config
+    save_all_keys: Optional[bool] = Field(None, alias="save-all-keys")
+
+    @field_validator("keys", mode="before")
+    @classmethod
+    def transform_keys(cls, val) -> Any:
+        if isinstance(val, str):
+            return [val]
+        return val
+
+    @field_validator("storage")
+    @classmethod
+    def validate_storage(cls, val) -> Optional[str]:
+        if val is None:
+            return val
+        return validate_cache_storage(val)
+
+
 class RunAndServicesBase(StepTask):
     """
     Base model for Run and Service which has several common fields
@@ -107,7 +136,7 @@ class RunAndServicesBase(StepTask):
     systemd: Optional[bool] = None
     systemd_cgroup2: Optional[bool] = None
     containers: Optional[List[str]] = None
-    caches: Optional[Dict[str, Union[str, List[str]]]] = None
+    caches: Optional[Dict[str, Union[str, List[str], StepCache]]] = None
     # Resource limits
     mem_limit: Optional[Union[str, int]] = Field(alias="mem-limit", default=None)
     cpu_shares: Optional[int] = Field(alias="cpu-shares", default=None)
@@ -10,17 +10,23 @@ import json
 import logging
 import os
 import re
-import tarfile
-import tempfile
 
 import docker
 import docker.errors
+from docker.api.build import process_dockerfile
 
 from buildrunner.errors import (
     BuildRunnerProcessingError,
 )
 
 from buildrunner.docker import get_dockerfile, new_client, force_remove_container
+from buildrunner.docker.context import (
+    DOCKERIGNORE_FILE,
+    get_context_files,
+    is_local_daemon,
+    read_dockerignore,
+    stream_context,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -180,48 +186,54 @@ class DockerBuilder:  # pylint: disable=too-many-instance-attributes
         buildargs["DOCKER_REGISTRY"] = self.docker_registry
         stream = None
 
-        # create our own tar file, injecting the appropriate paths
-        # pylint: disable=consider-using-with
+        # stream our own context tar, injecting the appropriate paths
+        files = []
+        extra_files = []
+        inject = list((self.inject or {}).items())
+        dockerfile = None
         if self.inject or not self.path:
-            logger.info(
-                "[Warning] When injecting files into the build context the .dockerignore is not used."
+            if self.path and self.copy_source_path:
+                files = get_context_files(self.path, read_dockerignore(self.path))
+            if self.dockerfile:
+                inject.append((self.dockerfile, "Dockerfile"))
+        else:
+            patterns = read_dockerignore(self.path)
+            dockerfile, dockerfile_content = process_dockerfile(
+                self.dockerfile, self.path
             )
+            files = get_context_files(self.path, patterns, dockerfile)
+            if dockerfile_content is not None:
+                # The Dockerfile is outside of the context, add it (and ignore it) the
+                # same way the docker client does
+                extra_files = [
+                    (
+                        DOCKERIGNORE_FILE,
+                        "\n".join((patterns or [DOCKERIGNORE_FILE]) + [dockerfile]),
+                    ),
+                    (dockerfile, dockerfile_content),
+                ]
 
-            _fileobj = tempfile.NamedTemporaryFile(dir=self.temp_dir)
-            with tarfile.open(mode="w", fileobj=_fileobj) as tfile:
-                if self.path and self.copy_source_path:
-                    tfile.add(self.path, arcname=".")
-                if self.inject:
-                    for to_inject, dest in self.inject.items():
-                        tfile.add(to_inject, arcname=dest)
-                if self.dockerfile:
-                    tfile.add(self.dockerfile, arcname="./Dockerfile")
-            _fileobj.seek(0)
-
-            stream = self.docker_client.build(
-                path=None,
-                nocache=nocache,
-                cache_from=cache_from,
-                custom_context=True,
-                fileobj=_fileobj,
-                rm=rm,
-                pull=pull,
-                buildargs=self._sanitize_buildargs(buildargs),
-                platform=platform,
-                target=target,
-            )
-        else:
-            stream = self.docker_client.build(
+        gzip = not is_local_daemon(self.docker_client)
+        stream = self.docker_client.build(
+            path=None,
+            nocache=nocache,
+            cache_from=cache_from,
+            custom_context=True,
+            fileobj=stream_context(
                 path=self.path,
-                nocache=nocache,
-                cache_from=cache_from,
-                rm=rm,
-                pull=pull,
-                buildargs=self._sanitize_buildargs(buildargs),
-                platform=platform,
-                target=target,
-                dockerfile=self.dockerfile,
-            )
+                files=files,
+                inject=inject,
+                extra_files=extra_files,
+                gzip=gzip,
+            ),
+            encoding="gzip" if gzip else None,
+            rm=rm,
+            pull=pull,
+            buildargs=self._sanitize_buildargs(buildargs),
+            platform=platform,
+            target=target,
+            dockerfile=dockerfile,
+        )
 
         # monitor output for logs and status
         exit_code = 0
@@ -0,0 +1,155 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import io
+import os
+import queue
+import tarfile
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+from docker.utils.build import exclude_paths
+
+
+DOCKERIGNORE_FILE = ".dockerignore"
+# Base URLs of daemons reached through a local socket, contexts sent to other daemons
+# are compressed
+LOCAL_DOCKER_BASE_URLS = ("http+docker://localhost", "http+docker://localnpipe")
+# Size of the chunks sent in the build request and number of chunks buffered between
+# the producer thread and the request
+CONTEXT_CHUNK_SIZE = 2**20
+CONTEXT_QUEUE_SIZE = 16
+_CONTEXT_END = object()
+
+
+def is_local_daemon(docker_client) -> bool:
+    """
+    Returns true if the docker client talks to a daemon on a local socket.
+    """
+    return docker_client.base_url in LOCAL_DOCKER_BASE_URLS
+
+
+def read_dockerignore(path: str) -> List[str]:
+    """
+    Read the .dockerignore patterns of the given context directory, parsed the same way as
+    the docker client does.
+    """
+    dockerignore = os.path.join(path, DOCKERIGNORE_FILE)
+    if not os.path.exists(dockerignore):
+        return []
+    with open(dockerignore, "r", encoding="utf-8") as fobj:
+        return [
+            line
+            for line in (line.strip() for line in fobj.read().splitlines())
+            if line and not line.startswith("#")
+        ]
+
+
+def get_context_files(
+    path: str, patterns: List[str], dockerfile: Optional[str] = None
+) -> List[str]:
+    """
+    Return the sorted paths (relative to the context directory) of the files and
+    directories that are not excluded by the given .dockerignore patterns.
+    """
+    return sorted(exclude_paths(os.path.abspath(path), list(patterns), dockerfile))
+
+
+class _QueueWriter(io.RawIOBase):
+    """
+    Write-only file object handing every write to a bounded queue.
+    """
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        super().__init__()
+        self._chunks = chunks
+        self._cancelled = cancelled
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        while True:
+            if self._cancelled.is_set():
+                raise BrokenPipeError("The build context is no longer being read")
+            try:
+                self._chunks.put(chunk, timeout=1)
+                return len(chunk)
+            except queue.Full:
+                continue
+
+
+def stream_context(
+    path: Optional[str] = None,
+    files: Optional[List[str]] = None,
+    inject: Optional[List[Tuple[str, str]]] = None,
+    extra_files: Optional[List[Tuple[str, str]]] = None,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    """
+    Generate a docker build context tar (optionally gzip compressed) without writing it to
+    disk. The archive is produced by a background thread while it is being consumed, so it
+    can be passed directly as the body of the build request.
+
+    The archive contains the given files (relative to path), then the injected files or
+    directories (source, destination in the context) and finally the extra files
+    (name, content) in that order, so that later entries override earlier ones.
+    """
+    chunks = queue.Queue(maxsize=CONTEXT_QUEUE_SIZE)
+    cancelled = threading.Event()
+    extra_names = {name for name, _ in extra_files or []}
+
+    def _produce():
+        try:
+            with _QueueWriter(chunks, cancelled) as writer:
+                with tarfile.open(
+                    mode="w|gz" if gzip else "w|",
+                    fileobj=writer,
+                    bufsize=CONTEXT_CHUNK_SIZE,
+                ) as tfile:
+                    for rel_path in files or []:
+                        if rel_path in extra_names:
+                            continue
+                        tfile.add(
+                            os.path.join(path, rel_path),
+                            arcname=rel_path,
+                            recursive=False,
+                        )
+                    for to_inject, dest in inject or []:
+                        tfile.add(to_inject, arcname=dest)
+                    for name, content in extra_files or []:
+                        data = content.encode("utf-8")
+                        tarinfo = tarfile.TarInfo(name)
+                        tarinfo.size = len(data)
+                        tfile.addfile(tarinfo, io.BytesIO(data))
+            result = _CONTEXT_END
+        except Exception as exc:  # pylint: disable=broad-except
+            result = exc
+        while not cancelled.is_set():
+            try:
+                chunks.put(result, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    producer = threading.Thread(
+        target=_produce, name="buildrunner-context", daemon=True
+    )
+    producer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _CONTEXT_END:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
+        producer.join()
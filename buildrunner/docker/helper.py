@@ -0,0 +1,168 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import io
+import logging
+import shlex
+import threading
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from buildrunner.docker.runner import DockerRunner
+
+
+LOGGER = logging.getLogger(__name__)
+
+# The image provides a shell, GNU tar, coreutils and bash for the helper commands
+HELPER_IMAGE_NAME = "ubuntu:19.04"
+HELPER_CONTAINER_LABEL = "com.adobe.buildrunner.helper"
+# Seconds each port probe waits for the connection to be accepted
+HELPER_PROBE_TIMEOUT = 1
+
+
+class HelperContainer:
+    """
+    A long-lived utility container shared by every step of a build.
+
+    Artifact listing, port probing and file operations are run in the container
+    through exec instead of creating, starting and removing a throwaway container for
+    each of them. The container is started on first use, attached to the network of
+    each step that needs it and removed at the end of the build.
+    """
+
+    def __init__(
+        self,
+        docker_registry: str,
+        log=None,
+        volumes: Optional[Dict[str, str]] = None,
+        working_dir: Optional[str] = None,
+    ):
+        self.image_name = f"{docker_registry}/{HELPER_IMAGE_NAME}"
+        self.log = log
+        self.volumes = dict(volumes or {})
+        self.working_dir = working_dir
+        self._runner = None
+        self._networks: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def container(self) -> Optional[str]:
+        """
+        The id of the helper container, None until it is started.
+        """
+        if self._runner and self._runner.container:
+            return self._runner.container["Id"]
+        return None
+
+    def _get_runner(self) -> DockerRunner:
+        with self._lock:
+            if not self._runner:
+                runner = DockerRunner(
+                    DockerRunner.ImageConfig(self.image_name, pull_image=False),
+                    log=self.log,
+                    # Log run messages at a debug level
+                    run_log_debug=True,
+                )
+                runner.start(
+                    shell="/bin/sh",
+                    volumes=self.volumes,
+                    working_dir=self.working_dir,
+                    labels={HELPER_CONTAINER_LABEL: "true"},
+                )
+                self._runner = runner
+                LOGGER.info(f"Created helper container {self.container:.10}")
+            return self._runner
+
+    def connect(self, network: Optional[str]) -> None:
+        """
+        Attach the helper container to the given network, unless it already is.
+        """
+        runner = self._get_runner()
+        if not network or network in self._networks:
+            return
+        runner.docker_client.connect_container_to_network(self.container, network)
+        self._networks.add(network)
+
+    def disconnect(self, network: Optional[str]) -> None:
+        """
+        Detach the helper container from the given network so that it can be removed.
+        """
+        if network not in self._networks:
+            return
+        self._networks.discard(network)
+        try:
+            self._runner.docker_client.disconnect_container_from_network(
+                self.container, network, force=True
+            )
+        except Exception as _ex:  # pylint: disable=broad-except
+            LOGGER.warning(f"Failed to detach helper container from {network}: {_ex}")
+
+    def run_with_output(
+        self, cmd: Union[str, List[str]], log=None
+    ) -> Tuple[int, bytes]:
+        """
+        Run the given command in the helper container, see DockerRunner.run_with_output.
+        """
+        return self._get_runner().run_with_output(cmd, log=log)
+
+    def run_to_file(
+        self, cmd: Union[str, List[str]], file_obj: io.IOBase
+    ) -> Tuple[int, bytes]:
+        """
+        Run the given command in the helper container, see DockerRunner.run_to_file.
+        """
+        return self._get_runner().run_to_file(cmd, file_obj)
+
+    def stream_archive(self, path: str) -> Iterator[bytes]:
+        """
+        Stream the given path out of the helper container, see
+        DockerRunner.stream_archive.
+        """
+        return self._get_runner().stream_archive(path)
+
+    def probe_port(self, ipaddr: str, port: int) -> bool:
+        """
+        Returns whether the given port accepts connections, as seen from the networks
+        the helper container is attached to.
+        """
+        exit_code, _ = self.run_with_output([
+            "timeout",
+            str(HELPER_PROBE_TIMEOUT),
+            "bash",
+            "-c",
+            f"exec 3<>/dev/tcp/{ipaddr}/{int(port)}",
+        ])
+        return exit_code == 0
+
+    def probe_http(self, ipaddr: str, port: int, path: str) -> bool:
+        """
+        Returns whether a GET request of the given path succeeds with a status below
+        400, as seen from the networks the helper container is attached to.
+        """
+        request = shlex.quote(f"GET {path} HTTP/1.0\r\nHost: {ipaddr}\r\n\r\n")
+        exit_code, _ = self.run_with_output([
+            "timeout",
+            str(HELPER_PROBE_TIMEOUT),
+            "bash",
+            "-c",
+            f"exec 3<>/dev/tcp/{ipaddr}/{int(port)} && printf %s {request} >&3 && "
+            'read -r _ status _ <&3 && [ "$status" -lt 400 ]',
+        ])
+        return exit_code == 0
+
+    def remove(self) -> None:
+        """
+        Remove the helper container.
+        """
+        with self._lock:
+            if self._runner:
+                try:
+                    self._runner.cleanup()
+                except Exception as _ex:  # pylint: disable=broad-except
+                    LOGGER.warning(f"Failed to remove helper container: {_ex}")
+                self._runner = None
+                self._networks.clear()
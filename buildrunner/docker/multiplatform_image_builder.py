@@ -75,6 +75,27 @@ class RegistryInfo:
         return self.__str__()
 
 
+def _link_or_copy(src: str, dest: str) -> str:
+    """
+    Hardlink the file if possible (e.g. on the same filesystem), otherwise copy it.
+    """
+    try:
+        os.link(src, dest)
+        return dest
+    except OSError:
+        return shutil.copy2(src, dest)
+
+
+def _replace_file(src: str, dest: str) -> None:
+    """
+    Copy the file to the destination, replacing (instead of writing through) an existing
+    destination file, which may be a hardlink to a file in the source tree.
+    """
+    if os.path.lexists(dest) and not os.path.isdir(dest):
+        os.remove(dest)
+    shutil.copy(src, dest)
+
+
 class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
     """Multiple platform image builder"""
 
@@ -224,84 +245,95 @@ class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
         for log in logs_itr:
             LOGGER.info(f"[{platform}] {log}".strip())
 
-    # pylint: disable=too-many-arguments,too-many-locals
-    def _build_with_inject(
+    def _create_inject_context(
         self,
         inject: dict,
-        image_ref: str,
         path: str,
-        platform: str,
         dockerfile: str,
-        build_args: dict,
-        build_kwargs: dict,
+        tmp_dir: str,
         copy_source_path: bool = True,
-    ) -> None:
+    ) -> Optional[str]:
+        """
+        Materialize the build context with the injected files in the given temporary
+        directory, returning the context directory. The context is shared (read-only) by
+        the builds for all platforms, and files are hardlinked instead of copied where
+        the filesystem allows it.
+        """
         if not path or not os.path.isdir(path):
             LOGGER.warning(
-                f"Failed to inject {inject} for {image_ref} since path {path} isn't a directory."
+                f"Failed to inject {inject} since path {path} isn't a directory."
             )
-            return
+            return None
 
         dir_prefix = "mp-tmp-dir"
-        with tempfile.TemporaryDirectory(
-            dir=self._temp_dir, prefix=dir_prefix
-        ) as tmp_dir:
-            context_dir = os.path.join(tmp_dir, f"{dir_prefix}/")
-
-            if copy_source_path:
-                # Copy the entire source path as the build context
-                shutil.copytree(
-                    path,
-                    context_dir,
-                    ignore=shutil.ignore_patterns(dir_prefix, ".git"),
-                    symlinks=True,
-                )
-            else:
-                # Create an empty context directory
-                os.makedirs(context_dir, exist_ok=True)
+        context_dir = os.path.join(tmp_dir, f"{dir_prefix}/")
 
-            for src, dest in inject.items():
-                src_path = os.path.join(path, src)
+        if copy_source_path:
+            # Link the entire source path as the build context
+            shutil.copytree(
+                path,
+                context_dir,
+                ignore=shutil.ignore_patterns(dir_prefix, ".git"),
+                symlinks=True,
+                copy_function=_link_or_copy,
+            )
+        else:
+            # Create an empty context directory
+            os.makedirs(context_dir, exist_ok=True)
 
-                # Remove '/' prefix
-                if dest.startswith("/"):
-                    dest = dest[1:]
+        for src, dest in inject.items():
+            src_path = os.path.join(path, src)
 
-                dest_path = os.path.join(context_dir, dest)
+            # Remove '/' prefix
+            if dest.startswith("/"):
+                dest = dest[1:]
 
-                # Check to see if the dest dir exists, if not create it
-                dest_dir = os.path.dirname(dest_path)
-                if not os.path.isdir(dest_dir):
-                    os.makedirs(dest_dir, exist_ok=True)
+            dest_path = os.path.join(context_dir, dest)
 
-                # Copy source to destination
-                if os.path.isdir(src_path):
-                    shutil.copytree(src_path, dest_path)
-                else:
-                    shutil.copy(src_path, dest_path)
+            # Check to see if the dest dir exists, if not create it
+            dest_dir = os.path.dirname(dest_path)
+            if not os.path.isdir(dest_dir):
+                os.makedirs(dest_dir, exist_ok=True)
 
-            # Dockerfile listed in inject will overwrite the dockerfile passed in
-            if dockerfile and "Dockerfile" not in inject.values():
-                LOGGER.info(
-                    f"Injecting Dockerfile {dockerfile} to context directory '{context_dir}'"
-                )
-                shutil.copy(dockerfile, f"{context_dir}/Dockerfile")
+            # Copy source to destination
+            if os.path.isdir(src_path):
+                shutil.copytree(src_path, dest_path, copy_function=_link_or_copy)
+            else:
+                _replace_file(src_path, dest_path)
 
-            assert os.path.isdir(context_dir), (
-                f"Failed to create context dir {context_dir}"
+        # Dockerfile listed in inject will overwrite the dockerfile passed in
+        if dockerfile and "Dockerfile" not in inject.values():
+            LOGGER.info(
+                f"Injecting Dockerfile {dockerfile} to context directory '{context_dir}'"
             )
+            _replace_file(dockerfile, os.path.join(context_dir, "Dockerfile"))
 
-            logs_itr = docker.buildx.build(
-                context_dir,
-                build_args=build_args,
-                load=True,
-                platforms=[platform],
-                stream_logs=True,
-                tags=[image_ref],
-                **build_kwargs,
-                **self._get_build_cache_options(build_kwargs.get("builder")),
-            )
-            self._log_buildx(logs_itr, platform)
+        assert os.path.isdir(context_dir), f"Failed to create context dir {context_dir}"
+        return context_dir
+
+    def _build_with_inject(
+        self,
+        context_dir: Optional[str],
+        image_ref: str,
+        platform: str,
+        build_args: dict,
+        build_kwargs: dict,
+    ) -> None:
+        if not context_dir:
+            LOGGER.warning(f"No injected build context for {image_ref}.")
+            return
+
+        logs_itr = docker.buildx.build(
+            context_dir,
+            build_args=build_args,
+            load=True,
+            platforms=[platform],
+            stream_logs=True,
+            tags=[image_ref],
+            **build_kwargs,
+            **self._get_build_cache_options(build_kwargs.get("builder")),
+        )
+        self._log_buildx(logs_itr, platform)
 
     @staticmethod
     def _get_image_digest(image_ref: str) -> Optional[str]:
@@ -358,11 +390,11 @@ class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
         dockerfile: str,
         target: str,
         build_args: dict,
-        inject: dict,
+        inject_context: Optional[str],
         cache: Optional[bool] = None,
         pull: bool = False,
         secrets: Optional[List[str]] = None,
-        copy_source_path: bool = True,
+        use_inject_context: bool = False,
     ) -> None:
         """
         Builds a single image for the given platform.
@@ -375,9 +407,9 @@ class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
             dockerfile (str): The path/name of the Dockerfile (i.e. <path>/Dockerfile).
             target (str): The name of the stage to build in a multi-stage Dockerfile
             build_args (dict): The build args to pass to docker.
-            inject (dict): The files to inject into the build context.
+            inject_context (str): The shared build context directory with the injected files.
             secrets (List[str]): The secrets to pass to docker.
-            copy_source_path (bool): Whether to copy the source path into the build context.
+            use_inject_context (bool): Whether to build from the injected build context.
         """
         assert os.path.isdir(path) and os.path.exists(dockerfile), (
             f"Either path {path} ({os.path.isdir(path)}) or file "
@@ -420,16 +452,13 @@ class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
         if target:
             build_kwargs["target"] = target
 
-        if inject and isinstance(inject, dict):
+        if use_inject_context:
             self._build_with_inject(
-                path=path,
-                inject=inject,
+                context_dir=inject_context,
                 image_ref=image_ref,
                 platform=platform,
-                dockerfile=dockerfile,
                 build_args=build_args,
                 build_kwargs=build_kwargs,
-                copy_source_path=copy_source_path,
             )
         else:
             logs_itr = docker.buildx.build(
@@ -572,54 +601,76 @@ class MultiplatformImageBuilder:  # pylint: disable=too-many-instance-attributes
             )
             LOGGER.info(OUTPUT_LINE)
 
-        threads = []
-        LOGGER.info(
-            f"Starting builds for {len(platforms)} platforms in {'parallel' if use_threading else 'sequence'}"
+        # The build context with injected files is created once and shared by all platforms
+        use_inject_context = bool(inject and isinstance(inject, dict))
+        inject_context = None
+        # pylint: disable=consider-using-with
+        inject_tmp_dir = (
+            tempfile.TemporaryDirectory(dir=self._temp_dir, prefix="mp-tmp-dir")
+            if use_inject_context
+            else None
         )
+        try:
+            if inject_tmp_dir:
+                inject_context = self._create_inject_context(
+                    inject,
+                    path,
+                    dockerfile,
+                    inject_tmp_dir.name,
+                    copy_source_path=copy_source_path,
+                )
 
-        # Since threading may be used, use a simple queue to communicate with the build method
-        # This queue receives tuples of (image_ref, image_digest)
-        image_info_by_image_ref = {}
-        queue = SimpleQueue()
-        for platform in platforms:
-            tag = f"{built_image.id}-{platform.replace('/', '-')}"
-            image_ref = f"{repo}:{tag}"
-            # Contains all fields needed for the BuiltTaggedImage instance except digest, which will be added later
-            image_info_by_image_ref[image_ref] = {
-                "repo": repo,
-                "tag": tag,
-                "platform": platform,
-            }
-            build_single_image_args = (
-                queue,
-                image_ref,
-                platform,
-                path,
-                dockerfile,
-                target,
-                build_args,
-                inject,
-                cache,
-                pull,
-                secrets,
-                copy_source_path,
+            threads = []
+            LOGGER.info(
+                f"Starting builds for {len(platforms)} platforms in {'parallel' if use_threading else 'sequence'}"
             )
-            LOGGER.debug(f"Building {repo} for {platform}")
-            if use_threading:
-                threads.append(
-                    Thread(
-                        target=self._build_single_image,
-                        args=build_single_image_args,
-                    )
-                )
-            else:
-                self._build_single_image(*build_single_image_args)
 
-        # Start and join threads in parallel if enabled
-        for thread in threads:
-            thread.start()
-        for thread in threads:
-            thread.join()
+            # Since threading may be used, use a simple queue to communicate with the build method
+            # This queue receives tuples of (image_ref, image_digest)
+            image_info_by_image_ref = {}
+            queue = SimpleQueue()
+            for platform in platforms:
+                tag = f"{built_image.id}-{platform.replace('/', '-')}"
+                image_ref = f"{repo}:{tag}"
+                # Contains all fields needed for the BuiltTaggedImage instance except digest, which will be added later
+                image_info_by_image_ref[image_ref] = {
+                    "repo": repo,
+                    "tag": tag,
+                    "platform": platform,
+                }
+                build_single_image_args = (
+                    queue,
+                    image_ref,
+                    platform,
+                    path,
+                    dockerfile,
+                    target,
+                    build_args,
+                    inject_context,
+                    cache,
+                    pull,
+                    secrets,
+                    use_inject_context,
+                )
+                LOGGER.debug(f"Building {repo} for {platform}")
+                if use_threading:
+                    threads.append(
+                        Thread(
+                            target=self._build_single_image,
+                            args=build_single_image_args,
+                        )
+                    )
+                else:
+                    self._build_single_image(*build_single_image_args)
+
+            # Start and join threads in parallel if enabled
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            if inject_tmp_dir:
+                inject_tmp_dir.cleanup()
 
         while not queue.empty():
             image_ref, image_digest = queue.get()
@@ -0,0 +1,92 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import http.client
+import logging
+import os
+import platform
+import random
+import socket
+from typing import Iterator, Optional
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds each probe waits for the connection or the response
+PROBE_TIMEOUT = 1.0
+# The delays between probes double from the initial delay up to the maximum delay
+PROBE_INITIAL_DELAY = 0.1
+PROBE_MAX_DELAY = 5.0
+
+
+def can_probe_natively() -> bool:
+    """
+    Returns whether the container IP addresses can be probed from this process. Only
+    Linux hosts running the Docker daemon locally are attached to the bridge networks,
+    see https://github.com/docker/for-mac/issues/155 for mac.
+    """
+    if platform.system() != "Linux":
+        return False
+    docker_host = os.environ.get("DOCKER_HOST", "")
+    return not docker_host or docker_host.startswith("unix://")
+
+
+def get_backoff_delays(
+    initial: float = PROBE_INITIAL_DELAY, maximum: float = PROBE_MAX_DELAY
+) -> Iterator[float]:
+    """
+    Returns a generator of exponentially growing delays between probes, each one is
+    jittered down to half of its value so that concurrent builds do not probe in step.
+    """
+    delay = initial
+    while True:
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * 2, maximum)
+
+
+def probe_port(
+    ipaddr: str, port: int, timeout: float = PROBE_TIMEOUT
+) -> Optional[bool]:
+    """
+    Returns whether the given port accepts connections, or None when the address
+    cannot be reached from this process.
+    """
+    try:
+        with socket.create_connection((ipaddr, int(port)), timeout=timeout):
+            return True
+    except (ConnectionRefusedError, ConnectionResetError):
+        return False
+    except OSError as exc:
+        LOGGER.debug(f"Unable to reach {ipaddr}:{port}: {exc}")
+        return None
+
+
+def probe_http(
+    ipaddr: str, port: int, path: str, timeout: float = PROBE_TIMEOUT
+) -> Optional[bool]:
+    """
+    Returns whether a GET request of the given path succeeds with a status below 400,
+    or None when the address cannot be reached from this process.
+    """
+    connection = http.client.HTTPConnection(ipaddr, int(port), timeout=timeout)
+    try:
+        try:
+            connection.connect()
+        except (ConnectionRefusedError, ConnectionResetError):
+            return False
+        except OSError as exc:
+            LOGGER.debug(f"Unable to reach {ipaddr}:{port}: {exc}")
+            return None
+        # Once connected, a failed or slow response only means the service is not ready
+        try:
+            connection.request("GET", path)
+            return connection.getresponse().status < 400
+        except (OSError, http.client.HTTPException):
+            return False
+    finally:
+        connection.close()
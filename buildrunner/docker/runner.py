@@ -6,26 +6,63 @@ NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
 with the terms of the Adobe license agreement accompanying it.
 """
 
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import hashlib
 import io
 import os.path
 import platform
+import shlex
+import shutil
 import socket
+import sqlite3
 import ssl
+import threading
+import time
+import uuid
 from collections import OrderedDict
-from os import listdir
-from os.path import isfile, join, getmtime
-from pathlib import Path
+from os.path import join
 import tarfile
 from types import GeneratorType
-from typing import Optional, Union
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
 from docker.utils import compare_version
 from retry import retry
 import docker.errors
-import timeout_decorator
+import requests.exceptions
+import urllib3.exceptions
 
 from buildrunner import BuildRunnerConfig
+from buildrunner.caches.backend import RemoteCache, get_remote_cache
+from buildrunner.caches.chunks import copy_chunks
+from buildrunner.caches.codec import (
+    CacheCodec,
+    ChunkedCacheCodec,
+    get_codec_for_path,
+    is_valid_archive,
+    strip_archive_extension,
+)
+from buildrunner.caches.eviction import (
+    CACHE_TEMP_SUFFIX,
+    CacheEvictor,
+    mark_cache_used,
+    record_cache_project,
+)
+from buildrunner.caches.index import CacheIndex, scan_archives
+from buildrunner.caches.telemetry import (
+    CACHE_OPERATION_RESTORE,
+    CACHE_OPERATION_SAVE,
+    CACHE_RESULT_ERROR,
+    CACHE_RESULT_EXACT,
+    CACHE_RESULT_MISS,
+    CACHE_RESULT_PREFIX,
+    CACHE_RESULT_SAVED,
+    CACHE_RESULT_UNCHANGED,
+    create_cache_event,
+    record_cache_event,
+)
 from buildrunner.cleanup import register_container, unregister_container
 from buildrunner.docker import (
     new_client,
@@ -42,6 +79,16 @@ from buildrunner.utils import (
 
 CACHE_NUM_RETRIES = 2
 CACHE_TIMEOUT_SECONDS = 240
+# Lists the name, size, modification and change time of every file in a cache path,
+# the change time also covers writes that preserve the modification time. GNU find
+# prints the times with sub-second precision, other find implementations (e.g.
+# busybox) fall back to stat, which only has a one second resolution: a file
+# rewritten with the same size within the second it was restored goes unnoticed.
+CACHE_FINGERPRINT_COMMAND = (
+    "cd {path} && if find . -maxdepth 0 -printf '' 2>/dev/null; "
+    "then find . -printf '%p %s %T@ %C@\\n'; "
+    "else find . -exec stat -c '%n %s %Y %Z' {{}} +; fi"
+)
 
 
 class BuildRunnerCacheTimeout(Exception):
@@ -60,6 +107,128 @@ class BuildRunnerSavingCache(Exception):
     pass
 
 
+class _CacheLogger:
+    """
+    Prefixes the messages logged for a cache with its docker path, since the messages
+    of caches transferred concurrently are interleaved.
+    """
+
+    def __init__(self, logger: ContainerLogger, docker_path: str):
+        self._logger = logger
+        self._prefix = f"[{docker_path}] "
+
+    def debug(self, message: str) -> None:
+        self._logger.debug(f"{self._prefix}{message}")
+
+    def info(self, message: str) -> None:
+        self._logger.info(f"{self._prefix}{message}")
+
+    def warning(self, message: str) -> None:
+        self._logger.warning(f"{self._prefix}{message}")
+
+    def error(self, message: str) -> None:
+        self._logger.error(f"{self._prefix}{message}")
+
+    def exception(self, message: str) -> None:
+        self._logger.exception(f"{self._prefix}{message}")
+
+
+def _iter_with_timeout(chunks: Iterable[bytes], description: str) -> Iterator[bytes]:
+    """
+    Yield the given chunks, raising BuildRunnerCacheTimeout once the transfer takes
+    longer than CACHE_TIMEOUT_SECONDS. Unlike a signal based timeout this works on
+    any thread. A transfer that stalls without delivering a chunk is interrupted by
+    the socket timeout of the cache transfer client instead, see _transfer_timeout.
+    """
+    deadline = time.monotonic() + CACHE_TIMEOUT_SECONDS
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            raise BuildRunnerCacheTimeout(
+                f"Timed out after {CACHE_TIMEOUT_SECONDS} seconds {description}"
+            )
+        yield chunk
+
+
+_TIMEOUT_ERRORS = (
+    socket.timeout,
+    TimeoutError,
+    requests.exceptions.Timeout,
+    urllib3.exceptions.TimeoutError,
+)
+
+
+def _is_timeout(exc: Optional[BaseException]) -> bool:
+    """
+    Returns whether the given error was caused by a socket timeout, the docker client
+    wraps the timeouts of streamed requests in connection errors.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, _TIMEOUT_ERRORS):
+            return True
+        nested = [arg for arg in exc.args if isinstance(arg, BaseException)]
+        exc = exc.__cause__ or exc.__context__ or (nested[-1] if nested else None)
+    return False
+
+
+@contextlib.contextmanager
+def _transfer_timeout(description: str) -> Iterator[None]:
+    """
+    Raise BuildRunnerCacheTimeout for a cache transfer interrupted by a socket timeout.
+    """
+    try:
+        yield
+    except BuildRunnerCacheTimeout:
+        raise
+    except Exception as exc:  # pylint: disable=broad-except
+        if not _is_timeout(exc):
+            raise
+        raise BuildRunnerCacheTimeout(
+            f"Timed out after {CACHE_TIMEOUT_SECONDS} seconds without progress "
+            f"{description}"
+        ) from exc
+
+
+def _is_nested(path: str, parent: str) -> bool:
+    parent = parent.rstrip("/")
+    return path.rstrip("/") == parent or path.startswith(f"{parent}/")
+
+
+def _group_nested_paths(paths: List[str]) -> List[List[str]]:
+    """
+    Group the given paths so that paths nested in each other end up in the same
+    group, keeping their order.
+    """
+    groups: List[List[str]] = []
+    for path in paths:
+        matching = [
+            group
+            for group in groups
+            if any(
+                _is_nested(path, other) or _is_nested(other, path) for other in group
+            )
+        ]
+        merged = [path]
+        for group in matching:
+            groups.remove(group)
+            merged = group + merged
+        groups.append(sorted(merged, key=paths.index))
+    return groups
+
+
+def _get_mtime(path: Optional[str]) -> Optional[float]:
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def _run_all(jobs: List[Callable[[], None]]) -> None:
+    for job in jobs:
+        job()
+
+
 class DockerRunner:
     """
     An object that manages and orchestrates the lifecycle and execution of a
@@ -98,11 +267,23 @@ class DockerRunner:
             # Disable timeouts for running commands
             timeout=0,
         )
+        # Cache archives are transferred with a socket timeout, so that a stalled
+        # transfer is interrupted and retried
+        self.cache_client = new_client(
+            dockerd_url=dockerd_url,
+            timeout=CACHE_TIMEOUT_SECONDS,
+        )
         self.run_log_debug = run_log_debug
         self.container = None
         self.shell = None
         self.committed_image = None
         self.containers = []
+        # The cache archive restored to each docker path and the fingerprint of the
+        # path once all caches were restored
+        self._restored_caches: Dict[str, Tuple[str, Optional[str]]] = {}
+        # The telemetry records of the caches restored and saved in the container
+        self.cache_events: List[dict] = []
+        self._cache_events_lock = threading.Lock()
 
         # By default, pull the image.  If the pull_image parameter is
         # set to False, only pull the image if it can't be found locally
@@ -181,11 +362,13 @@ class DockerRunner:
         cpu_shares=None,
         cpu_period=None,
         cpu_quota=None,
+        labels=None,
     ):
         """
         Kwargs:
           volumes (dict): mount the local dir (key) to the given container
                           path (value)
+          labels (dict): labels added to the configured container labels
         """
         if self.container:
             raise BuildRunnerContainerError("Container already started")
@@ -242,6 +425,10 @@ class DockerRunner:
         if ports:
             _port_list = list(ports.keys())
 
+        _labels = BuildRunnerConfig.get_instance().container_labels
+        if labels:
+            _labels = {**(_labels or {}), **labels}
+
         # check args
         if dns_search and isinstance(dns_search, str):
             dns_search = dns_search.split(",")
@@ -257,7 +444,7 @@ class DockerRunner:
             "user": user,
             "working_dir": working_dir,
             "hostname": hostname,
-            "labels": BuildRunnerConfig.get_instance().container_labels,
+            "labels": _labels,
             "host_config": self.docker_client.create_host_config(
                 binds=_binds,
                 links=links,
@@ -386,19 +573,22 @@ class DockerRunner:
             )
             return None
 
-        files = [f for f in listdir(cache_dir) if isfile(join(cache_dir, f))]
-
-        cache_key = Path(local_cache_archive_file).stem
+        # Archives written with any codec match, so that changing the codec (or
+        # upgrading from uncompressed archives) still finds the existing caches
+        cache_key = strip_archive_extension(os.path.basename(local_cache_archive_file))
 
-        most_recent_time = 0
-        local_cache_archive_match = None
-        for file_name in files:
-            if file_name.startswith(cache_key):
-                curr_archive_file = join(cache_dir, file_name)
-                mod_time = getmtime(curr_archive_file)
-                if mod_time > most_recent_time:
+        try:
+            local_cache_archive_match = CacheIndex(cache_dir).find_latest(cache_key)
+        except sqlite3.Error as exc:
+            logger.warning(
+                f"Unable to use the cache index in {cache_dir}, scanning the directory: {exc}"
+            )
+            most_recent_time = 0
+            local_cache_archive_match = None
+            for file_name, _, mod_time in scan_archives(cache_dir):
+                if file_name.startswith(cache_key) and mod_time > most_recent_time:
                     most_recent_time = mod_time
-                    local_cache_archive_match = curr_archive_file
+                    local_cache_archive_match = join(cache_dir, file_name)
 
         if local_cache_archive_match is None:
             logger.info(
@@ -413,120 +603,436 @@ class DockerRunner:
 
         return local_cache_archive_match
 
+    @staticmethod
+    def _run_cache_transfers(jobs: List[Callable[[], None]]) -> None:
+        """
+        Run the given cache transfers on a bounded thread pool, raising the first
+        error once all transfers are done.
+        """
+        max_workers = min(
+            BuildRunnerConfig.get_instance().global_config.caches.concurrency,
+            len(jobs),
+        )
+        if max_workers <= 1:
+            for job in jobs:
+                job()
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="buildrunner-cache"
+        ) as executor:
+            futures = [executor.submit(job) for job in jobs]
+        for future in futures:
+            future.result()
+
     @retry(exceptions=BuildRunnerCacheTimeout, tries=CACHE_NUM_RETRIES)
-    @timeout_decorator.timeout(
-        seconds=CACHE_TIMEOUT_SECONDS, timeout_exception=BuildRunnerCacheTimeout
-    )
-    def _put_cache_in_container(self, docker_path: str, file_obj: io.IOBase) -> bool:
+    def _put_cache_in_container(
+        self, docker_path: str, file_obj: io.IOBase, codec: CacheCodec
+    ) -> bool:
         """
         Insert a file or folder in an existing container using a tar archive as
-        source.
+        source, decompressing the archive while it is streamed to the container.
 
         :param docker_path: Path of file or folder in the container
         :param file_obj: Opened file object of cache
+        :param codec: The codec the cache archive was written with
         :return: True if the call succeeds.
         """
-        return self.docker_client.put_archive(
-            self.container["Id"], docker_path, file_obj
-        )
+        # Start from the beginning of the archive when the call is retried
+        file_obj.seek(0)
+        with _transfer_timeout(f"restoring {docker_path}"):
+            return self.cache_client.put_archive(
+                self.container["Id"],
+                docker_path,
+                _iter_with_timeout(
+                    codec.get_put_archive_data(file_obj), f"restoring {docker_path}"
+                ),
+            )
 
-    def restore_caches(self, logger: ContainerLogger, caches: OrderedDict) -> None:
+    @staticmethod
+    def _get_cache_name(cache_archive_file: str) -> str:
         """
-        Restores caches from the host system to the destination location in the docker container.
+        Returns the name of the cache archive file recorded in the cache telemetry.
         """
-        if caches is None or not isinstance(caches, OrderedDict):
-            raise TypeError(
-                f"Caches should be type OrderDict instead of {type(caches)}"
-            )
+        return os.path.relpath(
+            cache_archive_file,
+            os.path.expanduser(
+                BuildRunnerConfig.get_instance().global_config.caches_root
+            ),
+        )
 
-        restored_cache_src = set()
-        for local_cache_archive_file, docker_path in caches.items():
-            if docker_path in restored_cache_src:
-                logger.info(
-                    f"Cache for destination path {docker_path} has already been matched and restored to the container, "
-                    f"skipping {local_cache_archive_file}"
-                )
-                continue
+    def _record_cache_event(self, event: dict) -> None:
+        # Caches are restored concurrently, keep the events in the same order here
+        # and in the telemetry file
+        with self._cache_events_lock:
+            self.cache_events.append(event)
+            record_cache_event(
+                BuildRunnerConfig.get_instance().global_config.caches_root, event
+            )
 
+    def _find_and_restore_cache(
+        self,
+        logger: "_CacheLogger",
+        docker_path: str,
+        local_cache_archive_files: List[str],
+        remote_cache: Optional[RemoteCache],
+        env_vars: Optional[dict],
+    ) -> None:
+        """
+        Restore the archive of the first cache key with a local or remote match to the
+        docker path, downloading the remote archive when it is newer than the local
+        one. The later keys of the chain are only used if the matched archive is
+        evicted before it is restored.
+        """
+        event = create_cache_event(
+            CACHE_OPERATION_RESTORE,
+            docker_path,
+            self._get_cache_name(local_cache_archive_files[0]),
+            env_vars,
+        )
+        for index, local_cache_archive_file in enumerate(local_cache_archive_files):
             # Check for prefix matching
             actual_cache_archive_file = self._get_cache_file_from_prefix(
                 logger, local_cache_archive_file, docker_path
             )
-            if actual_cache_archive_file is None:
-                # Errors are printed out in the other method
-                continue
+            if remote_cache:
+                # Download the remote match when it is newer than the local one
+                local_match = actual_cache_archive_file
+                local_mtime = _get_mtime(local_match)
+                actual_cache_archive_file = remote_cache.fetch(
+                    logger,
+                    local_cache_archive_file,
+                    actual_cache_archive_file,
+                )
+                # A downloaded archive has the remote modification time, which is
+                # newer than the local match it replaces
+                event["remote"] = actual_cache_archive_file is not None and (
+                    actual_cache_archive_file != local_match
+                    or _get_mtime(actual_cache_archive_file) != local_mtime
+                )
+            if actual_cache_archive_file is not None:
+                break
+        else:
+            event["result"] = CACHE_RESULT_MISS
+            self._record_cache_event(event)
+            return
+
+        event["tier"] = index + 1
+        event["tier_key"] = self._get_cache_name(local_cache_archive_file)
+        if self.run(["mkdir", "-p", docker_path]):
+            logger.warning(
+                f"There was an issue creating {docker_path} on the docker container"
+            )
+        self._restore_cache(
+            logger,
+            docker_path,
+            actual_cache_archive_file,
+            local_cache_archive_files[index + 1 :],
+            event,
+        )
 
-            orig_shell = self.shell
+    def _restore_cache(
+        self,
+        logger: "_CacheLogger",
+        docker_path: str,
+        actual_cache_archive_file: str,
+        remaining_cache_archive_files: List[str],
+        event: dict,
+    ) -> None:
+        """
+        Restore the given cache archive to the docker path. If the archive is evicted
+        before it is opened, the remaining cache keys for the docker path are tried.
+        The telemetry record of the restore is completed and recorded.
+        """
+        start_time = time.monotonic()
+        remaining = list(remaining_cache_archive_files)
+        event["result"] = CACHE_RESULT_MISS
+        while actual_cache_archive_file:
             file_obj = None
+            event["archive"] = self._get_cache_name(actual_cache_archive_file)
             try:
-                self.shell = "/bin/sh"
-                exit_code = self.run(f"mkdir -p {docker_path}")
-                if exit_code:
-                    logger.warning(
-                        f"There was an issue creating {docker_path} on the docker container"
-                    )
-
-                # Allow multiple people to read from the file at the same time
-                # If another instance adds an exclusive lock in the save method below,
-                # this will block until the lock is released
+                # Allow multiple people to read from the file at the same time. Saving
+                # a cache replaces the file atomically instead of locking it, so this
+                # only waits for older versions that write to the archive in place
+                lock_start_time = time.monotonic()
                 file_obj = acquire_flock_open_read_binary(
                     lock_file=actual_cache_archive_file, logger=logger
                 )
+                event["lock_wait_seconds"] += time.monotonic() - lock_start_time
+                event["bytes"] = os.fstat(file_obj.fileno()).st_size
                 logger.info(
                     "File lock acquired. Attempting to put cache into the container."
                 )
 
-                restored_cache_src.add(docker_path)
-                if not self._put_cache_in_container(docker_path, file_obj):
+                if not self._put_cache_in_container(
+                    docker_path,
+                    file_obj,
+                    get_codec_for_path(actual_cache_archive_file),
+                ):
+                    event["result"] = CACHE_RESULT_ERROR
                     logger.warning(
                         f"An error occurred when trying to use cache "
                         f"{actual_cache_archive_file} at the path {docker_path}"
                     )
+                else:
+                    event["result"] = (
+                        CACHE_RESULT_EXACT
+                        if event["archive"] == event["tier_key"]
+                        else CACHE_RESULT_PREFIX
+                    )
+                    mark_cache_used(actual_cache_archive_file)
+                    self._restored_caches[docker_path] = (
+                        actual_cache_archive_file,
+                        None,
+                    )
+                    logger.info(
+                        f"Cache was put into the container from cache key tier "
+                        f"{event['tier']} [{event['tier_key']}]."
+                    )
+                break
 
+            except FileNotFoundError:
+                logger.warning(
+                    f"Cache {actual_cache_archive_file} was evicted before it could be restored"
+                )
+                actual_cache_archive_file = None
+                event["archive"] = None
+                event["bytes"] = 0
+                while remaining and not actual_cache_archive_file:
+                    local_cache_archive_file = remaining.pop(0)
+                    event["tier"] += 1
+                    event["tier_key"] = self._get_cache_name(local_cache_archive_file)
+                    actual_cache_archive_file = self._get_cache_file_from_prefix(
+                        logger, local_cache_archive_file, docker_path
+                    )
             except docker.errors.APIError:
+                event["result"] = CACHE_RESULT_ERROR
                 logger.exception("Encountered exception")
+                break
+            except Exception:
+                event["result"] = CACHE_RESULT_ERROR
+                event["seconds"] = time.monotonic() - start_time
+                self._record_cache_event(event)
+                raise
             finally:
-                self.shell = orig_shell
                 release_flock(file_obj, logger)
-                logger.info("Cache was put into the container. Released file lock.")
+        event["seconds"] = time.monotonic() - start_time
+        self._record_cache_event(event)
+
+        for local_cache_archive_file in remaining:
+            logger.info(
+                f"Cache for destination path {docker_path} has already been matched and restored to the container, "
+                f"skipping {local_cache_archive_file}"
+            )
+
+    def restore_caches(
+        self,
+        logger: ContainerLogger,
+        caches: OrderedDict,
+        env_vars: Optional[dict] = None,
+    ) -> None:
+        """
+        Restores caches from the host system to the destination location in the docker container.
+
+        The cache keys for each destination path are tried in order and the first match
+        is restored. Different destination paths are restored concurrently, except
+        for paths that are nested in each other which are restored in order. The step
+        name and project are read from the environment variables for the telemetry.
+        """
+        if caches is None or not isinstance(caches, OrderedDict):
+            raise TypeError(
+                f"Caches should be type OrderDict instead of {type(caches)}"
+            )
+
+        # Group the cache keys by destination path, keeping their order
+        cache_keys = OrderedDict()
+        for local_cache_archive_file, docker_path in caches.items():
+            cache_keys.setdefault(docker_path, []).append(local_cache_archive_file)
+
+        global_config = BuildRunnerConfig.get_instance().global_config
+        remote_cache = get_remote_cache(
+            global_config.caches_root, global_config.caches.backend
+        )
+        # Remote archives are looked up and downloaded by the restore of each path, so
+        # that downloads overlap with each other and with the transfers
+        restores = OrderedDict(
+            (
+                docker_path,
+                functools.partial(
+                    self._find_and_restore_cache,
+                    _CacheLogger(logger, docker_path),
+                    docker_path,
+                    local_cache_archive_files,
+                    remote_cache,
+                    env_vars,
+                ),
+            )
+            for docker_path, local_cache_archive_files in cache_keys.items()
+        )
+        orig_shell = self.shell
+        try:
+            # The docker paths are created before their archive is put
+            self.shell = "/bin/sh"
+            self._run_cache_transfers([
+                functools.partial(_run_all, [restores[path] for path in paths])
+                for paths in _group_nested_paths(list(restores))
+            ])
+        finally:
+            self.shell = orig_shell
+
+        if global_config.caches.skip_unchanged:
+            # Taken once every cache is restored since restoring a nested path changes
+            # the path containing it
+            for docker_path, (archive_file, _) in list(self._restored_caches.items()):
+                self._restored_caches[docker_path] = (
+                    archive_file,
+                    self._get_cache_fingerprint(docker_path),
+                )
+
+    def _get_cache_fingerprint(self, docker_path: str) -> Optional[str]:
+        """
+        Returns a fingerprint of the files in the docker path computed from their
+        names, sizes and times without reading their content, or None if it cannot
+        be computed (e.g. the image does not have a shell or stat).
+        """
+        try:
+            exec_id = self.docker_client.exec_create(
+                self.container["Id"],
+                [
+                    "/bin/sh",
+                    "-c",
+                    CACHE_FINGERPRINT_COMMAND.format(path=shlex.quote(docker_path)),
+                ],
+                stdout=True,
+                stderr=False,
+                tty=False,
+            )
+            digest = hashlib.sha256()
+            for chunk in self.docker_client.exec_start(exec_id, stream=True):
+                digest.update(chunk)
+            if self.docker_client.exec_inspect(exec_id).get("ExitCode") != 0:
+                return None
+        except docker.errors.APIError:
+            return None
+        return digest.hexdigest()
+
+    def _is_cache_unchanged(
+        self,
+        logger: "_CacheLogger",
+        docker_path: str,
+        local_cache_archive_file: str,
+    ) -> bool:
+        """
+        Returns True if the cache archive file was restored to the docker path and the
+        files in the docker path did not change since.
+        """
+        archive_file, fingerprint = self._restored_caches.get(docker_path, (None, None))
+        if (
+            not fingerprint
+            or archive_file != local_cache_archive_file
+            or not os.path.exists(archive_file)
+        ):
+            return False
+        if self._get_cache_fingerprint(docker_path) != fingerprint:
+            return False
+        logger.info(
+            f"Cache {docker_path} did not change since it was restored, "
+            f"skipping save to {local_cache_archive_file}"
+        )
+        return True
 
     @retry(exceptions=BuildRunnerCacheTimeout, tries=CACHE_NUM_RETRIES)
-    @timeout_decorator.timeout(
-        seconds=CACHE_TIMEOUT_SECONDS, timeout_exception=BuildRunnerCacheTimeout
-    )
-    def _write_cache(self, docker_path: str, file_obj: io.IOBase):
+    def _write_cache(self, docker_path: str, file_obj: io.IOBase, codec: CacheCodec):
         """
-        Write cache locally from file or folder in a running container
+        Write cache locally from file or folder in a running container, compressing
+        the archive while it is streamed from the container
 
         :param docker_path: Path of file or folder in the container
         :param file_obj: Opened file object to write cache
+        :param codec: The codec to write the cache archive with
         """
-        bits, _ = self.docker_client.get_archive(
-            self.container["Id"], f"{docker_path}/."
+        # Start from scratch when the call is retried
+        file_obj.seek(0)
+        file_obj.truncate()
+        with _transfer_timeout(f"saving {docker_path}"):
+            bits, _ = self.cache_client.get_archive(
+                self.container["Id"], f"{docker_path}/."
+            )
+            with codec.open_writer(file_obj) as writer:
+                for chunk in _iter_with_timeout(bits, f"saving {docker_path}"):
+                    writer.write(chunk)
+
+    def _publish_cache(
+        self,
+        logger: ContainerLogger,
+        docker_path: str,
+        local_cache_archive_file: str,
+        codec: CacheCodec,
+    ) -> int:
+        """
+        Writes the cache to a temporary file next to the cache archive file and
+        atomically replaces the archive file once the archive is complete. Builds
+        restoring the cache keep reading the previous archive while the new one is
+        written, and a failed save never leaves a partial archive behind.
+
+        :param logger: The logger to write log messages to
+        :param docker_path: Path of the folder in the container
+        :param local_cache_archive_file: The cache archive file to publish
+        :param codec: The codec to write the cache archive with
+        :return: The size of the published archive
+        """
+        cache_dir, file_name = os.path.split(local_cache_archive_file)
+        # Temporary files are hidden and do not have an archive extension, so they
+        # never match a cache prefix
+        tmp_file_name = os.path.join(
+            cache_dir, f".{file_name}.{uuid.uuid4().hex[:12]}{CACHE_TEMP_SUFFIX}"
         )
-        for chunk in bits:
-            file_obj.write(chunk)
+        try:
+            with open(tmp_file_name, "xb") as file_obj:
+                logger.info(f"Attempting to write cache to {tmp_file_name}")
+                self._write_cache(docker_path, file_obj, codec)
+            if not is_valid_archive(tmp_file_name, codec):
+                raise BuildRunnerSavingCache(
+                    f"Failed to create cache {local_cache_archive_file} tar file."
+                )
+            size = os.path.getsize(tmp_file_name)
+            os.replace(tmp_file_name, local_cache_archive_file)
+            logger.info(
+                f"Writing to cache completed, published {local_cache_archive_file}"
+            )
+            return size
+        except BuildRunnerSavingCache:
+            raise
+        except Exception as e:
+            raise BuildRunnerSavingCache(
+                f"There was an error saving cache to {local_cache_archive_file}.\nException: {e}"
+            )
+        finally:
+            if os.path.exists(tmp_file_name):
+                os.remove(tmp_file_name)
 
     def write_cache_history_log(
         self,
         log_str: str,
         cache_location: str,
         logger: ContainerLogger,
-    ) -> None:
+    ) -> float:
         """
         Writes the cache log to a file in the cache location.
 
         :param log_str: The log string to write to the file
         :param cache_location: The location of the cache file
         :param logger: The logger to write log messages to
+        :return: The number of seconds spent waiting for the file lock
         """
 
         cache_history_log = f"{cache_location}/cache_history.log"
         file_obj = None
         try:
+            lock_start_time = time.monotonic()
             file_obj = acquire_flock_open_write_binary(
                 lock_file=cache_history_log, logger=logger, mode="a"
             )
+            lock_wait_seconds = time.monotonic() - lock_start_time
             logger.info(
                 f"File lock acquired. Attempting to write cache history log to {cache_history_log}"
             )
@@ -534,61 +1040,232 @@ class DockerRunner:
         finally:
             release_flock(file_obj, logger)
             logger.info("Writing to cache history log completed, released file lock")
+        return lock_wait_seconds
+
+    def _save_cache(
+        self,
+        logger: "_CacheLogger",
+        docker_path: str,
+        local_cache_archive_file: str,
+        env_vars: dict,
+        linked_cache_archive_files: Iterable[str] = (),
+    ) -> None:
+        """
+        Save the docker path to the cache archive file and record the telemetry of the
+        save. The archive then replaces the linked cache archive files as well.
+        """
+        start_time = time.monotonic()
+        event = create_cache_event(
+            CACHE_OPERATION_SAVE,
+            docker_path,
+            self._get_cache_name(local_cache_archive_file),
+            env_vars,
+        )
+        event["archive"] = event["key"]
+        try:
+            self._save_cache_archive(
+                logger, docker_path, local_cache_archive_file, env_vars, event
+            )
+            event["linked_keys"] = [
+                self._get_cache_name(linked_file)
+                for linked_file in self._link_cache_archive(
+                    logger,
+                    local_cache_archive_file,
+                    linked_cache_archive_files,
+                    env_vars,
+                )
+            ]
+        except Exception:
+            event["result"] = CACHE_RESULT_ERROR
+            raise
+        finally:
+            event["seconds"] = time.monotonic() - start_time
+            self._record_cache_event(event)
+
+    def _link_cache_archive(
+        self,
+        logger: "_CacheLogger",
+        local_cache_archive_file: str,
+        linked_cache_archive_files: Iterable[str],
+        env_vars: dict,
+    ) -> List[str]:
+        """
+        Replace the linked cache archive files with the saved archive, using a hard
+        link when they are on the same file system and a copy otherwise. Archives are
+        always replaced instead of written in place, so the links never change
+        afterwards. Chunked archives linked into another directory bring their chunks
+        into the chunk store of that directory. Returns the replaced archive files.
+        """
+        caches_root = BuildRunnerConfig.get_instance().global_config.caches_root
+        is_chunked = isinstance(
+            get_codec_for_path(local_cache_archive_file), ChunkedCacheCodec
+        )
+        linked = []
+        for linked_file in linked_cache_archive_files:
+            cache_dir, file_name = os.path.split(linked_file)
+            tmp_file_name = os.path.join(
+                cache_dir, f".{file_name}.{uuid.uuid4().hex[:12]}{CACHE_TEMP_SUFFIX}"
+            )
+            try:
+                if is_chunked and os.path.abspath(cache_dir) != os.path.abspath(
+                    os.path.dirname(local_cache_archive_file)
+                ):
+                    copy_chunks(local_cache_archive_file, cache_dir)
+                try:
+                    os.link(local_cache_archive_file, tmp_file_name)
+                except OSError as exc:
+                    logger.debug(f"Unable to link {local_cache_archive_file}: {exc}")
+                    shutil.copyfile(local_cache_archive_file, tmp_file_name)
+                os.replace(tmp_file_name, linked_file)
+            except (OSError, ValueError) as exc:
+                logger.warning(f"Unable to save cache {linked_file}: {exc}")
+                continue
+            finally:
+                if os.path.exists(tmp_file_name):
+                    os.remove(tmp_file_name)
+            try:
+                CacheIndex(cache_dir).add(linked_file)
+            except sqlite3.Error as exc:
+                logger.warning(f"Unable to update the cache index: {exc}")
+            if env_vars.get("VCSINFO_NAME"):
+                record_cache_project(caches_root, linked_file, env_vars["VCSINFO_NAME"])
+            logger.info(f"Saved cache {linked_file} from {local_cache_archive_file}")
+            linked.append(linked_file)
+        return linked
+
+    def _save_cache_archive(
+        self,
+        logger: "_CacheLogger",
+        docker_path: str,
+        local_cache_archive_file: str,
+        env_vars: dict,
+        event: dict,
+    ) -> None:
+        """
+        Save the docker path to the cache archive file unless it did not change since
+        it was restored, filling in the telemetry record.
+        """
+        global_config = BuildRunnerConfig.get_instance().global_config
+        caches_config = global_config.caches
+        if caches_config.skip_unchanged and self._is_cache_unchanged(
+            logger, docker_path, local_cache_archive_file
+        ):
+            event["result"] = CACHE_RESULT_UNCHANGED
+            return
+        logger.info(
+            f"Saving cache {docker_path} "
+            f"running on container {self.container['Id']} "
+            f"to local cache {local_cache_archive_file}"
+        )
+
+        log_line = (
+            f"{datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')} - "
+            f'The cache file "{local_cache_archive_file}" '
+            f'was written by step "{env_vars.get("BUILDRUNNER_STEP_NAME")}" in '
+            f'"{env_vars.get("VCSINFO_NAME")}:{env_vars.get("VCSINFO_BRANCH")}:{env_vars.get("VCSINFO_SHORT_ID")}" '
+            f"on host "
+            f'"{socket.gethostname()}" [{env_vars.get("BUILDRUNNER_ARCH")}] '
+            "\n"
+        )
+
+        event["lock_wait_seconds"] = self.write_cache_history_log(
+            log_line, os.path.dirname(local_cache_archive_file), logger
+        )
+
+        event["bytes"] = self._publish_cache(
+            logger,
+            docker_path,
+            local_cache_archive_file,
+            get_codec_for_path(
+                local_cache_archive_file,
+                level=caches_config.level,
+                threads=caches_config.threads,
+            ),
+        )
+        event["result"] = CACHE_RESULT_SAVED
+        try:
+            CacheIndex(os.path.dirname(local_cache_archive_file)).add(
+                local_cache_archive_file
+            )
+        except sqlite3.Error as exc:
+            logger.warning(f"Unable to update the cache index: {exc}")
+        if env_vars.get("VCSINFO_NAME"):
+            record_cache_project(
+                global_config.caches_root,
+                local_cache_archive_file,
+                env_vars["VCSINFO_NAME"],
+            )
+        remote_cache = get_remote_cache(
+            global_config.caches_root, caches_config.backend
+        )
+        if remote_cache:
+            remote_cache.publish(logger, local_cache_archive_file)
 
     def save_caches(
-        self, logger: ContainerLogger, caches: OrderedDict, env_vars: dict = dict()
+        self,
+        logger: ContainerLogger,
+        caches: OrderedDict,
+        env_vars: dict = dict(),
+        save_all_paths: Iterable[str] = (),
     ) -> None:
         """
         Saves caches from a source locations in the docker container to locations on the host system as archive file.
+
+        Only the first cache key of each docker path is saved, except for the docker
+        paths in save_all_paths: their archive is transferred once and then linked (or
+        copied) to the other keys. Different docker paths are saved concurrently.
         """
-        saved_cache_src = set()
+        cache_keys = OrderedDict()
         if caches and isinstance(caches, OrderedDict):
             for local_cache_archive_file, docker_path in caches.items():
-                if docker_path not in saved_cache_src:
-                    saved_cache_src.add(docker_path)
-                    logger.info(
-                        f"Saving cache {docker_path} "
-                        f"running on container {self.container['Id']} "
-                        f"to local cache {local_cache_archive_file}"
-                    )
-
-                    log_line = (
-                        f"{datetime.datetime.now().strftime('%m/%d/%Y %H:%M:%S')} - "
-                        f'The cache file "{local_cache_archive_file}" '
-                        f'was written by step "{env_vars.get("BUILDRUNNER_STEP_NAME")}" in '
-                        f'"{env_vars.get("VCSINFO_NAME")}:{env_vars.get("VCSINFO_BRANCH")}:{env_vars.get("VCSINFO_SHORT_ID")}" '
-                        f"on host "
-                        f'"{socket.gethostname()}" [{env_vars.get("BUILDRUNNER_ARCH")}] '
-                        "\n"
-                    )
-
-                    self.write_cache_history_log(
-                        log_line, os.path.dirname(local_cache_archive_file), logger
-                    )
-
-                    file_obj = None
-                    try:
-                        file_obj = acquire_flock_open_write_binary(
-                            lock_file=local_cache_archive_file, logger=logger
-                        )
-                        logger.info("File lock acquired. Attempting to write to cache.")
-                        self._write_cache(docker_path, file_obj)
-                    except Exception as e:
-                        raise BuildRunnerSavingCache(
-                            f"There was an error saving cache to {local_cache_archive_file}.\nException: {e}"
-                        )
-                    finally:
-                        release_flock(file_obj, logger)
-                        assert tarfile.is_tarfile(local_cache_archive_file), (
-                            f"Failed to create cache {local_cache_archive_file} tar file."
-                        )
-                        logger.info("Writing to cache completed. Released file lock.")
+                if docker_path not in cache_keys:
+                    cache_keys[docker_path] = [local_cache_archive_file]
+                elif docker_path in save_all_paths:
+                    cache_keys[docker_path].append(local_cache_archive_file)
                 else:
                     logger.info(
                         f"The following `{docker_path}` in docker has already been saved. "
                         f"It will not be saved again to `{local_cache_archive_file}`"
                     )
 
+            if cache_keys:
+                try:
+                    self._run_cache_transfers([
+                        functools.partial(
+                            self._save_cache,
+                            _CacheLogger(logger, docker_path),
+                            docker_path,
+                            local_cache_archive_files[0],
+                            env_vars,
+                            local_cache_archive_files[1:],
+                        )
+                        for docker_path, local_cache_archive_files in cache_keys.items()
+                    ])
+                finally:
+                    self._evict_caches(logger)
+
+    @staticmethod
+    def _evict_caches(logger: ContainerLogger) -> None:
+        """
+        Evict the least recently used caches if the caches root is over its quotas.
+        Failing to evict caches does not fail the build.
+        """
+        global_config = BuildRunnerConfig.get_instance().global_config
+        try:
+            evicted = CacheEvictor(
+                global_config.caches_root,
+                max_size=global_config.caches.max_size,
+                max_project_size=global_config.caches.max_project_size,
+            ).evict()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning(f"Unable to evict caches: {exc}")
+            return
+        if evicted:
+            logger.info(
+                f"Evicted {len(evicted)} least recently used cache(s) freeing "
+                f"{sum(archive.size for archive in evicted)} bytes"
+            )
+
     def run(self, cmd, console=None, stream=True, log=None, workdir=None):
         """
         Run the given command in the container.
@@ -672,6 +1349,81 @@ class DockerRunner:
             return inspect_res["ExitCode"]
         raise BuildRunnerContainerError("Error running cmd: no exit code")
 
+    def run_with_output(
+        self,
+        cmd: Union[str, List[str]],
+        log: Union[ConsoleLogger, ContainerLogger, None] = None,
+    ) -> Tuple[int, bytes]:
+        """
+        Run the given command in the container, returning the exit code and the
+        standard output of the command. Only the standard error of the command is
+        logged to the given log.
+        """
+        if not self.container:
+            raise BuildRunnerContainerError("Container has not been started")
+        cmdv = [self.shell or "/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd
+        exec_id = self.docker_client.exec_create(
+            self.container["Id"],
+            cmdv,
+            stdout=True,
+            stderr=log is not None,
+            tty=False,
+        )
+        output, error_output = self.docker_client.exec_start(
+            exec_id, stream=False, demux=True
+        )
+        if error_output:
+            self._run_log(log, error_output)
+        exit_code = self.docker_client.exec_inspect(exec_id).get("ExitCode")
+        if exit_code is None:
+            raise BuildRunnerContainerError(
+                f"Error running cmd ({cmd}): exit code is None"
+            )
+        return exit_code, output or b""
+
+    def run_to_file(
+        self, cmd: Union[str, List[str]], file_obj: io.IOBase
+    ) -> Tuple[int, bytes]:
+        """
+        Run the given command in the container, writing its standard output to the
+        given file object while it is streamed. Returns the exit code and the standard
+        error of the command.
+        """
+        if not self.container:
+            raise BuildRunnerContainerError("Container has not been started")
+        cmdv = [self.shell or "/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd
+        exec_id = self.docker_client.exec_create(
+            self.container["Id"],
+            cmdv,
+            stdout=True,
+            stderr=True,
+            tty=False,
+        )
+        error_output = bytearray()
+        for output, error in self.docker_client.exec_start(
+            exec_id, stream=True, demux=True
+        ):
+            if output:
+                file_obj.write(output)
+            if error:
+                error_output += error
+        exit_code = self.docker_client.exec_inspect(exec_id).get("ExitCode")
+        if exit_code is None:
+            raise BuildRunnerContainerError(
+                f"Error running cmd ({cmd}): exit code is None"
+            )
+        return exit_code, bytes(error_output)
+
+    def stream_archive(self, path: str) -> Iterator[bytes]:
+        """
+        Returns the tar archive of the given file or directory in the container as a
+        stream of chunks, the archive is rooted at the base name of the path.
+        """
+        if not self.container:
+            raise BuildRunnerContainerError("Container has not been started")
+        bits, _ = self.docker_client.get_archive(self.container["Id"], path)
+        return bits
+
     def run_script(
         self,
         script,
@@ -0,0 +1,544 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import stat
+import tarfile
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import portalocker
+from retry import retry
+
+from buildrunner.source.git import get_clean_blobs, list_files
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Directory (relative to the caches root) where source archives and manifests are kept
+SOURCE_ARCHIVE_DIR = "source"
+SOURCE_MANIFEST_DIR = "manifests"
+MANIFEST_VERSION = 1
+# All archive entries use the same mtime and ownership so that the same tree
+# always produces a byte-identical archive
+SOURCE_ARCHIVE_MTIME = 0
+# Archives that have not been used by any build for this long may be pruned
+SOURCE_ARCHIVE_RETENTION_SECONDS = 3600
+HASH_BLOCK_SIZE = 2**20
+
+ENTRY_DIR = "d"
+ENTRY_FILE = "f"
+ENTRY_SYMLINK = "l"
+
+
+class SourceEntry:  # pylint: disable=too-few-public-methods
+    """
+    A single file, directory or symlink in the source tree. The sha256 attribute
+    identifies the file content, it is either a sha256 hex digest or a git blob id.
+    """
+
+    __slots__ = (
+        "path",
+        "kind",
+        "mode",
+        "size",
+        "mtime_ns",
+        "inode",
+        "sha256",
+        "linkname",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        kind: str,
+        mode: int,
+        size: int = 0,
+        mtime_ns: int = 0,
+        inode: int = 0,
+        sha256: str = "",
+        linkname: str = "",
+    ):  # pylint: disable=too-many-arguments
+        self.path = path
+        self.kind = kind
+        self.mode = mode
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.inode = inode
+        self.sha256 = sha256
+        self.linkname = linkname
+
+    def stat_matches(self, other: Optional["SourceEntry"]) -> bool:
+        """
+        Returns true if the other entry has the same stat information, meaning
+        its content hash may be reused without reading the file again.
+        """
+        return (
+            other is not None
+            and other.kind == self.kind
+            and other.mode == self.mode
+            and other.size == self.size
+            and other.mtime_ns == self.mtime_ns
+            and other.inode == self.inode
+            and bool(other.sha256)
+        )
+
+    def to_list(self) -> list:
+        return [
+            self.kind,
+            self.mode,
+            self.size,
+            self.mtime_ns,
+            self.inode,
+            self.sha256,
+            self.linkname,
+        ]
+
+    @classmethod
+    def from_list(cls, path: str, values: list) -> "SourceEntry":
+        return cls(path, *values)
+
+
+class SourceChangedError(Exception):
+    """Error indicating a source file changed while the source archive was written"""
+
+
+class _CheckedReader:  # pylint: disable=too-few-public-methods
+    """
+    Reads a source file into the archive, failing with a SourceChangedError instead of
+    a tarfile error when the file became shorter than the size in its entry.
+    """
+
+    def __init__(self, fobj: io.BufferedReader, entry: SourceEntry):
+        self._fobj = fobj
+        self._entry = entry
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._fobj.read(size)
+        if 0 < size and len(data) < size:
+            raise SourceChangedError(f"{self._entry.path} was truncated")
+        return data
+
+
+def _check_unchanged(entry: SourceEntry, file_stat: os.stat_result) -> None:
+    """
+    Raise a SourceChangedError if the stat information of a file differs from its
+    entry, meaning its content may not match the content hash of the entry.
+    """
+    if (
+        stat.S_IMODE(file_stat.st_mode),
+        file_stat.st_size,
+        file_stat.st_mtime_ns,
+        file_stat.st_ino,
+    ) != (entry.mode, entry.size, entry.mtime_ns, entry.inode):
+        raise SourceChangedError(f"{entry.path} changed since it was hashed")
+
+
+def hash_file(file_path: str) -> str:
+    """
+    Return the sha256 hex digest of the given file's content.
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as fobj:
+        buf = fobj.read(HASH_BLOCK_SIZE)
+        while buf:
+            hasher.update(buf)
+            buf = fobj.read(HASH_BLOCK_SIZE)
+    return hasher.hexdigest()
+
+
+def compute_digest(entries: List[SourceEntry]) -> str:
+    """
+    Compute the digest of a (sorted) list of source entries. Only properties that end up
+    in the archive contribute, so the digest identifies the archive content.
+    """
+    hasher = hashlib.sha256(f"buildrunner-source-v{MANIFEST_VERSION}\n".encode())
+    for entry in entries:
+        hasher.update(
+            (
+                f"{entry.path}\0{entry.kind}\0{entry.mode:o}\0{entry.size}\0"
+                f"{entry.sha256}\0{entry.linkname}\n"
+            ).encode("utf-8", "surrogateescape")
+        )
+    return hasher.hexdigest()
+
+
+def _atomic_write_json(file_path: str, data: dict) -> None:
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as fobj:
+            json.dump(data, fobj, separators=(",", ":"))
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def hold_shared_lock(file_path: str) -> Optional[io.BufferedReader]:
+    """
+    Open the file and hold a shared lock on it, marking it as in use by this process so
+    that other builds do not remove it (see remove_if_unused). Returns None if the file
+    does not exist.
+    """
+    try:
+        # pylint: disable=consider-using-with
+        lock_file_obj = open(file_path, "rb")
+    except FileNotFoundError:
+        return None
+    portalocker.lock(lock_file_obj, portalocker.LockFlags.SHARED)
+    try:
+        # The file may have been removed while waiting for the lock
+        if os.fstat(lock_file_obj.fileno()).st_ino == os.stat(file_path).st_ino:
+            return lock_file_obj
+    except FileNotFoundError:
+        pass
+    release_shared_lock(lock_file_obj)
+    return None
+
+
+def release_shared_lock(lock_file_obj: Optional[io.BufferedReader]) -> None:
+    """
+    Release a lock acquired with hold_shared_lock.
+    """
+    if lock_file_obj is not None:
+        portalocker.unlock(lock_file_obj)
+        lock_file_obj.close()
+
+
+def remove_if_unused(
+    file_path: str,
+    retention_seconds: float,
+    remove: Optional[Callable[[], None]] = None,
+) -> bool:
+    """
+    Remove the file if it has not been modified within the retention period and no other
+    process holds a lock on it. The optional remove function is called (while holding the
+    exclusive lock) before the file itself is removed. Returns true if the file was removed.
+    """
+    try:
+        if time.time() - os.path.getmtime(file_path) < retention_seconds:
+            return False
+        with open(file_path, "rb") as fobj:
+            portalocker.lock(
+                fobj,
+                portalocker.LockFlags.EXCLUSIVE | portalocker.LockFlags.NON_BLOCKING,
+            )
+            if remove:
+                remove()
+            os.remove(file_path)
+            return True
+    except (OSError, portalocker.LockException):
+        return False
+
+
+class SourceArchiver:
+    """
+    Creates deterministic, content-addressed source archives that are reused between runs.
+
+    A manifest of every archived entry (path, size, mtime, inode and content hash) is kept
+    for each project checkout. Unchanged files reuse their previous content hash, and if the
+    resulting digest matches an existing archive no archive is written at all.
+    """
+
+    def __init__(
+        self,
+        build_dir: str,
+        caches_root: str,
+        project_name: str,
+        exclude: Optional[Callable[[str, bool], bool]] = None,
+        use_git_index: bool = False,
+        include_git_ignored: bool = False,
+    ):
+        self.build_dir = build_dir
+        self.archive_dir = os.path.join(
+            os.path.expanduser(caches_root), SOURCE_ARCHIVE_DIR
+        )
+        self.manifest_dir = os.path.join(self.archive_dir, SOURCE_MANIFEST_DIR)
+        # Checkouts of the same project in different directories get separate manifests
+        dir_hash = hashlib.sha1(
+            os.path.realpath(build_dir).encode("utf-8", "surrogateescape")
+        ).hexdigest()[:12]
+        self.manifest_file = os.path.join(
+            self.manifest_dir, f"{project_name or 'source'}-{dir_hash}.json"
+        )
+        self.exclude = exclude
+        self.use_git_index = use_git_index
+        self.include_git_ignored = include_git_ignored
+        self.digest = None
+        self.archive_path = None
+        self._lock_file_obj = None
+
+    def _load_manifest(self) -> Dict[str, SourceEntry]:
+        if not os.path.exists(self.manifest_file):
+            return {}
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as fobj:
+                data = json.load(fobj)
+            if data.get("version") != MANIFEST_VERSION:
+                return {}
+            return {
+                path: SourceEntry.from_list(path, values)
+                for path, values in data.get("entries", {}).items()
+            }
+        except (OSError, ValueError, TypeError) as exc:
+            LOGGER.warning(
+                f"Ignoring unreadable source manifest {self.manifest_file}: {exc}"
+            )
+            return {}
+
+    def _save_manifest(self, entries: List[SourceEntry]) -> None:
+        _atomic_write_json(
+            self.manifest_file,
+            {
+                "version": MANIFEST_VERSION,
+                "digest": self.digest,
+                "entries": {entry.path: entry.to_list() for entry in entries},
+            },
+        )
+
+    def _is_excluded(self, rel_path: str, is_dir: bool) -> bool:
+        return bool(self.exclude and self.exclude(rel_path, is_dir))
+
+    @staticmethod
+    def _get_entry(
+        rel_path: str, file_path: str, file_stat: os.stat_result
+    ) -> Optional[SourceEntry]:
+        mode = stat.S_IMODE(file_stat.st_mode)
+        if stat.S_ISDIR(file_stat.st_mode):
+            return SourceEntry(rel_path, ENTRY_DIR, mode)
+        if stat.S_ISLNK(file_stat.st_mode):
+            return SourceEntry(
+                rel_path, ENTRY_SYMLINK, mode, linkname=os.readlink(file_path)
+            )
+        if stat.S_ISREG(file_stat.st_mode):
+            return SourceEntry(
+                rel_path,
+                ENTRY_FILE,
+                mode,
+                size=file_stat.st_size,
+                mtime_ns=file_stat.st_mtime_ns,
+                inode=file_stat.st_ino,
+            )
+        LOGGER.debug(f"Skipping special file {rel_path} in source archive")
+        return None
+
+    def _walk(self, rel_root: str, entries: List[SourceEntry]) -> None:
+        """
+        Add the entries under the given directory, without descending into excluded
+        directories.
+        """
+        pending = [rel_root]
+        while pending:
+            rel_dir = pending.pop()
+            try:
+                with os.scandir(os.path.join(self.build_dir, rel_dir)) as dir_iter:
+                    dir_entries = list(dir_iter)
+            except FileNotFoundError:
+                continue
+            for dir_entry in dir_entries:
+                rel_path = f"{rel_dir}/{dir_entry.name}" if rel_dir else dir_entry.name
+                try:
+                    file_stat = dir_entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                is_dir = stat.S_ISDIR(file_stat.st_mode)
+                if self._is_excluded(rel_path, is_dir):
+                    continue
+                entry = self._get_entry(rel_path, dir_entry.path, file_stat)
+                if entry:
+                    entries.append(entry)
+                if is_dir:
+                    pending.append(rel_path)
+
+    def _scan_git_files(self, paths: List[str], entries: List[SourceEntry]) -> None:
+        """
+        Add the entries of the files listed by git and of their parent directories, so
+        that ignored directories are never walked. Directories that git lists as a
+        whole (submodules, untracked nested repositories) and the git directory are
+        walked.
+        """
+        included_dirs: Dict[str, bool] = {"": True}
+
+        def _include_dir(rel_dir: str) -> bool:
+            if rel_dir not in included_dirs:
+                included = _include_dir(
+                    posixpath.dirname(rel_dir)
+                ) and not self._is_excluded(rel_dir, True)
+                if included:
+                    try:
+                        dir_stat = os.lstat(os.path.join(self.build_dir, rel_dir))
+                    except FileNotFoundError:
+                        dir_stat = None
+                    included = bool(dir_stat and stat.S_ISDIR(dir_stat.st_mode))
+                    if included:
+                        entries.append(
+                            SourceEntry(
+                                rel_dir, ENTRY_DIR, stat.S_IMODE(dir_stat.st_mode)
+                            )
+                        )
+                included_dirs[rel_dir] = included
+            return included_dirs[rel_dir]
+
+        for rel_path in sorted({path.rstrip("/") for path in paths} | {".git"}):
+            if rel_path in included_dirs or not _include_dir(
+                posixpath.dirname(rel_path)
+            ):
+                continue
+            file_path = os.path.join(self.build_dir, rel_path)
+            try:
+                file_stat = os.lstat(file_path)
+            except FileNotFoundError:
+                # Deleted tracked files, or a build directory below the work tree root
+                continue
+            is_dir = stat.S_ISDIR(file_stat.st_mode)
+            if self._is_excluded(rel_path, is_dir):
+                continue
+            entry = self._get_entry(rel_path, file_path, file_stat)
+            if entry:
+                entries.append(entry)
+            if is_dir:
+                included_dirs[rel_path] = True
+                self._walk(rel_path, entries)
+
+    def scan(self) -> List[SourceEntry]:
+        """
+        Return the sorted list of entries to archive. In git work trees the files are
+        listed by git, leaving out ignored files, unless ignored files are included.
+        Otherwise the build directory is walked, without descending into excluded
+        directories.
+        """
+        entries = []
+        paths = None
+        if self.use_git_index and not self.include_git_ignored:
+            paths = list_files(self.build_dir)
+        if paths is None:
+            self._walk("", entries)
+        else:
+            self._scan_git_files(paths, entries)
+        entries.sort(key=lambda entry: entry.path)
+        return entries
+
+    def _hash_entries(
+        self,
+        entries: List[SourceEntry],
+        previous: Dict[str, SourceEntry],
+        known: Dict[str, str],
+    ) -> int:
+        """
+        Fill in the content hash of every file, reusing the previous hash when the stat
+        information is unchanged or the known content id (e.g. from the git index).
+        Returns the number of files that had to be read.
+        """
+        hashed = 0
+        for entry in entries:
+            if entry.kind != ENTRY_FILE:
+                continue
+            previous_entry = previous.get(entry.path)
+            if entry.stat_matches(previous_entry):
+                entry.sha256 = previous_entry.sha256
+                continue
+            entry.sha256 = known.get(entry.path) or hash_file(
+                os.path.join(self.build_dir, entry.path)
+            )
+            hashed += entry.path not in known
+        return hashed
+
+    def _write_archive(self, entries: List[SourceEntry], archive_path: str) -> None:
+        tmp_path = f"{archive_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with tarfile.open(tmp_path, mode="w", format=tarfile.PAX_FORMAT) as tfile:
+                for entry in entries:
+                    tarinfo = tarfile.TarInfo(entry.path)
+                    tarinfo.mode = entry.mode
+                    tarinfo.mtime = SOURCE_ARCHIVE_MTIME
+                    tarinfo.uid = tarinfo.gid = 0
+                    tarinfo.uname = tarinfo.gname = ""
+                    if entry.kind == ENTRY_DIR:
+                        tarinfo.type = tarfile.DIRTYPE
+                        tfile.addfile(tarinfo)
+                    elif entry.kind == ENTRY_SYMLINK:
+                        tarinfo.type = tarfile.SYMTYPE
+                        tarinfo.linkname = entry.linkname
+                        tfile.addfile(tarinfo)
+                    else:
+                        # Files are checked against their entries before and after
+                        # they are copied, so that the archive is never published
+                        # under the digest of content it does not contain
+                        tarinfo.size = entry.size
+                        with open(
+                            os.path.join(self.build_dir, entry.path), "rb"
+                        ) as fobj:
+                            _check_unchanged(entry, os.fstat(fobj.fileno()))
+                            tfile.addfile(tarinfo, _CheckedReader(fobj, entry))
+                            _check_unchanged(entry, os.fstat(fobj.fileno()))
+            os.replace(tmp_path, archive_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _prune(self) -> None:
+        """
+        Remove archives that have not been used recently and are not locked by any build.
+        """
+        for file_name in os.listdir(self.archive_dir):
+            file_path = os.path.join(self.archive_dir, file_name)
+            if file_path != self.archive_path and file_name.endswith((".tar", ".tmp")):
+                if remove_if_unused(file_path, SOURCE_ARCHIVE_RETENTION_SECONDS):
+                    LOGGER.debug(f"Pruned unused source archive {file_path}")
+
+    @retry(
+        exceptions=(FileNotFoundError, SourceChangedError),
+        tries=5,
+        delay=1,
+        backoff=3,
+        max_delay=10,
+    )
+    def create(self) -> str:
+        """
+        Create (or reuse) the source archive, returning its path. The source tree is
+        scanned again when files are deleted or changed while the archive is written.
+        """
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        previous = self._load_manifest()
+        entries = self.scan()
+        known = get_clean_blobs(self.build_dir) if self.use_git_index else {}
+        hashed = self._hash_entries(entries, previous, known)
+        self.digest = compute_digest(entries)
+        self.archive_path = os.path.join(self.archive_dir, f"{self.digest}.tar")
+        LOGGER.info(
+            f"Source tree has {len(entries)} entries, {hashed} file(s) hashed, digest {self.digest:.12}"
+        )
+
+        self.release()
+        self._lock_file_obj = hold_shared_lock(self.archive_path)
+        if self._lock_file_obj:
+            LOGGER.info(f"Reusing source archive {self.archive_path}")
+            # Mark the archive as recently used
+            os.utime(self.archive_path)
+        else:
+            self._write_archive(entries, self.archive_path)
+            self._lock_file_obj = hold_shared_lock(self.archive_path)
+            if not self._lock_file_obj:
+                raise FileNotFoundError(self.archive_path)
+
+        self._save_manifest(entries)
+        self._prune()
+        return self.archive_path
+
+    def release(self) -> None:
+        """
+        Release the lock held on the archive in use.
+        """
+        release_shared_lock(self._lock_file_obj)
+        self._lock_file_obj = None
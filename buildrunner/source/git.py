@@ -0,0 +1,115 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import logging
+import os
+import subprocess
+from typing import Dict, List, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+# Regular (non-executable and executable) file modes in the git index
+GIT_FILE_MODES = ("100644", "100755")
+# Attributes that make the working tree content differ from the blob in the index
+GIT_CONVERSION_ATTRIBUTES = ("filter", "text", "eol", "ident", "crlf")
+# Prefix of content ids taken from the git index, to distinguish them from sha256 hashes
+GIT_CONTENT_ID_PREFIX = "git:"
+
+
+def _git(build_dir: str, *args: str, stdin: bytes = None) -> bytes:
+    return subprocess.run(
+        ["git", "-C", build_dir, *args],
+        input=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        check=True,
+    ).stdout
+
+
+def _split(output: bytes) -> List[str]:
+    return [os.fsdecode(value) for value in output.split(b"\0") if value]
+
+
+def list_files(build_dir: str) -> Optional[List[str]]:
+    """
+    Return the paths, relative to the build directory, of the tracked files and of the
+    untracked files that are not ignored (by .gitignore, .git/info/exclude or the global
+    excludes file) under the build directory. Untracked nested repositories are listed
+    as a directory path ending with a slash. Returns None if the directory is not in a
+    git work tree or git is not available.
+    """
+    try:
+        return _split(
+            _git(
+                build_dir,
+                "ls-files",
+                "-z",
+                "--cached",
+                "--others",
+                "--exclude-standard",
+            )
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        LOGGER.debug(f"Not listing {build_dir} with git: {exc}")
+        return None
+
+
+def get_clean_blobs(build_dir: str) -> Dict[str, str]:
+    """
+    Return the git blob id of every tracked regular file under the build directory whose
+    working tree content is known to match the index, keyed by the path relative to the
+    build directory. Git compares the index stat information with the working tree (and
+    handles racily clean entries), so these files do not need to be read to be identified.
+
+    Files that are modified, unmerged, marked assume-unchanged or skip-worktree, or that
+    are subject to content conversion (filters, end of line conversion) are left out, as
+    are all files if the directory is not in a git work tree or git is not available.
+    """
+    try:
+        autocrlf = subprocess.run(
+            ["git", "-C", build_dir, "config", "--get", "core.autocrlf"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        ).stdout.strip()
+        if autocrlf and autocrlf != b"false":
+            return {}
+
+        blobs = {}
+        for line in _split(_git(build_dir, "ls-files", "--stage", "-v", "-z")):
+            info, _, path = line.partition("\t")
+            tag, mode, oid, stage = info.split(" ")
+            # Lowercase tags are assume-unchanged entries, S is skip-worktree
+            if tag == "H" and stage == "0" and mode in GIT_FILE_MODES:
+                blobs[path] = oid
+        if not blobs:
+            return {}
+
+        for path in _split(
+            _git(build_dir, "diff-files", "--name-only", "--relative", "-z")
+        ):
+            blobs.pop(path, None)
+
+        attributes = _split(
+            _git(
+                build_dir,
+                "check-attr",
+                "-z",
+                "--stdin",
+                *GIT_CONVERSION_ATTRIBUTES,
+                stdin=b"\0".join(os.fsencode(path) for path in blobs) + b"\0",
+            )
+        )
+        # The output is a sequence of path, attribute, value triplets
+        for index in range(0, len(attributes) - 2, 3):
+            if attributes[index + 2] not in ("unspecified", "unset"):
+                blobs.pop(attributes[index], None)
+    except (OSError, subprocess.CalledProcessError, ValueError) as exc:
+        LOGGER.debug(f"Not using the git index for {build_dir}: {exc}")
+        return {}
+    return {path: f"{GIT_CONTENT_ID_PREFIX}{oid}" for path, oid in blobs.items()}
@@ -0,0 +1,271 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import os
+import re
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+
+BUILDIGNORE_FILE = ".buildignore"
+
+
+def _translate_class(pattern: str, index: int) -> Tuple[Optional[str], int]:
+    """
+    Translate the character class starting at the given index, returning the regex and
+    the index after the class, or None if the class is not terminated.
+    """
+    end = index + 1
+    if end < len(pattern) and pattern[end] in "!^":
+        end += 1
+    if end < len(pattern) and pattern[end] == "]":
+        end += 1
+    while end < len(pattern) and pattern[end] != "]":
+        end += 1
+    if end >= len(pattern):
+        return None, index
+    body = pattern[index + 1 : end].replace("\\", "\\\\")
+    if body[0] in "!^":
+        body = "^" + body[1:]
+    return f"[{body}]", end + 1
+
+
+def translate(pattern: str) -> Tuple[str, bool, bool]:
+    """
+    Translate a single gitignore style pattern (without negation) to a regular expression.
+    Returns the regex, whether the pattern only matches directories and whether it is
+    anchored. Anchored patterns match the whole relative path, others only match the
+    last path component.
+    """
+    dir_only = pattern.endswith("/")
+    if dir_only:
+        pattern = pattern[:-1]
+    # Patterns with a slash anywhere but the end are relative to the root
+    anchored = "/" in pattern
+    if pattern.startswith("/"):
+        pattern = pattern[1:]
+
+    parts = []
+    index = 0
+    if pattern.startswith("**/"):
+        parts.append("(?:.*/)?")
+        index = 3
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("/**/", index):
+            parts.append("/(?:.*/)?")
+            index += 4
+        elif pattern.startswith("/**", index) and index + 3 == len(pattern):
+            parts.append("/.+")
+            index += 3
+        elif char == "*":
+            parts.append("[^/]*")
+            while index < len(pattern) and pattern[index] == "*":
+                index += 1
+        elif char == "?":
+            parts.append("[^/]")
+            index += 1
+        elif char == "[":
+            char_class, index = _translate_class(pattern, index)
+            if char_class is None:
+                parts.append(re.escape(char))
+                index += 1
+            else:
+                parts.append(char_class)
+        elif char == "\\" and index + 1 < len(pattern):
+            parts.append(re.escape(pattern[index + 1]))
+            index += 2
+        else:
+            parts.append(re.escape(char))
+            index += 1
+
+    return "".join(parts), dir_only, anchored
+
+
+_WILDCARD_CHARS = frozenset("*?[\\")
+
+
+def _strip_trailing_spaces(line: str) -> str:
+    stripped = line.rstrip(" \t\r")
+    # A trailing space escaped with a backslash is kept
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    return stripped
+
+
+def _compile(regexes: List[str]) -> Optional[Pattern]:
+    if not regexes:
+        return None
+    return re.compile("|".join(f"(?:{regex})" for regex in regexes), re.DOTALL)
+
+
+def _is_literal(pattern: str) -> bool:
+    return _WILDCARD_CHARS.isdisjoint(pattern)
+
+
+class _NameMatcher:
+    """
+    Matches single path components against literal names, ``*suffix`` patterns and
+    a combined regex for everything else.
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.suffixes = []
+        self.regexes = []
+        self.regex = None
+
+    def add(self, pattern: str) -> None:
+        if _is_literal(pattern):
+            self.names.add(pattern)
+        elif pattern.startswith("*") and _is_literal(pattern.lstrip("*")):
+            self.suffixes.append(pattern.lstrip("*"))
+        else:
+            self.regexes.append(translate(pattern)[0])
+
+    def compile(self) -> None:
+        self.suffixes = tuple(self.suffixes)
+        self.regex = _compile(self.regexes)
+
+    def __bool__(self) -> bool:
+        return bool(self.names or self.suffixes or self.regexes)
+
+    def match(self, name: str) -> bool:
+        return (
+            name in self.names
+            or (self.suffixes and name.endswith(self.suffixes))
+            or bool(self.regex and self.regex.fullmatch(name))
+        )
+
+
+class _PatternBlock:
+    """
+    A run of consecutive patterns that are all negated or all non-negated.
+
+    Most patterns in practice only look at a single path component (``node_modules``,
+    ``*.pyc``, ``**/logs``), so those are matched against the last component with set
+    lookups and suffix checks, ``**/name/**`` patterns are matched against the parent
+    components, and only the remaining anchored patterns use a regex over the whole path.
+    """
+
+    def __init__(self, negated: bool):
+        self.negated = negated
+        # Indexed by whether the patterns apply to directories only
+        self._names = {False: _NameMatcher(), True: _NameMatcher()}
+        # Anchored patterns are bucketed by their first path component when it is a
+        # literal, the None bucket holds the rest
+        self._path_regexes = {False: {}, True: {}}
+        self._compiled_paths = {}
+        self._parents = _NameMatcher()
+
+    def add(self, pattern: str) -> None:
+        dir_only = pattern.endswith("/")
+        body = pattern[:-1] if dir_only else pattern
+        if body.startswith("**/"):
+            rest = body[3:]
+            if rest and "/" not in rest:
+                self._names[dir_only].add(rest)
+                return
+            if (
+                not dir_only
+                and rest.endswith("/**")
+                and rest[:-3]
+                and "/" not in rest[:-3]
+            ):
+                self._parents.add(rest[:-3])
+                return
+        elif "/" not in body:
+            self._names[dir_only].add(body)
+            return
+        regex, dir_only, _ = translate(pattern)
+        first = body.lstrip("/").partition("/")[0]
+        bucket = first if _is_literal(first) and first != "**" else None
+        self._path_regexes[dir_only].setdefault(bucket, []).append(regex)
+
+    def compile(self) -> None:
+        for names in self._names.values():
+            names.compile()
+        self._parents.compile()
+        self._compiled_paths = {
+            dir_only: {bucket: _compile(regexes) for bucket, regexes in buckets.items()}
+            for dir_only, buckets in self._path_regexes.items()
+        }
+
+    def _match_path(self, path: str, dir_only: bool) -> bool:
+        buckets = self._compiled_paths[dir_only]
+        if not buckets:
+            return False
+        for bucket in (path.partition("/")[0], None):
+            path_regex = buckets.get(bucket)
+            if path_regex and path_regex.fullmatch(path):
+                return True
+        return False
+
+    def match(self, path: str, name: str, is_dir: bool) -> bool:
+        for dir_only in (False, True) if is_dir else (False,):
+            if self._names[dir_only].match(name) or self._match_path(path, dir_only):
+                return True
+        if self._parents:
+            return any(self._parents.match(parent) for parent in path.split("/")[:-1])
+        return False
+
+
+class IgnoreMatcher:
+    """
+    Matches relative paths against a list of ignore patterns using gitignore semantics
+    (anchoring, ``**``, directory-only patterns and ``!`` negation).
+
+    Patterns are compiled once: consecutive patterns with the same sign are combined into
+    sets of literal names, suffixes and a single regular expression per kind of pattern,
+    so matching cost barely depends on the number of patterns. As with git, a path
+    inside an excluded directory cannot be re-included; callers are expected to skip the
+    contents of any excluded directory.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self._blocks: List[_PatternBlock] = []
+        for raw_pattern in patterns:
+            pattern = _strip_trailing_spaces(raw_pattern)
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            if negated:
+                pattern = pattern[1:]
+            elif pattern.startswith(("\\!", "\\#")):
+                pattern = pattern[1:]
+            if not pattern.strip("/"):
+                continue
+            if not self._blocks or self._blocks[-1].negated != negated:
+                self._blocks.append(_PatternBlock(negated))
+            self._blocks[-1].add(pattern)
+        for block in self._blocks:
+            block.compile()
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "IgnoreMatcher":
+        """
+        Load the patterns from the given file, returning an empty matcher if the file does
+        not exist.
+        """
+        if not os.path.exists(file_path):
+            return cls([])
+        with open(file_path, "r", encoding="utf-8") as fobj:
+            return cls(fobj.read().splitlines())
+
+    def __bool__(self) -> bool:
+        return bool(self._blocks)
+
+    def match(self, path: str, is_dir: bool = False) -> bool:
+        """
+        Returns true if the given path (relative to the root, using ``/`` separators)
+        is excluded.
+        """
+        name = path.rpartition("/")[2]
+        for block in reversed(self._blocks):
+            if block.match(path, name, is_dir):
+                return not block.negated
+        return False
@@ -0,0 +1,140 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import hashlib
+import logging
+import os
+from typing import Callable
+
+from docker.errors import APIError, ImageNotFound
+from retry import retry
+
+from buildrunner.source.archive import (
+    SOURCE_ARCHIVE_DIR,
+    SOURCE_ARCHIVE_RETENTION_SECONDS,
+    hash_file,
+    hold_shared_lock,
+    release_shared_lock,
+    remove_if_unused,
+)
+
+
+LOGGER = logging.getLogger(__name__)
+
+SOURCE_IMAGE_REPOSITORY = "buildrunner-source"
+# Directory (relative to the source archive directory) holding one lock file per image
+SOURCE_IMAGE_LOCK_DIR = "images"
+
+
+class SourceImageCache:
+    """
+    Reuses source images between runs by tagging them with a key derived from the source
+    archive digest, the base image and the Dockerfile used to build them.
+
+    Every process using an image holds a shared lock on the image's lock file in the caches
+    root, which acts as a reference count: an image is only removed by a process that can
+    take an exclusive lock on it, i.e. when no other buildrunner process on the host uses it.
+    """
+
+    def __init__(self, docker_client, caches_root: str, base_image: str):
+        self.docker_client = docker_client
+        self.base_image = base_image
+        self.lock_dir = os.path.join(
+            os.path.expanduser(caches_root), SOURCE_ARCHIVE_DIR, SOURCE_IMAGE_LOCK_DIR
+        )
+        self.key = None
+        self.image = None
+        self._lock_file_obj = None
+
+    def _get_base_image_id(self) -> str:
+        try:
+            return self.docker_client.inspect_image(self.base_image)["Id"]
+        except ImageNotFound:
+            LOGGER.info(f"Pulling source base image {self.base_image}")
+            self.docker_client.pull(self.base_image)
+            return self.docker_client.inspect_image(self.base_image)["Id"]
+
+    def get_key(self, source_digest: str, dockerfile: str) -> str:
+        """
+        Return the key identifying the image built from the given source digest and Dockerfile.
+        """
+        hasher = hashlib.sha256()
+        for value in (source_digest, self._get_base_image_id(), hash_file(dockerfile)):
+            hasher.update(f"{value}\n".encode())
+        return hasher.hexdigest()
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, f"{key}.lock")
+
+    @retry(exceptions=FileNotFoundError, tries=5, delay=1, backoff=3, max_delay=10)
+    def _lock(self, key: str) -> None:
+        lock_path = self._lock_path(key)
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(lock_path, "ab"):
+            pass
+        # Mark the image as recently used
+        os.utime(lock_path)
+        self._lock_file_obj = hold_shared_lock(lock_path)
+        if not self._lock_file_obj:
+            # The image was pruned by another process while waiting for the lock
+            raise FileNotFoundError(lock_path)
+
+    def get(self, source_digest: str, dockerfile: str, build: Callable[[], str]) -> str:
+        """
+        Return the source image for the given source digest, calling the build function
+        (which must return the image id) only if no image exists for it yet.
+        """
+        self.release()
+        self.key = self.get_key(source_digest, dockerfile)
+        self.image = f"{SOURCE_IMAGE_REPOSITORY}:{self.key}"
+        self._lock(self.key)
+        try:
+            self.docker_client.inspect_image(self.image)
+            LOGGER.info(f"Reusing source image {self.image}")
+        except ImageNotFound:
+            image_id = build()
+            self.docker_client.tag(image_id, SOURCE_IMAGE_REPOSITORY, self.key)
+            LOGGER.info(f"Tagged source image {image_id} as {self.image}")
+        return self.image
+
+    def release(self) -> None:
+        """
+        Release the reference held on the image in use. The image itself is kept for later runs.
+        """
+        release_shared_lock(self._lock_file_obj)
+        self._lock_file_obj = None
+
+    def _remove_image(self, key: str) -> None:
+        image = f"{SOURCE_IMAGE_REPOSITORY}:{key}"
+        try:
+            # Do not force the removal so that images still used by containers are kept
+            self.docker_client.remove_image(image, noprune=False, force=False)
+        except ImageNotFound:
+            pass
+
+    def prune(
+        self, retention_seconds: float = SOURCE_ARCHIVE_RETENTION_SECONDS
+    ) -> None:
+        """
+        Remove source images that have not been used recently and are not in use by any process.
+        """
+        if not os.path.isdir(self.lock_dir):
+            return
+        for file_name in os.listdir(self.lock_dir):
+            key, ext = os.path.splitext(file_name)
+            if ext != ".lock" or key == self.key:
+                continue
+            try:
+                if remove_if_unused(
+                    self._lock_path(key),
+                    retention_seconds,
+                    remove=lambda key=key: self._remove_image(key),
+                ):
+                    LOGGER.debug(f"Pruned unused source image {key:.12}")
+            except APIError as exc:
+                LOGGER.warning(f"Unable to prune source image {key:.12}: {exc}")
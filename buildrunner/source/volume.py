@@ -0,0 +1,104 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import logging
+import uuid
+from typing import Dict, Optional
+
+from docker.errors import ImageNotFound
+
+from buildrunner.cleanup import register_container, unregister_container
+from buildrunner.errors import BuildRunnerProcessingError
+
+
+LOGGER = logging.getLogger(__name__)
+
+SOURCE_VOLUME_PREFIX = "buildrunner-source"
+SOURCE_VOLUME_LABEL = "com.adobe.buildrunner.source"
+SOURCE_VOLUME_HELPER_IMAGE = "busybox:latest"
+
+
+class SourceVolume:
+    """
+    Provides the source tree to containers through a named volume.
+
+    The source archive is streamed once per build into the volume with put_archive into a
+    helper container that is never started. Containers then mount the volume directly
+    instead of being created with volumes_from a per-step source container built from the
+    source image. The helper container is kept until the volume is removed so that it can
+    still be used with ``--volumes-from``.
+    """
+
+    def __init__(
+        self,
+        docker_client,
+        docker_registry: str,
+        mount_path: str,
+        container_labels: Optional[Dict[str, str]] = None,
+    ):
+        self.docker_client = docker_client
+        self.helper_image = f"{docker_registry}/{SOURCE_VOLUME_HELPER_IMAGE}"
+        self.mount_path = mount_path
+        self.labels = dict(container_labels or {})
+        self.labels[SOURCE_VOLUME_LABEL] = "true"
+        self.name = None
+        self.container = None
+
+    def _ensure_helper_image(self) -> None:
+        try:
+            self.docker_client.inspect_image(self.helper_image)
+        except ImageNotFound:
+            LOGGER.info(f"Pulling source volume helper image {self.helper_image}")
+            self.docker_client.pull(self.helper_image)
+
+    def create(self, archive_path: str) -> str:
+        """
+        Create the volume and extract the given source archive into it, returning the
+        volume name.
+        """
+        self.name = f"{SOURCE_VOLUME_PREFIX}-{uuid.uuid4().hex[:12]}"
+        self.docker_client.create_volume(name=self.name, labels=self.labels)
+        self._ensure_helper_image()
+        self.container = self.docker_client.create_container(
+            self.helper_image,
+            command="/bin/true",
+            volumes=[self.mount_path],
+            labels=self.labels,
+            host_config=self.docker_client.create_host_config(
+                binds={self.name: {"bind": self.mount_path, "ro": False}}
+            ),
+        )["Id"]
+        register_container(self.container)
+        with open(archive_path, "rb") as archive:
+            if not self.docker_client.put_archive(
+                self.container, self.mount_path, archive
+            ):
+                raise BuildRunnerProcessingError(
+                    f"Unable to copy the source archive to volume {self.name}"
+                )
+        LOGGER.info(f"Created source volume {self.name}")
+        return self.name
+
+    def remove(self) -> None:
+        """
+        Remove the helper container and the volume.
+        """
+        if self.container:
+            try:
+                self.docker_client.remove_container(self.container, force=True)
+            except Exception as _ex:  # pylint: disable=broad-except
+                LOGGER.warning(f"Failed to remove source volume container: {_ex}")
+            finally:
+                unregister_container(self.container)
+                self.container = None
+        if self.name:
+            try:
+                self.docker_client.remove_volume(self.name, force=True)
+            except Exception as _ex:  # pylint: disable=broad-except
+                LOGGER.warning(f"Failed to remove source volume {self.name}: {_ex}")
+            self.name = None
@@ -9,19 +9,43 @@ with the terms of the Adobe license agreement accompanying it.
 
 from collections import OrderedDict
 import grp
+import json
 import os
+import posixpath
 import pwd
+import tarfile
 import threading
 import time
 import uuid
 
+import docker.errors
 import python_on_whales
 
 import buildrunner.docker
+from buildrunner.artifacts import (
+    ARTIFACT_HOST_COMPRESSIONS,
+    HashingWriter,
+    compress_artifacts,
+    extract_artifacts,
+    get_artifact_listing_command,
+    parse_artifact_listing,
+)
+from buildrunner.caches.volume import CACHE_STORAGE_VOLUME, CacheVolumes
 from buildrunner.cleanup import register_container, unregister_container
 from buildrunner.config import BuildRunnerConfig
-from buildrunner.config.models_step import RunAndServicesBase, StepRun, Service
-from buildrunner.docker.daemon import DockerDaemonProxy
+from buildrunner.config.models_step import (
+    RunAndServicesBase,
+    Service,
+    StepCache,
+    StepRun,
+)
+from buildrunner.docker.helper import HELPER_IMAGE_NAME
+from buildrunner.docker.probe import (
+    can_probe_natively,
+    get_backoff_delays,
+    probe_http,
+    probe_port,
+)
 from buildrunner.docker.runner import DockerRunner
 from buildrunner.errors import (
     BuildRunnerConfigurationError,
@@ -36,7 +60,6 @@ from buildrunner.loggers import ContainerLogger
 DEFAULT_SHELL = "/bin/sh"
 SOURCE_VOLUME_MOUNT = "/source"
 ARTIFACTS_VOLUME_MOUNT = "/artifacts"
-FILE_INFO_DELIMITER = "~!~"
 
 
 class RunBuildStepRunnerTask(BuildStepRunnerTask):
@@ -45,12 +68,12 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
     """
 
     # Lightweight docker image for artifact management
-    ARTIFACT_LISTER_DOCKER_IMAGE = "ubuntu:19.04"
-    # Lightweight docker image for running nc
-    NC_DOCKER_IMAGE = "subfuzion/netcat:latest"
+    ARTIFACT_LISTER_DOCKER_IMAGE = HELPER_IMAGE_NAME
 
     # Default to 10 min when waiting for ports to be opened
     WAIT_FOR_DEFAULT_TIMEOUT = 600
+    # Seconds between checks of the container status while waiting for ports
+    WAIT_FOR_STATUS_INTERVAL = 5
 
     TAR_COMPRESSION_ARG = {
         "gz": "--gzip",
@@ -83,8 +106,15 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
         self._service_links = {}
         self._sshagent = None
         self._dockerdaemonproxy = None
+        # The build helper container when it is attached to the step network
+        self._helper_container = None
+        # Whether service ports are probed from this process, None until detected
+        self._probe_natively = None
         self.runner = None
         self.images_to_remove = []
+        self._cache_volumes = None
+        # The claimed cache volumes that have not been promoted, volume -> cache key
+        self._claimed_cache_volumes = OrderedDict()
 
     def __del__(self):
         if self.step_runner.network_name and self._docker_client.networks(
@@ -103,6 +133,10 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
         Get (creating the container if necessary) the container id of the
         source container.
         """
+        source_volume = self.step_runner.build_runner.get_source_volume()
+        if source_volume:
+            # The source volume helper container is shared by every step
+            return source_volume.container
         if not self._source_container:
             self._source_container = self._docker_client.create_container(
                 self.step_runner.build_runner.get_source_image(),
@@ -123,6 +157,109 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             )
         return self._source_container
 
+    def _add_source_mount(self, volumes_from, volumes):
+        """
+        Add the source mount to the given volumes_from list and volumes dict, either
+        mounting the source volume directly or the volumes of the source container.
+        """
+        source_volume = self.step_runner.build_runner.get_source_volume()
+        if source_volume:
+            read_only = (
+                BuildRunnerConfig.get_instance().global_config.source.volume_read_only
+            )
+            volumes[source_volume.name] = (
+                f"{SOURCE_VOLUME_MOUNT}:ro" if read_only else SOURCE_VOLUME_MOUNT
+            )
+        else:
+            volumes_from.append(self._get_source_container())
+
+    def _mount_cache_volume(
+        self, key, value, buildrunner_config, volumes, container_meta_logger
+    ):
+        """
+        Claim the cache volume for the given step cache configuration and mount it in
+        the build container, instead of restoring and saving a cache archive.
+        """
+        if isinstance(value, str):
+            # The key is the local cache key, prefixed with the project like archives
+            cache_keys = [f"{buildrunner_config.vcs.name}-{key}"]
+            docker_path = value
+        elif isinstance(value, list):
+            cache_keys = value
+            docker_path = key
+        else:
+            container_meta_logger.warning(
+                f"Type {type(value)} is not supported. "
+                f"Not able to use cache functionality for {key}: {value}"
+            )
+            return
+        if not self._cache_volumes:
+            self._cache_volumes = CacheVolumes(
+                self._docker_client,
+                buildrunner_config.global_config.caches_root,
+                buildrunner_config.global_config.docker_registry,
+            )
+        volume, matched_key = self._cache_volumes.claim(cache_keys)
+        self._claimed_cache_volumes[volume] = cache_keys[0]
+        if matched_key:
+            tier = next(
+                index + 1
+                for index, cache_key in enumerate(cache_keys)
+                if matched_key.startswith(cache_key)
+            )
+            container_meta_logger.info(
+                f"Mounting a copy {volume} of the cache volume for [{matched_key}] from cache key tier "
+                f"{tier} [{cache_keys[tier - 1]}] -> docker path [{docker_path}]"
+            )
+        else:
+            container_meta_logger.info(
+                f"No cache volume found for {cache_keys}, mounting new cache volume "
+                f"{volume} -> docker path [{docker_path}]"
+            )
+        volumes[volume] = docker_path
+
+    def _promote_cache_volumes(self, container_meta_logger):
+        """
+        Promote the cache volumes claimed by the step so that later steps mount them.
+        """
+        for volume, cache_key in list(self._claimed_cache_volumes.items()):
+            try:
+                self._cache_volumes.promote(cache_key, volume)
+                del self._claimed_cache_volumes[volume]
+                container_meta_logger.info(
+                    f"Saved cache volume {volume} as [{cache_key}]"
+                )
+            except Exception as _ex:  # pylint: disable=broad-except
+                container_meta_logger.error(
+                    f"Error saving cache volume {volume}, ignoring: {_ex}",
+                )
+
+    def _write_cache_telemetry(self, container_meta_logger):
+        """
+        Write the telemetry records of the caches restored and saved by the step to
+        the step results and register them in the artifacts manifest.
+        """
+        if not self.runner.cache_events:
+            return
+        file_name = "cache-telemetry.jsonl"
+        try:
+            with open(
+                os.path.join(self.step_runner.results_dir, file_name),
+                "w",
+                encoding="utf-8",
+            ) as fobj:
+                for event in self.runner.cache_events:
+                    fobj.write(f"{json.dumps(event)}\n")
+        except OSError as _ex:
+            container_meta_logger.warning(
+                f"Error writing cache telemetry, ignoring: {_ex}"
+            )
+            return
+        self.step_runner.build_runner.add_artifact(
+            os.path.join(self.step_runner.name, file_name),
+            {"type": "cache-telemetry", "caches": self.runner.cache_events},
+        )
+
     def _process_volumes_from(self, volumes_from):
         """
         Translate the volumes_from configuration to the appropriate service
@@ -155,305 +292,269 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
         Gather artifacts from the build container and place in the
         step-specific results dir.
 
-        This function actually spins up a separate docker container that mounts
-        the build container's source directory, queries for artifact patterns,
-        then copies to the step-specific results directory (which is mounted as
-        a host volume). It also appropriately sets file ownership of the
-        archived artifacts to the user running the buildrunner process.
+        The files matching all artifact patterns are listed in a single exec in
+        the helper container shared by the build when the source is in a volume,
+        otherwise in a separate docker container that mounts the build
+        container's source directory. Each matching file or directory is
+        then streamed out of the container with a single archive transfer and
+        extracted into the step-specific results directory while it is being
+        transferred, owned by the user running the buildrunner process.
+        Directories archived in the container are streamed from the standard
+        output of the archive command. The size and checksums of every artifact
+        are computed while it is written.
         """
+        # Unused arg
+        _ = console
+
         if not self.step.artifacts:
             return
         self.step_runner.log.info("Gathering artifacts")
 
-        # use a small busybox image to list the files matching the glob
+        # The shared helper container mounts the source volume, otherwise a small
+        # container mounting the source of this step lists the matching files
         artifact_lister = None
         try:
-            image_config = DockerRunner.ImageConfig(
-                f"{BuildRunnerConfig.get_instance().global_config.docker_registry}/{self.ARTIFACT_LISTER_DOCKER_IMAGE}",
-                pull_image=False,
-            )
-            artifact_lister = DockerRunner(
-                image_config,
-                log=self.step_runner.log,
-                # Log run messages at a debug level
-                run_log_debug=True,
-            )
-            # NOTE: see if we can use archive commands to eliminate the need for
-            #       the /stepresults volume when we can move to api v1.20
-            artifact_lister.start(
-                volumes_from=[self._get_source_container()],
-                volumes={
-                    self.step_runner.results_dir: "/stepresults",
-                },
-                working_dir=SOURCE_VOLUME_MOUNT,
-                shell="/bin/sh",
-            )
-
-            for pattern, properties in self.step.artifacts.items():
-                # query files for each artifacts pattern, capturing the output
-                # for parsing
-                stat_output_file = f"{str(uuid.uuid4())}.out"
-                stat_output_file_local = os.path.join(
-                    self.step_runner.results_dir,
-                    stat_output_file,
+            if self.step_runner.build_runner.get_source_volume():
+                artifact_source = self.step_runner.build_runner.get_helper_container()
+            else:
+                image_config = DockerRunner.ImageConfig(
+                    f"{BuildRunnerConfig.get_instance().global_config.docker_registry}/{self.ARTIFACT_LISTER_DOCKER_IMAGE}",
+                    pull_image=False,
                 )
-                exit_code = artifact_lister.run(
-                    f'stat -c "%n{FILE_INFO_DELIMITER}%F" {pattern} >/stepresults/{stat_output_file}',
-                    console=console,
-                    stream=True,
+                artifact_lister = DockerRunner(
+                    image_config,
                     log=self.step_runner.log,
+                    # Log run messages at a debug level
+                    run_log_debug=True,
                 )
+                lister_volumes_from = []
+                lister_volumes = {}
+                self._add_source_mount(lister_volumes_from, lister_volumes)
+                artifact_lister.start(
+                    volumes_from=lister_volumes_from,
+                    volumes=lister_volumes,
+                    working_dir=SOURCE_VOLUME_MOUNT,
+                    shell="/bin/sh",
+                )
+                artifact_source = artifact_lister
 
-                # if the command was successful we found something
-                if exit_code == 0:
-                    with open(
-                        stat_output_file_local, "r", encoding="utf-8"
-                    ) as output_fd:
-                        output = output_fd.read()
-                    artifact_files = [af.strip() for af in output.split("\n")]
-                    for art_info in artifact_files:
-                        if not art_info or FILE_INFO_DELIMITER not in art_info:
-                            continue
-                        artifact_file, file_type = art_info.split(
-                            FILE_INFO_DELIMITER,
-                        )
-
-                        # check if the file is directory, to copy recursive
-                        is_dir = file_type.strip() == "directory"
-
-                        if properties and properties.get("rename"):
-                            if "*" in pattern:
-                                raise BuildRunnerConfigurationError(
-                                    f"Rename is not supported with wildcard patterns. `{pattern}` is not a valid pattern to use with rename."
-                                )
-
-                        if is_dir:
-                            # directory => recursive copy
-                            self._archive_dir(
-                                artifact_lister,
-                                properties,
-                                artifact_file,
+            # query the files matching every artifacts pattern at once
+            artifacts = list(self.step.artifacts.items())
+            exit_code, output = artifact_source.run_with_output(
+                get_artifact_listing_command(pattern for pattern, _ in artifacts)
+            )
+            if exit_code != 0:
+                # pylint: disable=broad-exception-raised
+                raise Exception("Error gathering artifacts--unable to list them")
+            matches = parse_artifact_listing(output.decode("utf-8", errors="replace"))
+
+            for index, (pattern, properties) in enumerate(artifacts):
+                for match in matches.get(index, []):
+                    if properties and properties.get("rename"):
+                        if "*" in pattern:
+                            raise BuildRunnerConfigurationError(
+                                f"Rename is not supported with wildcard patterns. `{pattern}` is not a valid pattern to use with rename."
                             )
 
-                        else:
-                            output_file_name = os.path.basename(artifact_file)
-
-                            if properties and properties.get("rename"):
-                                output_file_name = properties.get("rename")
-                                properties["rename"] = {
-                                    "old": artifact_file,
-                                    "new": properties.get("rename"),
-                                }
-
-                            new_artifact_file = "/stepresults/" + output_file_name
-                            archive_command = (
-                                "cp",
-                                "-L",
-                                artifact_file,
-                                new_artifact_file,
-                            )
-                            self._archive_file(
-                                artifact_lister,
-                                "file",
-                                output_file_name,
-                                archive_command,
-                                artifact_file,
-                                new_artifact_file,
-                                output_file_name,
-                                properties,
-                            )
+                    if match.is_dir:
+                        # directory => recursive copy
+                        self._archive_dir(artifact_source, properties, match)
+                        continue
 
-                # remove the stat output file
-                if os.path.exists(stat_output_file_local):
-                    os.remove(stat_output_file_local)
+                    output_file_name = os.path.basename(match.path)
+                    if properties and properties.get("rename"):
+                        output_file_name = properties.get("rename")
+                        properties["rename"] = {
+                            "old": match.path,
+                            "new": properties.get("rename"),
+                        }
+                    self.step_runner.log.debug(f"- found file {match.path}")
+                    for extracted in self._stream_artifact(
+                        artifact_source, match, output_file_name
+                    ):
+                        self._register_artifact(
+                            extracted.path, properties, extracted.properties
+                        )
 
         finally:
             if artifact_lister:
-                # make sure the current user/group ids of our
-                # process are set as the owner of the files
-                exit_code = artifact_lister.run(
-                    f"chown -R {int(os.getuid())}:{int(os.getgid())} /stepresults",
-                    console=console,
-                    log=self.step_runner.log,
-                )
-                if exit_code != 0:
-                    # pylint: disable=broad-exception-raised
-                    raise Exception(
-                        "Error gathering artifacts--unable to change ownership"
-                    )
-
                 artifact_lister.cleanup()
 
-    def _archive_dir(
-        self,
-        artifact_lister,
-        properties,
-        artifact_file,
-    ):  # pylint: disable=too-many-locals
+    def _stream_artifact(self, artifact_lister, match, dest_path):
+        """
+        Stream the matching file or directory out of the lister container into the
+        step results directory at the given path (relative to the results
+        directory), returning the files extracted.
+        """
+        try:
+            return list(
+                extract_artifacts(
+                    artifact_lister.stream_archive(match.real_path),
+                    self.step_runner.results_dir,
+                    dest_path,
+                    checksums=BuildRunnerConfig.get_instance().global_config.artifacts.checksums,
+                )
+            )
+        except (docker.errors.APIError, tarfile.TarError, OSError) as exc:
+            # pylint: disable=broad-exception-raised
+            raise Exception(f"Error gathering artifact {match.path}: {exc}") from exc
+
+    def _archive_dir(self, artifact_lister, properties, match):  # pylint: disable=too-many-locals
         """
         Archive the given directory.
         """
+        artifact_file = match.path
         # Rename doesn't apply to uncompressed directories
         if properties and properties.get("format", None) == "uncompressed":
-            # recursively find all files in dir and add
-            # each one, passing any properties
-            find_output_file = f"{str(uuid.uuid4())}.out"
-            find_output_file_local = os.path.join(
-                self.step_runner.results_dir,
-                find_output_file,
-            )
-            find_exit_code = artifact_lister.run(
-                f"find {artifact_file} -type f >/stepresults/{find_output_file}",
-                stream=False,
-                log=self.step_runner.log,
+            # stream the directory tree and add each file, passing any properties
+            self.step_runner.log.debug(f"- found directory {artifact_file}")
+            for extracted in self._stream_artifact(
+                artifact_lister,
+                match,
+                posixpath.normpath(artifact_file.lstrip("/")),
+            ):
+                self.step_runner.log.debug(f"- found file {extracted.path}")
+                self._register_artifact(
+                    extracted.path, properties, extracted.properties
+                )
+            return
+
+        filename = os.path.basename(artifact_file)
+
+        dest_filename = filename
+        if properties and properties.get("rename"):
+            dest_filename = properties.get("rename")
+            properties["rename"] = {
+                "old": artifact_file,
+                "new": properties.get("rename"),
+            }
+
+        arch_props = {
+            "name": dest_filename,
+            "compression": "gz",
+            "type": "tar",
+        }
+        if properties:
+            arch_props.update(properties.get("archive", {}))
+
+        new_properties = {}
+        if properties:
+            new_properties.update(properties)
+        new_properties["buildrunner.compressed.directory"] = "true"
+        self.step_runner.log.debug(f"- found directory {artifact_file}")
+
+        artifacts_config = BuildRunnerConfig.get_instance().global_config.artifacts
+        if arch_props["type"] == "tar":
+            suffix = arch_props.get(
+                "suffix", f".{arch_props['type']}.{arch_props['compression']}"
             )
-            if find_exit_code == 0:
-                with open(find_output_file_local, "r", encoding="utf-8") as output_fd:
-                    output = output_fd.read()
-                for _file in [_f.strip() for _f in output.split("\n")]:
-                    if not _file:
-                        continue
+            output_file_name = arch_props["name"] + suffix
+            if (
+                artifacts_config.compress_on_host
+                and arch_props["compression"] in ARTIFACT_HOST_COMPRESSIONS
+            ):
 
-                    output_file_name = _file
-                    new_artifact_file = "/stepresults/" + output_file_name
-                    _dir_name = os.path.dirname(_file)
-                    archive_command = (
-                        "mkdir",
-                        "-p",
-                        "/stepresults/" + _dir_name,
-                    )
-                    exit_code = artifact_lister.run(
-                        archive_command,
-                        log=self.step_runner.log,
-                    )
-                    if exit_code != 0:
-                        # pylint: disable=broad-exception-raised
-                        raise Exception(
-                            f"Error gathering artifact {artifact_file}",
-                        )
-                    archive_command = (
-                        "cp",
-                        "-r",
-                        _file,
-                        new_artifact_file,
+                def _write_archive(writer):
+                    summary = compress_artifacts(
+                        artifact_lister.stream_archive(match.real_path),
+                        writer,
+                        arch_props["name"],
+                        arch_props["compression"],
+                        artifacts_config.threads,
                     )
-                    self._archive_file(
-                        artifact_lister,
-                        "file",
-                        _file,
-                        archive_command,
-                        _file,
-                        new_artifact_file,
-                        output_file_name,
-                        properties,
+                    return (
+                        f"{summary.files} files and {summary.directories} directories"
                     )
 
-                # remove the find output file
-                if os.path.exists(find_output_file_local):
-                    os.remove(find_output_file_local)
-
-        else:
-            filename = os.path.basename(artifact_file)
-
-            dest_filename = filename
-            if properties and properties.get("rename"):
-                dest_filename = properties.get("rename")
-                properties["rename"] = {
-                    "old": artifact_file,
-                    "new": properties.get("rename"),
-                }
-
-            arch_props = {
-                "name": dest_filename,
-                "compression": "gz",
-                "type": "tar",
-            }
-            if properties:
-                arch_props.update(properties.get("archive", {}))
-
-            workdir = None
-            if arch_props["type"] == "tar":
-                suffix = arch_props.get(
-                    "suffix", f".{arch_props['type']}.{arch_props['compression']}"
+                self._register_artifact(
+                    output_file_name,
+                    new_properties,
+                    self._write_archive(match, output_file_name, _write_archive),
                 )
-                output_file_name = arch_props["name"] + suffix
-                new_artifact_file = "/stepresults/" + output_file_name
-                archive_command = [
-                    "tar",
-                    self.TAR_COMPRESSION_ARG.get(
-                        arch_props["compression"], "--auto-compress"
-                    ),
-                    "--xform",
-                    f"s|^{filename}|{arch_props['name']}|",
-                    "-cv",
-                ]
-                if os.path.dirname(artifact_file):
-                    archive_command.extend((
-                        "-C",
-                        os.path.dirname(artifact_file),
-                    ))
+                return
+
+            # the archive is written to the standard output and the verbose
+            # listing to the standard error
+            archive_command = [
+                "tar",
+                self.TAR_COMPRESSION_ARG.get(
+                    arch_props["compression"], "--auto-compress"
+                ),
+                "--xform",
+                f"s|^{filename}|{arch_props['name']}|",
+                "-cv",
+            ]
+            if os.path.dirname(artifact_file):
                 archive_command.extend((
-                    "-f",
-                    new_artifact_file,
-                    filename,
+                    "-C",
+                    os.path.dirname(artifact_file),
                 ))
-
-            elif arch_props["type"] == "zip":
-                output_file_name = f"{arch_props['name']}.{arch_props['type']}"
-                new_artifact_file = "/stepresults/" + output_file_name
-                archive_command = [
-                    "zip",
-                    new_artifact_file,
-                    artifact_file,
-                ]
-
-            new_properties = {}
-            if properties:
-                new_properties.update(properties)
-            new_properties["buildrunner.compressed.directory"] = "true"
-            self._archive_file(
-                artifact_lister,
-                "directory",
+            archive_command.extend((
+                "-f",
+                "-",
                 filename,
-                archive_command,
+            ))
+
+        elif arch_props["type"] == "zip":
+            output_file_name = f"{arch_props['name']}.{arch_props['type']}"
+            archive_command = [
+                "zip",
+                "-",
                 artifact_file,
-                new_artifact_file,
-                output_file_name,
-                new_properties,
-                workdir=workdir,
-            )
+            ]
+
+        def _run_archive_command(writer):
+            exit_code, listing = artifact_lister.run_to_file(archive_command, writer)
+            if exit_code != 0:
+                self.step_runner.log.debug(listing.decode("utf-8", errors="replace"))
+                # pylint: disable=broad-exception-raised
+                raise Exception(
+                    f"Error gathering artifact {artifact_file}",
+                )
+            # the archive commands list each entry they add, which is only counted
+            entries = len([line for line in listing.splitlines() if line.strip()])
+            return f"{entries} entries"
+
+        self._register_artifact(
+            output_file_name,
+            new_properties,
+            self._write_archive(match, output_file_name, _run_archive_command),
+        )
 
-    def _archive_file(
-        self,
-        artifact_lister,
-        file_type,
-        filename,
-        archive_command,
-        artifact_file,
-        new_artifact_file,
-        output_file_name,
-        properties,
-        workdir=None,
-    ):  # pylint: disable=too-many-arguments
+    def _write_archive(self, match, output_file_name, write_archive):
         """
-        Archive the given file.
+        Write the archive of the matching directory with the given function into the
+        given file of the step results directory. Returns the size and checksums of
+        the archive, which are computed while it is written.
         """
-        # Unused arg
-        _ = new_artifact_file
-
-        self.step_runner.log.debug(f"- found {file_type} {filename}")
-
-        exit_code = artifact_lister.run(
-            archive_command,
-            log=self.step_runner.log,
-            workdir=workdir,
-        )
-        if exit_code != 0:
+        output_file = os.path.join(self.step_runner.results_dir, output_file_name)
+        start_time = time.time()
+        written = False
+        try:
+            with open(output_file, "wb") as file_obj:
+                writer = HashingWriter(
+                    file_obj,
+                    BuildRunnerConfig.get_instance().global_config.artifacts.checksums,
+                )
+                entries = write_archive(writer)
+            written = True
+        except (docker.errors.APIError, tarfile.TarError, OSError) as exc:
             # pylint: disable=broad-exception-raised
-            raise Exception(
-                f"Error gathering artifact {artifact_file}",
-            )
+            raise Exception(f"Error gathering artifact {match.path}: {exc}") from exc
+        finally:
+            if not written and os.path.exists(output_file):
+                os.remove(output_file)
+        self.step_runner.log.info(
+            f"Archived {entries} of {match.path} into {output_file_name} in "
+            f"{time.time() - start_time:.1f}s"
+        )
+        return writer.get_properties()
 
+    def _register_artifact(self, output_file_name, properties, checksums=None):
+        """
+        Register the artifact written to the given path of the step results
+        directory with the run controller, unless it should not be pushed.
+        """
         if not properties or (
             isinstance(properties, dict) and properties.get("push", True)
         ):
@@ -464,6 +565,7 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                     output_file_name,
                 ),
                 properties,
+                checksums=checksums,
             )
 
     def _get_local_file(
@@ -600,7 +702,12 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
         if service.wait_for:
             _wait_for = service.wait_for
 
-        _volumes_from = [self._get_source_container()]
+        _volumes_from = []
+        _volumes = {
+            self.step_runner.build_runner.build_results_dir: ARTIFACTS_VOLUME_MOUNT
+            + ":ro",
+        }
+        self._add_source_mount(_volumes_from, _volumes)
 
         # attach the ssh agent to the service container
         if self._sshagent and service.inject_ssh_agent:
@@ -627,10 +734,6 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                 )
             )
 
-        _volumes = {
-            self.step_runner.build_runner.build_results_dir: ARTIFACTS_VOLUME_MOUNT
-            + ":ro",
-        }
         if service.files:
             for f_alias, f_path in service.files.items():
                 # lookup file from alias
@@ -715,9 +818,62 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             f'Started service container "{name}" ({service_container_id:.10})'
         )
 
+    def _probe_service(self, ipaddr, port, http_get=None):
+        """
+        Returns whether the port of the service accepts connections, and whether the
+        GET request of the given path succeeds when one is configured. The port is
+        probed from this process when the container can be reached directly,
+        otherwise from the helper container attached to the step network.
+        """
+        if self._probe_natively is None:
+            self._probe_natively = can_probe_natively()
+        if self._probe_natively:
+            if http_get:
+                result = probe_http(ipaddr, port, http_get)
+            else:
+                result = probe_port(ipaddr, port)
+            if result is not None:
+                return result
+            self.step_runner.log.info(
+                f"Unable to reach IP address {ipaddr} from this host, probing ports "
+                "from the helper container"
+            )
+            self._probe_natively = False
+
+        if not self._helper_container:
+            helper_container = self.step_runner.build_runner.get_helper_container()
+            helper_container.connect(self.step_runner.network_name)
+            self._helper_container = helper_container
+        if http_get:
+            return self._helper_container.probe_http(ipaddr, port, http_get)
+        return self._helper_container.probe_port(ipaddr, port)
+
+    def _run_readiness_command(self, name, command, deadline):
+        """
+        Returns whether the given readiness command succeeds in the named container.
+        The command runs detached and is given up on at the deadline, so a command
+        that hangs does not stall the wait past its timeout.
+        """
+        exec_id = self._docker_client.exec_create(
+            name, [DEFAULT_SHELL, "-c", command], stdout=False, stderr=False
+        )
+        self._docker_client.exec_start(exec_id, detach=True)
+        delays = get_backoff_delays()
+        while True:
+            exec_info = self._docker_client.exec_inspect(exec_id)
+            if not exec_info.get("Running"):
+                return exec_info.get("ExitCode") == 0
+            if time.time() > deadline:
+                self.step_runner.log.info(
+                    f"Readiness command {command!r} did not complete in container {name}"
+                )
+                return False
+            time.sleep(next(delays))
+
     def wait(self, name, wait_for_data):
         """
-        Wait for listening port on named container
+        Wait for listening port on named container, and for the service to be ready
+        when a readiness check is configured
         """
         network_settings = self._docker_client.inspect_container(name).get(
             "NetworkSettings", {}
@@ -730,8 +886,9 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             )
         else:
             ipaddr = network_settings.get("IPAddress", None)
-        socket_open = False
 
+        http_get = None
+        command = None
         if isinstance(wait_for_data, dict):
             port = wait_for_data.get("port")
             if not port:
@@ -741,62 +898,53 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             timeout = wait_for_data.get("timeout", self.WAIT_FOR_DEFAULT_TIMEOUT)
             if not isinstance(timeout, int):
                 timeout = int(timeout)
+            http_get = wait_for_data.get("http-get")
+            command = wait_for_data.get("command")
         else:
             port = wait_for_data
             timeout = self.WAIT_FOR_DEFAULT_TIMEOUT
 
         start_time = time.time()
-        while not socket_open:
-            time_spent = int(time.time() - start_time)
-            self.step_runner.log.info(
-                f"Waiting for port {port} to be listening for connections in container {name} "
-                f"with IP address {ipaddr} ({time_spent}/{timeout} seconds elapsed)"
-            )
-
-            # check that the container is still available
-            container = self._docker_client.inspect_container(name)
-            container_status = container.get("State", {}).get("Status")
-            if container_status not in ["created", "running"]:
-                raise BuildRunnerProcessingError(
-                    f"Unable to wait for a service port {port} to be ready, the container"
-                    f" {name} status is {container_status}"
-                )
-
-            # Use a small nc image to test if the port is open from within the docker network
-            # Linux can talk to containers directly, but mac and other OSes cannot
-            # See https://github.com/docker/for-mac/issues/155 for more info for mac
-            nc_tester = None
-            try:
-                image_config = DockerRunner.ImageConfig(
-                    f"{BuildRunnerConfig.get_instance().global_config.docker_registry}/{self.NC_DOCKER_IMAGE}",
-                    pull_image=False,
-                )
-                nc_tester = DockerRunner(
-                    image_config,
-                    # Do not log anything from this container
-                    log=None,
-                )
-                nc_tester.start(
-                    # The shell is the command
-                    shell=f"-n -z {ipaddr} {port}",
-                    network=self.step_runner.network_name,
+        status_time = None
+        delays = get_backoff_delays()
+        while True:
+            now = time.time()
+            time_spent = now - start_time
+            # The container status is only checked (and progress logged) periodically
+            # since the probes are retried more often at first
+            if (
+                status_time is None
+                or now - status_time >= self.WAIT_FOR_STATUS_INTERVAL
+            ):
+                status_time = now
+                self.step_runner.log.info(
+                    f"Waiting for port {port} to be listening for connections in container {name} "
+                    f"with IP address {ipaddr} ({int(time_spent)}/{timeout} seconds elapsed)"
                 )
 
-                nc_tester.attach_until_finished()
-                exit_code = nc_tester.exit_code
-                socket_open = exit_code is not None and not exit_code
-            finally:
-                if nc_tester:
-                    nc_tester.cleanup()
-
-            if not socket_open:
-                # Make sure we have not yet timed out
-                if time_spent > timeout:
+                # check that the container is still available
+                container = self._docker_client.inspect_container(name)
+                container_status = container.get("State", {}).get("Status")
+                if container_status not in ["created", "running"]:
                     raise BuildRunnerProcessingError(
-                        f"Timed out waiting for port {port} to be opened in container {name} "
-                        f"with IP address {ipaddr} after {timeout} seconds"
+                        f"Unable to wait for a service port {port} to be ready, the container"
+                        f" {name} status is {container_status}"
                     )
-                time.sleep(1)
+
+            if self._probe_service(ipaddr, port, http_get) and (
+                not command
+                or self._run_readiness_command(name, command, start_time + timeout)
+            ):
+                break
+
+            # Make sure we have not yet timed out, the checks may have taken a while
+            if time.time() - start_time > timeout:
+                raise BuildRunnerProcessingError(
+                    f"Timed out waiting for port {port} to be "
+                    f"{'ready' if http_get or command else 'opened'} in container {name} "
+                    f"with IP address {ipaddr} after {timeout} seconds"
+                )
+            time.sleep(next(delays))
 
         self.step_runner.log.info(
             f"Port {int(port)} is listening in container {name} with IP address {ipaddr}"
@@ -879,7 +1027,7 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             "environment": _env_defaults,
             "containers": None,
             "ports": None,
-            "volumes_from": [_source_container],
+            "volumes_from": [],
             "volumes": {
                 self.step_runner.build_runner.build_results_dir: (
                     ARTIFACTS_VOLUME_MOUNT + ":ro"
@@ -888,7 +1036,12 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             "cap_add": None,
             "privileged": None,
         }
+        self._add_source_mount(
+            container_args["volumes_from"], container_args["volumes"]
+        )
         caches = OrderedDict()
+        # The docker paths whose cache is saved to all of its keys
+        save_all_paths = set()
 
         # see if we need to inject ssh keys
         if self.step.ssh_keys:
@@ -906,15 +1059,10 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                 )
             )
 
-        # start the docker daemon proxy
-        self._dockerdaemonproxy = DockerDaemonProxy(
-            self._docker_client,
-            self.step_runner.log,
-            buildrunner_config.global_config.docker_registry,
-            self.step_runner.container_labels,
-            self.step_runner.network_name,
+        # the docker daemon proxy is shared by every step
+        self._dockerdaemonproxy = (
+            self.step_runner.build_runner.get_docker_daemon_proxy()
         )
-        self._dockerdaemonproxy.start()
 
         # start any service containers
         if self.step.services:
@@ -1019,7 +1167,27 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                 container_meta_logger.info(f"Mounting {f_local} -> {f_path}")
 
         if self.step.caches:
+            default_storage = buildrunner_config.global_config.caches.storage
+            default_save_all_keys = (
+                buildrunner_config.global_config.caches.save_all_keys
+            )
             for key, value in self.step.caches.items():
+                storage = default_storage
+                save_all_keys = default_save_all_keys
+                if isinstance(value, StepCache):
+                    storage = value.storage or default_storage
+                    if value.save_all_keys is not None:
+                        save_all_keys = value.save_all_keys
+                    value = value.keys
+                if storage == CACHE_STORAGE_VOLUME:
+                    self._mount_cache_volume(
+                        key,
+                        value,
+                        buildrunner_config,
+                        container_args["volumes"],
+                        container_meta_logger,
+                    )
+                    continue
                 if isinstance(value, str):
                     # get the cache location from the main BuildRunner class
                     cache_archive_file = (
@@ -1033,6 +1201,8 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                         f"Considering local cache `{cache_archive_file}` -> docker path `{value}`"
                     )
                 elif isinstance(value, list):
+                    if save_all_keys:
+                        save_all_paths.add(key)
                     for cache_local in value:
                         cache_archive_file = (
                             self.step_runner.build_runner.get_cache_archive_file(
@@ -1095,7 +1265,9 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                 links=self._service_links, **container_args
             )
 
-            self.runner.restore_caches(container_meta_logger, caches)
+            self.runner.restore_caches(
+                container_meta_logger, caches, container_args.get("environment")
+            )
 
             self.step_runner.log.info(f"Started build container {container_id:.10}")
 
@@ -1132,16 +1304,21 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
             else:
                 try:
                     self.runner.save_caches(
-                        container_meta_logger, caches, container_args.get("environment")
+                        container_meta_logger,
+                        caches,
+                        container_args.get("environment"),
+                        save_all_paths=save_all_paths,
                     )
                 except Exception as _ex:
                     container_meta_logger.error(
                         f"Error saving caches, ignoring: {_ex}",
                     )
                     # Failing to save caches should not fail the build, just continue as normal
+                self._promote_cache_volumes(container_meta_logger)
 
         finally:
             if self.runner:
+                self._write_cache_telemetry(container_meta_logger)
                 self.runner.stop()
             if container_logger:
                 container_logger.cleanup()
@@ -1193,13 +1370,25 @@ class RunBuildStepRunnerTask(BuildStepRunnerTask):
                 )
             self.runner.cleanup()
 
+        # Cache volumes can only be removed once the build container is removed, the
+        # volumes they were copied from are kept
+        for volume in self._claimed_cache_volumes:
+            self.step_runner.log.info(f"Discarding cache volume {volume}")
+            try:
+                self._cache_volumes.discard(volume)
+            except Exception as _ex:  # pylint: disable=broad-except
+                self.step_runner.log.info(f"Error discarding cache volume: {_ex}")
+        self._claimed_cache_volumes.clear()
+
         if self._service_runners:
             for _sname, _srun in reversed(list(self._service_runners.items())):
                 self.step_runner.log.info(f'Destroying service container "{_sname}"')
                 _srun.cleanup()
 
-        if self._dockerdaemonproxy:
-            self._dockerdaemonproxy.stop()
+        # The helper container must leave the step network before it is removed
+        if self._helper_container:
+            self._helper_container.disconnect(self.step_runner.network_name)
+            self._helper_container = None
 
         if self._sshagent:
             self._sshagent.stop()
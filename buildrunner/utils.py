@@ -13,20 +13,21 @@ import logging
 import os
 import re
 import sys
+import time
 import uuid
 import portalocker
-import timeout_decorator
 import yaml.resolver
 import yaml.scanner
 import glob
 import hashlib
-from typing import Optional, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 from buildrunner import loggers
 from buildrunner.errors import BuildRunnerConfigurationError
 
 
 LOCK_TIMEOUT_SECONDS = 1800.0
+LOCK_POLL_SECONDS = 0.1
 LOGGER = logging.getLogger(__name__)
 
 
@@ -196,6 +197,52 @@ def hash_sha1(file_name_globs=None):
     return hasher.hexdigest()
 
 
+def find_lockfiles(*file_name_globs: str) -> List[str]:
+    """
+    Return the sorted names of the files matching the given globs, where '**' matches
+    any number of directories.
+    """
+    file_names = set()
+    for file_name_glob in file_name_globs:
+        file_names.update(
+            file_name
+            for file_name in glob.glob(file_name_glob, recursive=True)
+            if os.path.isfile(file_name)
+        )
+    return sorted(file_names)
+
+
+def lockfile_hash(*file_name_globs: str, length: int = 16) -> str:
+    """
+    Return a sha1 hash of the names and content of the files matching the given globs,
+    shortened to the given length for use in cache keys. Unlike hash_sha1, '**' matches
+    any number of directories and renaming or moving a file changes the hash.
+    """
+    file_names = find_lockfiles(*file_name_globs)
+    if not file_names:
+        LOGGER.warning(
+            f"No file matches {', '.join(file_name_globs)} in {os.getcwd()}, the "
+            "lockfile hash is the same for every build"
+        )
+    return hash_lockfiles(file_names, length=length)
+
+
+def hash_lockfiles(file_names: List[str], length: int = 16) -> str:
+    """
+    Return the hash of lockfile_hash for the given file names (see find_lockfiles).
+    """
+    hasher = hashlib.sha1()
+    for file_name in file_names:
+        hasher.update(file_name.encode("utf-8") + b"\0")
+        try:
+            with open(file_name, "rb") as open_file:
+                for buf in iter(lambda: open_file.read(2**16), b""):
+                    hasher.update(buf)
+        except OSError:
+            LOGGER.warning(f"Error reading file: {file_name}")
+    return hasher.hexdigest()[:length]
+
+
 def _acquire_flock_open(
     lock_file: str,
     logger: loggers.ContainerLogger,
@@ -214,20 +261,26 @@ def _acquire_flock_open(
     :return: opened file object if successful else None
     """
 
-    @timeout_decorator.timeout(
-        seconds=timeout_seconds, timeout_exception=FailureToAcquireLockException
-    )
     def get_lock(file_obj: io.IOBase):
+        # Poll for the lock instead of using a signal based timeout, which only works
+        # on the main thread
         flags = (
             portalocker.LockFlags.EXCLUSIVE
             if exclusive
             else portalocker.LockFlags.SHARED
-        )
-        portalocker.lock(
-            file_obj,
-            flags,
-        )
-        return file_obj
+        ) | portalocker.LockFlags.NON_BLOCKING
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            try:
+                portalocker.lock(
+                    file_obj,
+                    flags,
+                )
+                return file_obj
+            except portalocker.LockException as exc:
+                if time.monotonic() >= deadline:
+                    raise FailureToAcquireLockException() from exc
+                time.sleep(LOCK_POLL_SECONDS)
 
     # pylint: disable=unspecified-encoding,consider-using-with
     file_obj = open(lock_file, mode)
@@ -307,3 +360,31 @@ def release_flock(
     portalocker.unlock(lock_file_obj)
     lock_file_obj.close()
     logger.info(f"PID:{os.getpid()} released and closed file {lock_file_obj.name}")
+
+
+class IterableReader(io.RawIOBase):
+    """
+    A readable file object over an iterable of bytes, e.g. the chunks of an archive
+    returned by get_archive, so that it can be read while it is being produced.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self._chunks = iter(chunks)
+        self._current = b""
+        self._offset = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._current):
+            self._current = next(self._chunks, None)
+            self._offset = 0
+            if self._current is None:
+                self._current = b""
+                return 0
+        length = min(len(buffer), len(self._current) - self._offset)
+        buffer[:length] = self._current[self._offset : self._offset + length]
+        self._offset += length
+        return length
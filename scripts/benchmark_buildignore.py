@@ -0,0 +1,193 @@
+"""
+Copyright 2026 Adobe
+All Rights Reserved.
+
+NOTICE: Adobe permits you to use, modify, and distribute this file in accordance
+with the terms of the Adobe license agreement accompanying it.
+"""
+
+import argparse
+import fnmatch
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from buildrunner.source.archive import SourceArchiver
+from buildrunner.source.ignore import IgnoreMatcher
+
+
+EXTENSIONS = ["py", "js", "java", "txt", "json", "md", "class", "pyc", "log", "ts"]
+
+
+def generate_tree(num_files, files_per_dir=50, dirs_per_dir=8, seed=0):
+    """
+    Generate a synthetic tree as a dict of directory -> (subdirectories, files).
+    A fraction of the directories are dependency directories (node_modules, target).
+    """
+    rand = random.Random(seed)
+    tree = {"": ([], [])}
+    pending = [""]
+    created = 0
+    while created < num_files:
+        parent = pending.pop(0)
+        subdirs, files = tree[parent]
+        for index in range(files_per_dir):
+            if created >= num_files:
+                break
+            files.append(f"file{index}.{rand.choice(EXTENSIONS)}")
+            created += 1
+        for index in range(dirs_per_dir):
+            name = (
+                rand.choice(["node_modules", "target", "build"])
+                if (rand.random() < 0.1)
+                else f"dir{index}"
+            )
+            path = f"{parent}/{name}" if parent else name
+            if path in tree:
+                continue
+            tree[path] = ([], [])
+            subdirs.append(name)
+            pending.append(path)
+    return tree
+
+
+def generate_patterns(num_patterns, seed=0):
+    """
+    Generate a realistic mix of ignore patterns.
+    """
+    rand = random.Random(seed)
+    patterns = ["node_modules", "target/", "*.pyc", "*.class", "/build", "!keep.log"]
+    while len(patterns) < num_patterns:
+        choice = rand.randrange(4)
+        if choice == 0:
+            patterns.append(f"*.ext{len(patterns)}")
+        elif choice == 1:
+            patterns.append(f"/generated{len(patterns)}/")
+        elif choice == 2:
+            patterns.append(f"**/cache{len(patterns)}/**")
+        else:
+            patterns.append(f"dir{rand.randrange(8)}/tmp{len(patterns)}*")
+    return patterns
+
+
+def iter_paths(tree):
+    for parent, (subdirs, files) in tree.items():
+        for name in subdirs:
+            yield (f"{parent}/{name}" if parent else name), True
+        for name in files:
+            yield (f"{parent}/{name}" if parent else name), False
+
+
+def walk_with_pruning(tree, is_excluded):
+    """
+    Walk the tree, skipping excluded directories, returning the number of paths checked
+    and the number kept.
+    """
+    checked = kept = 0
+    pending = [""]
+    while pending:
+        parent = pending.pop()
+        subdirs, files = tree[parent]
+        for name in subdirs:
+            path = f"{parent}/{name}" if parent else name
+            checked += 1
+            if not is_excluded(path, True):
+                kept += 1
+                pending.append(path)
+        for name in files:
+            path = f"{parent}/{name}" if parent else name
+            checked += 1
+            if not is_excluded(path, False):
+                kept += 1
+    return checked, kept
+
+
+def materialize(tree, root):
+    for parent, (_, files) in tree.items():
+        directory = os.path.join(root, parent)
+        os.makedirs(directory, exist_ok=True)
+        for name in files:
+            with open(os.path.join(directory, name), "wb"):
+                pass
+
+
+def run(args):
+    tree = generate_tree(args.files)
+    patterns = generate_patterns(args.patterns)
+    all_paths = list(iter_paths(tree))
+    print(
+        f"Synthetic tree: {sum(len(files) for _, files in tree.values())} files, "
+        f"{len(tree)} directories, {len(patterns)} patterns"
+    )
+
+    # Legacy behavior: fnmatch every pattern against every path, measured on a sample
+    sample = all_paths[: args.legacy_sample]
+    start = time.perf_counter()
+    for path, _ in sample:
+        for pattern in patterns:
+            if fnmatch.fnmatch(path, pattern):
+                break
+    legacy_seconds = time.perf_counter() - start
+    print(
+        f"legacy fnmatch:            {legacy_seconds:8.3f}s for {len(sample)} paths "
+        f"(~{legacy_seconds * len(all_paths) / max(len(sample), 1):.1f}s extrapolated)"
+    )
+
+    start = time.perf_counter()
+    matcher = IgnoreMatcher(patterns)
+    compile_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path, is_dir in all_paths:
+        matcher.match(path, is_dir)
+    print(
+        f"compiled, every path:      {time.perf_counter() - start:8.3f}s "
+        f"for {len(all_paths)} paths (compiled in {compile_seconds:.4f}s)"
+    )
+
+    start = time.perf_counter()
+    checked, kept = walk_with_pruning(tree, matcher.match)
+    print(
+        f"compiled, pruned walk:     {time.perf_counter() - start:8.3f}s "
+        f"({checked} paths checked, {kept} kept)"
+    )
+
+    if args.on_disk:
+        root = tempfile.mkdtemp(prefix="buildrunner-benchmark-")
+        try:
+            materialize(tree, root)
+            archiver = SourceArchiver(root, root, "benchmark", exclude=matcher.match)
+            start = time.perf_counter()
+            entries = archiver.scan()
+            print(
+                f"on-disk scan:              {time.perf_counter() - start:8.3f}s "
+                f"({len(entries)} entries)"
+            )
+        finally:
+            shutil.rmtree(root)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark .buildignore matching over a synthetic source tree"
+    )
+    parser.add_argument("--files", type=int, default=500000)
+    parser.add_argument("--patterns", type=int, default=200)
+    parser.add_argument(
+        "--legacy-sample",
+        type=int,
+        default=20000,
+        help="number of paths to time the legacy matcher on",
+    )
+    parser.add_argument(
+        "--on-disk",
+        action="store_true",
+        help="also create the tree on disk and time the source archive scan",
+    )
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
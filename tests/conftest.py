@@ -0,0 +1,40 @@
+from unittest import mock
+
+import pytest
+
+from buildrunner.config import BuildRunnerConfig
+from buildrunner.docker.runner import DockerRunner
+
+
+@pytest.fixture(name="initialize_config")
+def fixture_initialize_config(tmp_path):
+    buildrunner_path = tmp_path / "buildrunner.yaml"
+    buildrunner_path.write_text("steps: {'step1': {}}")
+    BuildRunnerConfig.initialize_instance(
+        build_id="123",
+        vcs=None,
+        build_dir=str(tmp_path),
+        global_config_file=None,
+        run_config_file=str(buildrunner_path),
+        build_time=0,
+        build_number=1,
+        push=False,
+        steps_to_run=None,
+        log_generated_files=False,
+        global_config_overrides={},
+        platform=None,
+    )
+
+
+@pytest.fixture(name="runner")
+def fixture_runner():
+    """
+    A runner with a mocked docker client and a started container.
+    """
+    with mock.patch("buildrunner.docker.runner.new_client") as new_client:
+        docker_client = new_client.return_value
+        docker_client.images.return_value = [{"Id": "id1", "RepoTags": ["busybox"]}]
+        runner = DockerRunner(DockerRunner.ImageConfig("busybox", pull_image=False))
+    runner.container = {"Id": "container1"}
+    runner.run = mock.MagicMock(return_value=0)
+    return runner
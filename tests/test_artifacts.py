@@ -0,0 +1,405 @@
+import gzip
+import hashlib
+import io
+import os
+import subprocess
+import tarfile
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner import BuildRunner
+from buildrunner.artifacts import (
+    ExtractedArtifact,
+    ParallelBlockWriter,
+    compress_artifacts,
+    extract_artifacts,
+    get_artifact_listing_command,
+    parse_artifact_listing,
+)
+from buildrunner.config.models_step import StepRun
+from buildrunner.docker.runner import DockerRunner
+from buildrunner.errors import BuildRunnerProcessingError
+from buildrunner.steprunner.tasks.run import RunBuildStepRunnerTask
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+@pytest.fixture(name="source")
+def fixture_source(tmp_path):
+    source = tmp_path / "source"
+    (source / "build" / "dist" / "sub").mkdir(parents=True)
+    (source / "build" / "app.rpm").write_bytes(b"rpm")
+    (source / "build" / "app-debug.rpm").write_bytes(b"debug")
+    (source / "build" / "dist" / "index.html").write_text("index")
+    (source / "build" / "dist" / "sub" / "app.js").write_text("app")
+    os.link(
+        source / "build" / "dist" / "index.html",
+        source / "build" / "dist" / "sub" / "index.html",
+    )
+    (source / "build" / "dist" / "latest").symlink_to("index.html")
+    (source / "app.rpm").symlink_to("build/app.rpm")
+    return source
+
+
+def _archive(path) -> list:
+    """
+    Returns the chunks of an archive of the path like the ones of get_archive.
+    """
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w") as tar:
+        tar.add(str(path), arcname=os.path.basename(str(path)))
+    data = tar_bytes.getvalue()
+    return [data[offset : offset + 1000] for offset in range(0, len(data), 1000)]
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_listing(source):
+    command = get_artifact_listing_command([
+        "build/*.rpm",
+        "build/dist",
+        "missing/*",
+        "app.rpm",
+    ])
+    output = subprocess.run(
+        ["/bin/sh", "-c", command],
+        cwd=source,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    matches = parse_artifact_listing(output)
+    assert {
+        index: [(match.path, match.is_dir) for match in index_matches]
+        for index, index_matches in matches.items()
+    } == {
+        0: [("build/app-debug.rpm", False), ("build/app.rpm", False)],
+        1: [("build/dist", True)],
+        3: [("app.rpm", False)],
+    }
+    # Symbolic links are resolved like cp -L did
+    assert matches[3][0].real_path == str(source.resolve() / "build" / "app.rpm")
+
+
+def test_extract_file(source, tmp_path):
+    results = tmp_path / "results"
+    files = list(
+        extract_artifacts(
+            _archive(source / "build" / "app.rpm"),
+            str(results),
+            "renamed.rpm",
+            checksums=["sha256"],
+        )
+    )
+    assert files == [
+        ExtractedArtifact(
+            "renamed.rpm",
+            {"buildrunner.size": 3, "buildrunner.sha256": _sha256(b"rpm")},
+        )
+    ]
+    assert (results / "renamed.rpm").read_bytes() == b"rpm"
+
+
+def test_extract_directory(source, tmp_path):
+    results = tmp_path / "results"
+    with mock.patch("buildrunner.artifacts.os.chown") as chown:
+        files = list(
+            extract_artifacts(
+                _archive(source / "build" / "dist"),
+                str(results),
+                "build/dist",
+                uid=os.getuid() + 1,
+                gid=os.getgid(),
+                checksums=["md5", "sha1"],
+            )
+        )
+    # Only regular files are extracted, hard links are copied
+    files = {extracted.path: extracted.properties for extracted in files}
+    assert sorted(files) == [
+        "build/dist/index.html",
+        "build/dist/sub/app.js",
+        "build/dist/sub/index.html",
+    ]
+    # The checksums of a link are the ones of the file it links to
+    assert files["build/dist/sub/index.html"] == {
+        "buildrunner.size": 5,
+        "buildrunner.md5": hashlib.md5(b"index").hexdigest(),
+        "buildrunner.sha1": hashlib.sha1(b"index").hexdigest(),
+    }
+    assert (results / "build" / "dist" / "sub" / "index.html").read_text() == "index"
+    assert not (results / "build" / "dist" / "latest").exists()
+    # The ownership is fixed as the files are written
+    chowned = {os.path.relpath(call.args[0], results) for call in chown.call_args_list}
+    assert chowned == set(files) | {"build/dist", "build/dist/sub"}
+
+
+def test_extract_rejects_paths_outside_of_the_archive(tmp_path):
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w") as tar:
+        for name in ("dist/file1", "dist/../../file2"):
+            info = tarfile.TarInfo(name)
+            info.size = 1
+            tar.addfile(info, io.BytesIO(b"1"))
+    with pytest.raises(BuildRunnerProcessingError):
+        list(
+            extract_artifacts([tar_bytes.getvalue()], str(tmp_path / "results"), "dist")
+        )
+    assert not (tmp_path / "file2").exists()
+
+
+def _create_task(tmp_path, artifacts):
+    results = tmp_path / "results"
+    results.mkdir()
+    step_runner = mock.MagicMock()
+    step_runner.name = "step1"
+    step_runner.results_dir = str(results)
+    step_runner.network_name = None
+    step_runner.build_runner.get_source_volume.return_value = None
+    task = RunBuildStepRunnerTask.__new__(RunBuildStepRunnerTask)
+    task.step_runner = step_runner
+    task.step = StepRun(image="image1", artifacts=artifacts)
+    task._source_container = "source1"  # pylint: disable=protected-access
+    return task
+
+
+def _retrieve_artifacts(task, source, listing):
+    """
+    Retrieve the artifacts of the task from the source directory, the archive
+    commands run in the container write "archive" and the given listing.
+    """
+
+    def _run_to_file(command, file_obj):
+        _ = command
+        file_obj.write(b"archive")
+        return 0, listing
+
+    with mock.patch(
+        "buildrunner.steprunner.tasks.run.DockerRunner"
+    ) as docker_runner_class:
+        artifact_lister = docker_runner_class.return_value
+        artifact_lister.run_with_output.side_effect = lambda command: (
+            0,
+            subprocess.run(
+                ["/bin/sh", "-c", command], cwd=source, check=True, capture_output=True
+            ).stdout,
+        )
+        artifact_lister.run_to_file.side_effect = _run_to_file
+        artifact_lister.stream_archive.side_effect = _archive
+        task._retrieve_artifacts()  # pylint: disable=protected-access
+    return artifact_lister
+
+
+def _get_artifacts(task):
+    return {
+        call.args[0]: (call.args[1], call.kwargs["checksums"])
+        for call in task.step_runner.build_runner.add_artifact.call_args_list
+    }
+
+
+def test_retrieve_artifacts(source, tmp_path):
+    task = _create_task(
+        tmp_path,
+        {
+            "build/*.rpm": {"platform": "x86_64"},
+            "build/dist": {"format": "uncompressed"},
+            "app.rpm": {"rename": "renamed.rpm"},
+            "build/dist/sub": None,
+            "missing/*": None,
+        },
+    )
+    artifact_lister = _retrieve_artifacts(
+        task, source, b"sub/\nsub/app.js\nsub/index.html\n"
+    )
+
+    # The patterns are listed in a single exec, only the compressed directory is
+    # archived in the container and streamed from its output, and nothing is
+    # chowned in the container
+    artifact_lister.run_with_output.assert_called_once()
+    artifact_lister.run_to_file.assert_called_once()
+    command = artifact_lister.run_to_file.call_args.args[0]
+    assert command[0] == "tar"
+    assert command[-3:] == ["-f", "-", "sub"]
+    artifact_lister.run.assert_not_called()
+    artifact_lister.cleanup.assert_called_once()
+    # The verbose listing of the archive is summarized
+    assert any(
+        call.args[0].startswith("Archived 3 entries of build/dist/sub into sub.tar.gz")
+        for call in task.step_runner.log.info.call_args_list
+    )
+
+    artifacts = _get_artifacts(task)
+    assert sorted(artifacts) == [
+        "step1/app-debug.rpm",
+        "step1/app.rpm",
+        "step1/build/dist/index.html",
+        "step1/build/dist/sub/app.js",
+        "step1/build/dist/sub/index.html",
+        "step1/renamed.rpm",
+        "step1/sub.tar.gz",
+    ]
+    # The size and checksums are recorded while the artifacts are written
+    assert artifacts["step1/app.rpm"] == (
+        {"platform": "x86_64"},
+        {"buildrunner.size": 3, "buildrunner.sha256": _sha256(b"rpm")},
+    )
+    assert artifacts["step1/sub.tar.gz"] == (
+        {"buildrunner.compressed.directory": "true"},
+        {"buildrunner.size": 7, "buildrunner.sha256": _sha256(b"archive")},
+    )
+    results = tmp_path / "results"
+    assert (results / "sub.tar.gz").read_bytes() == b"archive"
+    assert (results / "renamed.rpm").read_bytes() == b"rpm"
+    assert (results / "build" / "dist" / "sub" / "app.js").read_text() == "app"
+
+
+def test_retrieve_artifacts_from_helper_container(source, tmp_path):
+    task = _create_task(tmp_path, {"app.rpm": None})
+    build_runner = task.step_runner.build_runner
+    build_runner.get_source_volume.return_value = mock.MagicMock()
+    helper_container = build_runner.get_helper_container.return_value
+    helper_container.run_with_output.side_effect = lambda command: (
+        0,
+        subprocess.run(
+            ["/bin/sh", "-c", command], cwd=source, check=True, capture_output=True
+        ).stdout,
+    )
+    helper_container.stream_archive.side_effect = _archive
+    with mock.patch(
+        "buildrunner.steprunner.tasks.run.DockerRunner"
+    ) as docker_runner_class:
+        task._retrieve_artifacts()  # pylint: disable=protected-access
+
+    # The source volume is listed in the helper container shared by the build, which
+    # is kept for the other steps
+    docker_runner_class.assert_not_called()
+    helper_container.run_with_output.assert_called_once()
+    helper_container.remove.assert_not_called()
+    assert sorted(_get_artifacts(task)) == ["step1/app.rpm"]
+    assert (tmp_path / "results" / "app.rpm").read_bytes() == b"rpm"
+
+
+def test_add_artifact_checksums():
+    build_runner = mock.MagicMock()
+    build_runner.artifacts = {}
+    properties = {"platform": "x86_64"}
+    for name in ("file1", "file2"):
+        BuildRunner.add_artifact(
+            build_runner, name, properties, checksums={"buildrunner.size": len(name)}
+        )
+    BuildRunner.add_artifact(build_runner, "file3", None)
+    # The properties shared by the artifacts of a pattern are not changed
+    assert properties == {"platform": "x86_64"}
+    assert build_runner.artifacts == {
+        "file1": {"platform": "x86_64", "buildrunner.size": 5},
+        "file2": {"platform": "x86_64", "buildrunner.size": 5},
+        "file3": None,
+    }
+
+
+def test_parallel_block_writer():
+    data = os.urandom(50000) * 3
+    file_obj = io.BytesIO()
+    with ParallelBlockWriter(
+        file_obj, lambda block: gzip.compress(block, mtime=0), 3, block_size=10000
+    ) as writer:
+        for offset in range(0, len(data), 7000):
+            writer.write(data[offset : offset + 7000])
+    # Each block is a gzip member, written in order
+    assert gzip.decompress(file_obj.getvalue()) == data
+    assert file_obj.getvalue().count(b"\x1f\x8b\x08") >= 15
+
+    # An empty archive is still a valid stream
+    file_obj = io.BytesIO()
+    with ParallelBlockWriter(file_obj, gzip.compress, 2):
+        pass
+    assert gzip.decompress(file_obj.getvalue()) == b""
+
+
+@pytest.mark.parametrize(
+    "compression, mode", [("gz", "gz"), ("bz2", "bz2"), ("xz", "xz")]
+)
+def test_compress_artifacts(source, compression, mode):
+    file_obj = io.BytesIO()
+    summary = compress_artifacts(
+        _archive(source / "build" / "dist"), file_obj, "site", compression, threads=2
+    )
+    assert (summary.files, summary.directories, summary.others) == (2, 2, 2)
+    file_obj.seek(0)
+    with tarfile.open(fileobj=file_obj, mode=f"r:{mode}") as tar:
+        members = {member.name: member for member in tar}
+        assert sorted(members) == [
+            "site",
+            "site/index.html",
+            "site/latest",
+            "site/sub",
+            "site/sub/app.js",
+            "site/sub/index.html",
+        ]
+        # Links are kept and point into the renamed directory
+        assert members["site/latest"].issym()
+        assert members["site/sub/index.html"].linkname == "site/index.html"
+        assert tar.extractfile("site/sub/app.js").read() == b"app"
+
+
+def test_compress_artifacts_zstd(source):
+    zstandard = pytest.importorskip("zstandard")
+    file_obj = io.BytesIO()
+    compress_artifacts(_archive(source / "build" / "dist"), file_obj, "dist", "zst")
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(file_obj.getvalue()))
+    with tarfile.open(fileobj=reader, mode="r|") as tar:
+        assert "dist/sub/app.js" in [member.name for member in tar]
+
+
+def test_retrieve_artifacts_compressed_on_host(source, tmp_path):
+    global_config = BuildRunnerConfig.get_instance().global_config
+    global_config.artifacts.compress_on_host = True
+    global_config.artifacts.checksums = []
+    task = _create_task(
+        tmp_path,
+        {
+            "build/dist": {"rename": "site", "archive": {"compression": "xz"}},
+            "build/dist/sub": {"archive": {"type": "zip"}},
+        },
+    )
+    artifact_lister = _retrieve_artifacts(task, source, b"adding: sub/app.js\n")
+
+    # Zip archives are still created in the container
+    assert [
+        call.args[0][:2] for call in artifact_lister.run_to_file.call_args_list
+    ] == [["zip", "-"]]
+    artifacts = _get_artifacts(task)
+    assert sorted(artifacts) == ["step1/site.tar.xz", "step1/sub.zip"]
+    results = tmp_path / "results"
+    assert artifacts["step1/site.tar.xz"][1] == {
+        "buildrunner.size": (results / "site.tar.xz").stat().st_size
+    }
+    with tarfile.open(results / "site.tar.xz") as tar:
+        assert "site/sub/app.js" in tar.getnames()
+
+
+def test_run_to_file():
+    with mock.patch("buildrunner.docker.runner.new_client") as new_client:
+        docker_client = new_client.return_value
+        docker_client.images.return_value = [{"Id": "id1", "RepoTags": ["busybox"]}]
+        runner = DockerRunner(DockerRunner.ImageConfig("busybox", pull_image=False))
+    runner.container = {"Id": "container1"}
+    docker_client.exec_start.return_value = iter([
+        (b"data1", None),
+        (None, b"dist/\n"),
+        (b"data2", b"dist/file1\n"),
+    ])
+    docker_client.exec_inspect.return_value = {"ExitCode": 0}
+    file_obj = io.BytesIO()
+    assert runner.run_to_file(["tar", "-cvf", "-", "dist"], file_obj) == (
+        0,
+        b"dist/\ndist/file1\n",
+    )
+    assert file_obj.getvalue() == b"data1data2"
+    docker_client.exec_start.assert_called_once_with(
+        docker_client.exec_create.return_value, stream=True, demux=True
+    )
@@ -0,0 +1,291 @@
+import datetime
+import email.utils
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.caches.backend import (
+    HttpCacheBackend,
+    RemoteCache,
+    RemoteCacheObject,
+    S3CacheBackend,
+    wait_for_remote_caches,
+)
+from buildrunner.config.models import GlobalCacheBackendConfig
+from buildrunner.docker.runner import DockerRunner
+from tests.utils import create_tar
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+class _ObjectStoreHandler(BaseHTTPRequestHandler):
+    """
+    A minimal object store: GET (with ranges), HEAD and PUT of objects, and listing
+    with a prefix query parameter when enabled.
+    """
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+    def _get_name(self):
+        # Objects are served under /caches/
+        return urllib.parse.unquote(
+            urllib.parse.urlparse(self.path).path[len("/caches/") :]
+        )
+
+    def _send_headers(self, status, name, length):
+        self.send_response(status)
+        self.send_header("Content-Length", str(length))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header(
+            "Last-Modified",
+            email.utils.formatdate(self.server.objects[name][1], usegmt=True),
+        )
+        self.end_headers()
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        name = self._get_name()
+        if name not in self.server.objects:
+            self.send_error(404)
+            return
+        self._send_headers(200, name, len(self.server.objects[name][0]))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.server.requests.append(("GET", self.path, self.headers.get("Range")))
+        name = self._get_name()
+        if not name:
+            if not self.server.listing:
+                self.send_error(404)
+                return
+            prefix = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)[
+                "prefix"
+            ][0]
+            body = json.dumps([
+                {"name": key, "size": len(data), "mtime": mtime}
+                for key, (data, mtime) in self.server.objects.items()
+                if key.startswith(prefix)
+            ]).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if name not in self.server.objects:
+            self.send_error(404)
+            return
+        data = self.server.objects[name][0]
+        if self.headers.get("Range"):
+            start, end = self.headers["Range"][len("bytes=") :].split("-")
+            data = data[int(start) : int(end) + 1]
+            self._send_headers(206, name, len(data))
+        else:
+            self._send_headers(200, name, len(data))
+        self.wfile.write(data)
+
+    def do_PUT(self):  # pylint: disable=invalid-name
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        # Whole seconds, the same as Last-Modified
+        self.server.objects[self._get_name()] = (data, float(int(time.time())))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture(name="server")
+def fixture_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ObjectStoreHandler)
+    server.objects = {}
+    server.requests = []
+    server.listing = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/caches"
+
+
+def test_upload_and_download(server, tmp_path):
+    agent1 = tmp_path / "agent1"
+    agent1.mkdir()
+    archive = agent1 / "project-m2-abc.tar"
+    archive.write_bytes(create_tar({"file1": os.urandom(300000)}))
+    backend = HttpCacheBackend(_url(server), part_size=100000, concurrency=4)
+    remote_cache = RemoteCache(backend, str(agent1))
+    logger = mock.MagicMock()
+    remote_cache.publish(logger, str(archive))
+    remote_cache.wait()
+    assert server.objects["project-m2-abc.tar"][0] == archive.read_bytes()
+    # The local archive is as new as the remote one
+    assert archive.stat().st_mtime == server.objects["project-m2-abc.tar"][1]
+
+    # Another agent downloads the archive in parallel parts when a prefix matches
+    agent2 = tmp_path / "agent2"
+    agent2.mkdir()
+    remote_cache = RemoteCache(backend, str(agent2))
+    fetched = remote_cache.fetch(logger, str(agent2 / "project-m2-.tar"), None)
+    assert fetched == str(agent2 / "project-m2-abc.tar")
+    assert (agent2 / "project-m2-abc.tar").read_bytes() == archive.read_bytes()
+    ranges = [request[2] for request in server.requests if request[2]]
+    assert len(ranges) == 4
+
+    # An up to date local archive is not downloaded again
+    server.requests.clear()
+    assert remote_cache.fetch(logger, str(agent2 / "project-m2-.tar"), fetched) == (
+        fetched
+    )
+    assert all(request[1].startswith("/caches/?") for request in server.requests)
+
+
+def test_exact_key_without_listing(server, tmp_path):
+    server.listing = False
+    server.objects["m2-abc.tar.gz"] = (b"not used", time.time())
+    server.objects["m2-abc.tar"] = (create_tar({"file1": b"m2"}), time.time())
+    remote_cache = RemoteCache(HttpCacheBackend(_url(server)), str(tmp_path))
+    logger = mock.MagicMock()
+
+    assert remote_cache.fetch(logger, str(tmp_path / "m2-.tar"), None) is None
+    assert remote_cache.fetch(logger, str(tmp_path / "m2-abc.tar"), None) == str(
+        tmp_path / "m2-abc.tar"
+    )
+
+
+def test_invalid_download_is_discarded(server, tmp_path):
+    server.objects["m2-abc.tar.gz"] = (b"not a gzip file", time.time())
+    caches_root = tmp_path / "caches"
+    caches_root.mkdir()
+    remote_cache = RemoteCache(HttpCacheBackend(_url(server)), str(caches_root))
+    logger = mock.MagicMock()
+    assert remote_cache.fetch(logger, str(caches_root / "m2-.tar"), None) is None
+    assert os.listdir(caches_root) == []
+    logger.warning.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    "remote_name",
+    ["m2-../../escaped.tar", "m2-/../../escaped.tar", "m2-abc/./x.tar", "other.tar"],
+)
+def test_remote_names_outside_the_caches_root_are_ignored(
+    server, tmp_path, remote_name
+):
+    caches_root = tmp_path / "project" / "caches"
+    caches_root.mkdir(parents=True)
+    backend = HttpCacheBackend(_url(server))
+    remote_cache = RemoteCache(backend, str(caches_root))
+    logger = mock.MagicMock()
+    with (
+        mock.patch.object(
+            backend,
+            "find_latest",
+            return_value=RemoteCacheObject(remote_name, 10, time.time()),
+        ),
+        mock.patch.object(backend, "download") as download,
+    ):
+        assert remote_cache.fetch(logger, str(caches_root / "m2-.tar"), None) is None
+    download.assert_not_called()
+    logger.warning.assert_called_once()
+    assert os.listdir(tmp_path / "project") == ["caches"]
+    assert os.listdir(caches_root) == []
+
+
+def test_chunked_archives_are_not_shared(server, tmp_path):
+    archive = tmp_path / "m2-abc.tar.chunks"
+    archive.write_bytes(b"{}")
+    remote_cache = RemoteCache(HttpCacheBackend(_url(server)), str(tmp_path))
+    remote_cache.publish(mock.MagicMock(), str(archive))
+    remote_cache.wait()
+    assert not server.objects
+
+
+def test_s3_backend(tmp_path):
+    pytest.importorskip("boto3")
+    objects = {}
+    client = mock.MagicMock()
+
+    def _upload_fileobj(file_obj, bucket, key, Config):  # pylint: disable=invalid-name
+        assert Config.max_concurrency == 3
+        objects[(bucket, key)] = file_obj.read()
+
+    def _download_fileobj(bucket, key, file_obj, Config):  # pylint: disable=invalid-name,unused-argument
+        file_obj.write(objects[(bucket, key)])
+
+    def _paginate(Bucket, Prefix):  # pylint: disable=invalid-name
+        yield {
+            "Contents": [
+                {
+                    "Key": key,
+                    "Size": len(data),
+                    "LastModified": datetime.datetime.now(datetime.timezone.utc),
+                }
+                for (bucket, key), data in objects.items()
+                if bucket == Bucket and key.startswith(Prefix)
+            ]
+        }
+
+    client.upload_fileobj.side_effect = _upload_fileobj
+    client.download_fileobj.side_effect = _download_fileobj
+    client.get_paginator.return_value.paginate.side_effect = _paginate
+    client.head_object.return_value = {
+        "ContentLength": 0,
+        "LastModified": datetime.datetime.now(datetime.timezone.utc),
+    }
+    backend = S3CacheBackend("bucket1", prefix="ci/", concurrency=3, client=client)
+
+    (tmp_path / "agent1").mkdir()
+    archive = tmp_path / "agent1" / "npm-abc.tar"
+    archive.write_bytes(create_tar({"file1": b"npm"}))
+    RemoteCache(backend, str(tmp_path / "agent1"), write_behind=False).publish(
+        mock.MagicMock(), str(archive)
+    )
+    assert objects == {("bucket1", "ci/npm-abc.tar"): archive.read_bytes()}
+
+    (tmp_path / "agent2").mkdir()
+    fetched = RemoteCache(backend, str(tmp_path / "agent2")).fetch(
+        mock.MagicMock(), str(tmp_path / "agent2" / "npm-.tar"), None
+    )
+    assert fetched == str(tmp_path / "agent2" / "npm-abc.tar")
+
+
+def test_runner_uses_remote_cache(server, tmp_path):
+    global_config = BuildRunnerConfig.get_instance().global_config
+    global_config.caches_root = str(tmp_path / "caches")
+    global_config.caches.backend = GlobalCacheBackendConfig(
+        type="http", url=_url(server)
+    )
+    server.objects["m2-abc.tar"] = (create_tar({"file1": b"m2"}), time.time())
+
+    with mock.patch("buildrunner.docker.runner.new_client") as new_client:
+        docker_client = new_client.return_value
+        docker_client.images.return_value = [{"Id": "id1", "RepoTags": ["busybox"]}]
+        runner = DockerRunner(DockerRunner.ImageConfig("busybox", pull_image=False))
+    runner.container = {"Id": "container1"}
+    runner.run = mock.MagicMock(return_value=0)
+    restored = []
+    docker_client.put_archive.side_effect = lambda _container, _path, data: (
+        restored.append(b"".join(data)) or True
+    )
+    runner.restore_caches(
+        mock.MagicMock(),
+        OrderedDict([(str(tmp_path / "caches" / "m2-.tar"), "/root/.m2")]),
+    )
+    assert restored == [create_tar({"file1": b"m2"})]
+
+    docker_client.get_archive.return_value = ([create_tar({"file1": b"saved"})], {})
+    runner.save_caches(
+        mock.MagicMock(),
+        OrderedDict([(str(tmp_path / "caches" / "m2-def.tar"), "/root/.m2")]),
+    )
+    wait_for_remote_caches()
+    assert server.objects["m2-def.tar"][0] == create_tar({"file1": b"saved"})
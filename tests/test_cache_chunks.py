@@ -0,0 +1,190 @@
+import os
+import random
+import time
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.caches.chunks import (
+    CHUNK_DIR,
+    CHUNK_MAX_SIZE,
+    CHUNK_RETENTION_SECONDS,
+    collect_garbage,
+    get_shared_sizes,
+    read_manifest,
+)
+from buildrunner.caches.codec import get_codec, is_valid_archive
+from buildrunner.caches.eviction import CacheEvictor
+from tests.utils import create_tar
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+def _random_bytes(seed: int, size: int) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def _write(archive, tar_bytes: bytes, write_size: int = 100000) -> None:
+    codec = get_codec("chunked")
+    with open(archive, "wb") as file_obj, codec.open_writer(file_obj) as writer:
+        for offset in range(0, len(tar_bytes), write_size):
+            writer.write(tar_bytes[offset : offset + write_size])
+
+
+def _read(archive) -> bytes:
+    with open(archive, "rb") as file_obj:
+        return b"".join(get_codec("chunked").get_put_archive_data(file_obj))
+
+
+def _chunks(cache_dir):
+    return {
+        file_name
+        for _, _, file_names in os.walk(cache_dir / CHUNK_DIR)
+        for file_name in file_names
+    }
+
+
+def _chunks_size(cache_dir):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, file_name))
+        for dir_path, _, file_names in os.walk(cache_dir / CHUNK_DIR)
+        for file_name in file_names
+    )
+
+
+def test_round_trip_and_dedup(tmp_path):
+    files = {f"file{index}": _random_bytes(index, 2**20) for index in range(8)}
+    tar_bytes = create_tar(files)
+    _write(tmp_path / "cache-a.tar.chunks", tar_bytes)
+    assert _read(tmp_path / "cache-a.tar.chunks") == tar_bytes
+    assert is_valid_archive(str(tmp_path / "cache-a.tar.chunks"))
+    stored = _chunks_size(tmp_path)
+    assert stored == len(tar_bytes)
+
+    # Adding a file at the start shifts everything, only the changed chunks are new
+    files = {"new": _random_bytes(100, 5000), **files}
+    tar_bytes = create_tar(files)
+    _write(tmp_path / "cache-b.tar.chunks", tar_bytes, write_size=7777)
+    assert _read(tmp_path / "cache-b.tar.chunks") == tar_bytes
+    assert _chunks_size(tmp_path) - stored < len(tar_bytes) / 2
+
+
+def test_max_chunk_size(tmp_path):
+    # Zeros never end a chunk, chunks are cut at the maximum size instead
+    tar_bytes = create_tar({"zeros": bytes(CHUNK_MAX_SIZE * 3)})
+    _write(tmp_path / "cache.tar.chunks", tar_bytes, write_size=2**20)
+    assert _read(tmp_path / "cache.tar.chunks") == tar_bytes
+    with open(tmp_path / "cache.tar.chunks", "rb") as file_obj:
+        chunks = read_manifest(file_obj)
+    assert [size for _, size in chunks[:-1]] == [CHUNK_MAX_SIZE] * 3
+    # The middle chunks are identical and only stored once
+    assert chunks[1] == chunks[2]
+    assert len(_chunks(tmp_path)) == 3
+
+
+def test_shared_sizes(tmp_path):
+    shared = _random_bytes(1, 2**20)
+    _write(tmp_path / "a.tar.chunks", create_tar({"shared": shared}))
+    _write(
+        tmp_path / "b.tar.chunks",
+        create_tar({"shared": shared, "other": _random_bytes(2, 2**20)}),
+    )
+    sizes = get_shared_sizes([
+        str(tmp_path / "a.tar.chunks"),
+        str(tmp_path / "b.tar.chunks"),
+    ])
+    assert sum(sizes.values()) == pytest.approx(_chunks_size(tmp_path), abs=2)
+    assert sizes[str(tmp_path / "a.tar.chunks")] < sizes[str(tmp_path / "b.tar.chunks")]
+
+
+def test_collect_garbage(tmp_path):
+    _write(tmp_path / "a.tar.chunks", create_tar({"a": _random_bytes(1, 2**20)}))
+    _write(tmp_path / "b.tar.chunks", create_tar({"b": _random_bytes(2, 2**20)}))
+    b_chunks = _chunks(tmp_path)
+    (tmp_path / "a.tar.chunks").unlink()
+
+    # Recently written chunks may belong to a cache that is still being saved
+    assert collect_garbage(str(tmp_path), [str(tmp_path / "b.tar.chunks")]) == (0, 0)
+    with mock.patch(
+        "buildrunner.caches.chunks.time.time",
+        return_value=time.time() + CHUNK_RETENTION_SECONDS,
+    ):
+        removed, _ = collect_garbage(str(tmp_path), [str(tmp_path / "b.tar.chunks")])
+    assert removed > 0
+    assert _read(tmp_path / "b.tar.chunks")
+    assert _chunks(tmp_path) < b_chunks
+
+
+def test_evictor_collects_garbage(tmp_path):
+    _write(tmp_path / "a.tar.chunks", create_tar({"a": _random_bytes(1, 2**20)}))
+    _write(tmp_path / "b.tar.chunks", create_tar({"b": _random_bytes(2, 2**20)}))
+    old = time.time() - CHUNK_RETENTION_SECONDS - 60
+    for dir_path, _, file_names in os.walk(tmp_path / CHUNK_DIR):
+        for file_name in file_names:
+            os.utime(os.path.join(dir_path, file_name), (old, old))
+    os.utime(tmp_path / "a.tar.chunks", (old, old))
+
+    # The manifests are sized by their chunks
+    evicted = CacheEvictor(str(tmp_path), max_size=2**20 + 2**19).evict()
+    assert [archive.archive for archive in evicted] == ["a.tar.chunks"]
+    assert evicted[0].size > 2**20
+    assert _chunks_size(tmp_path) < 2**20 + 2**19
+
+    # Chunks are collected without quotas
+    (tmp_path / "b.tar.chunks").unlink()
+    assert CacheEvictor(str(tmp_path)).evict() == []
+    assert not _chunks(tmp_path)
+
+
+def test_evictor_collects_garbage_in_subdirectories(tmp_path):
+    cache_dir = tmp_path / "project"
+    cache_dir.mkdir()
+    _write(cache_dir / "a.tar.chunks", create_tar({"a": _random_bytes(1, 2**20)}))
+    old = time.time() - CHUNK_RETENTION_SECONDS - 60
+    for dir_path, _, file_names in os.walk(cache_dir / CHUNK_DIR):
+        for file_name in file_names:
+            os.utime(os.path.join(dir_path, file_name), (old, old))
+    (cache_dir / "a.tar.chunks").unlink()
+
+    # The caches root has no chunk store of its own
+    assert CacheEvictor(str(tmp_path)).evict() == []
+    assert not _chunks(cache_dir)
+
+
+def test_missing_chunk_is_reported_as_evicted(runner, tmp_path):
+    archive = tmp_path / "cache.tar.chunks"
+    _write(archive, create_tar({"file1": b"content"}))
+    for dir_path, _, file_names in os.walk(tmp_path / CHUNK_DIR):
+        for file_name in file_names:
+            os.remove(os.path.join(dir_path, file_name))
+    logger = mock.MagicMock()
+    runner.docker_client.put_archive.side_effect = lambda _container, _path, data: (
+        b"".join(data)
+    )
+    runner.restore_caches(logger, OrderedDict([(str(archive), "/cache")]))
+    messages = [call.args[0] for call in logger.warning.call_args_list]
+    assert any(
+        "was evicted before it could be restored" in message for message in messages
+    )
+
+
+def test_linked_manifest_brings_its_chunks(runner, tmp_path):
+    BuildRunnerConfig.get_instance().global_config.caches.codec = "chunked"
+    tar_bytes = create_tar({"a": _random_bytes(1, 2**20)})
+    runner.docker_client.get_archive.return_value = ([tar_bytes], {})
+    (tmp_path / "sub").mkdir()
+    caches = OrderedDict([
+        (str(tmp_path / "m2-main-.tar.chunks"), "/root/.m2"),
+        (str(tmp_path / "sub" / "m2-.tar.chunks"), "/root/.m2"),
+    ])
+    runner.save_caches(mock.MagicMock(), caches, save_all_paths={"/root/.m2"})
+
+    # The manifest linked into another directory reads its chunks from that directory
+    assert _chunks(tmp_path / "sub") == _chunks(tmp_path)
+    assert _read(tmp_path / "sub" / "m2-.tar.chunks") == tar_bytes
+    assert not collect_garbage(
+        str(tmp_path / "sub"), [str(tmp_path / "sub" / "m2-.tar.chunks")]
+    )[0]
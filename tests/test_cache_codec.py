@@ -0,0 +1,156 @@
+import io
+import os
+import tarfile
+import time
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunner, BuildRunnerConfig
+from buildrunner.caches.codec import (
+    get_codec,
+    get_codec_for_path,
+    is_valid_archive,
+    strip_archive_extension,
+)
+from buildrunner.docker.runner import BuildRunnerSavingCache, DockerRunner
+from tests.utils import create_tar
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+def _read_tar(tar_bytes: bytes) -> dict:
+    with tarfile.open(fileobj=io.BytesIO(tar_bytes)) as tar:
+        return {
+            member.name: tar.extractfile(member).read() for member in tar.getmembers()
+        }
+
+
+def _write_archive(file_path, codec, tar_bytes: bytes) -> None:
+    with open(file_path, "wb") as file_obj, codec.open_writer(file_obj) as writer:
+        writer.write(tar_bytes)
+
+
+@pytest.mark.parametrize(
+    "file_name, codec_name, stripped",
+    [
+        ("project-cache.tar", "none", "project-cache"),
+        ("project-cache.tar.gz", "gzip", "project-cache"),
+        ("project-cache.tar.zst", "zstd", "project-cache"),
+        ("project-cache.tar.chunks", "chunked", "project-cache"),
+        ("project-cache", "none", "project-cache"),
+    ],
+)
+def test_codec_for_path(file_name, codec_name, stripped):
+    assert get_codec_for_path(file_name).name == codec_name
+    assert strip_archive_extension(file_name) == stripped
+
+
+@pytest.mark.parametrize("codec_name", ["none", "gzip", "zstd", "chunked"])
+def test_round_trip(codec_name, tmp_path):
+    if codec_name == "zstd":
+        pytest.importorskip("zstandard")
+    codec = get_codec(codec_name, level=1, threads=1)
+    tar_bytes = create_tar({"file1": b"a" * 100000, "file2": b"content"})
+    archive = tmp_path / f"cache.{codec.extension}"
+    _write_archive(archive, codec, tar_bytes)
+
+    assert is_valid_archive(str(archive))
+    if codec_name != "none":
+        assert archive.stat().st_size < len(tar_bytes)
+    with open(archive, "rb") as file_obj:
+        data = codec.get_put_archive_data(file_obj)
+        if not isinstance(data, io.IOBase):
+            data = b"".join(data)
+        else:
+            data = data.read()
+    assert data == tar_bytes
+
+
+def test_invalid_archive(tmp_path):
+    archive = tmp_path / "cache.tar.gz"
+    archive.write_bytes(b"not a gzip file")
+    assert not is_valid_archive(str(archive))
+
+
+def test_archive_ext_follows_codec():
+    assert BuildRunner.get_cache_archive_ext() == "tar"
+    BuildRunnerConfig.get_instance().global_config.caches.codec = "gzip"
+    assert BuildRunner.get_cache_archive_ext() == "tar.gz"
+
+
+def test_prefix_matches_any_codec(tmp_path):
+    older = tmp_path / "project-cache-abc.tar"
+    older.write_bytes(create_tar({"file1": b"1"}))
+    os.utime(older, (time.time() - 10, time.time() - 10))
+    newer = tmp_path / "project-cache-def.tar.gz"
+    _write_archive(newer, get_codec("gzip"), create_tar({"file1": b"2"}))
+    (tmp_path / "project-cache-ghi.tar.gz.tmp").write_bytes(b"")
+    logger = mock.MagicMock()
+
+    # An uncompressed archive is found when the codec changes
+    assert DockerRunner._get_cache_file_from_prefix(
+        logger, str(tmp_path / "project-cache-abc.tar.zst"), "/cache"
+    ) == str(older)
+    # The most recent archive matching the prefix is used regardless of its codec
+    assert DockerRunner._get_cache_file_from_prefix(
+        logger, str(tmp_path / "project-cache-.tar"), "/cache"
+    ) == str(newer)
+
+
+def test_save_and_restore_compressed(runner, tmp_path):
+    BuildRunnerConfig.get_instance().global_config.caches.codec = "gzip"
+    tar_bytes = create_tar({"file1": b"b" * 10000})
+    # Simulate the chunked stream returned by docker
+    runner.docker_client.get_archive.return_value = (
+        [tar_bytes[:1000], tar_bytes[1000:]],
+        {},
+    )
+    archive = tmp_path / "cache.tar.gz"
+    caches = OrderedDict([(str(archive), "/cache")])
+    logger = mock.MagicMock()
+
+    runner.save_caches(logger, caches)
+    runner.docker_client.get_archive.assert_called_once_with("container1", "/cache/.")
+    with open(archive, "rb") as file_obj:
+        assert file_obj.read(2) == b"\x1f\x8b"
+
+    restored = []
+    runner.docker_client.put_archive.side_effect = (
+        lambda _container, _path, data: restored.append(b"".join(data)) or True
+    )
+    runner.restore_caches(logger, caches)
+    assert _read_tar(restored[0]) == {"file1": b"b" * 10000}
+
+
+def test_save_replaces_archive_atomically(runner, tmp_path):
+    archive = tmp_path / "cache.tar"
+    archive.write_bytes(create_tar({"file1": b"old"}))
+    caches = OrderedDict([(str(archive), "/cache")])
+    logger = mock.MagicMock()
+
+    # A reader that opened the previous archive keeps reading it
+    with open(archive, "rb") as reader:
+        runner.docker_client.get_archive.return_value = (
+            [create_tar({"file1": b"new"})],
+            {},
+        )
+        runner.save_caches(logger, caches)
+        assert _read_tar(reader.read()) == {"file1": b"old"}
+    assert _read_tar(archive.read_bytes()) == {"file1": b"new"}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+@pytest.mark.parametrize("chunks", [[b"not a tar file"], iter(())])
+def test_failed_save_keeps_archive(runner, tmp_path, chunks):
+    archive = tmp_path / "cache.tar"
+    archive.write_bytes(create_tar({"file1": b"old"}))
+    caches = OrderedDict([(str(archive), "/cache")])
+    runner.docker_client.get_archive.return_value = (chunks, {})
+
+    with pytest.raises(BuildRunnerSavingCache):
+        runner.save_caches(mock.MagicMock(), caches)
+    assert _read_tar(archive.read_bytes()) == {"file1": b"old"}
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
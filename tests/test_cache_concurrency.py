@@ -0,0 +1,228 @@
+import socket
+import threading
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+import requests.exceptions
+import urllib3.exceptions
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.docker.runner import (
+    CACHE_TIMEOUT_SECONDS,
+    BuildRunnerCacheTimeout,
+    DockerRunner,
+    _group_nested_paths,
+)
+from tests.utils import create_tar
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+@pytest.mark.parametrize(
+    "paths, groups",
+    [
+        (["/a", "/b", "/c"], [["/a"], ["/b"], ["/c"]]),
+        (
+            ["/root/.m2", "/b", "/root/.m2/repository"],
+            [["/b"], ["/root/.m2", "/root/.m2/repository"]],
+        ),
+        (["/a/b", "/c", "/a/bc", "/a"], [["/c"], ["/a/b", "/a/bc", "/a"]]),
+    ],
+)
+def test_group_nested_paths(paths, groups):
+    assert _group_nested_paths(paths) == groups
+
+
+def test_restore_concurrently(runner, tmp_path):
+    (tmp_path / "m2-abc.tar").write_bytes(create_tar({"file1": b"m2"}))
+    (tmp_path / "npm-abc.tar").write_bytes(create_tar({"file1": b"npm"}))
+    (tmp_path / "npm-def.tar").write_bytes(create_tar({"file1": b"npm-newer"}))
+    caches = OrderedDict([
+        (str(tmp_path / "m2-missing.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-abc.tar"), "/root/.m2"),
+        (str(tmp_path / "npm-abc.tar"), "/root/.npm"),
+        (str(tmp_path / "npm-def.tar"), "/root/.npm"),
+    ])
+    # Both transfers have to be in progress at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=10)
+    restored = {}
+
+    def _put_archive(_container, path, data):
+        barrier.wait()
+        restored[path] = b"".join(data)
+        return True
+
+    runner.docker_client.put_archive.side_effect = _put_archive
+    logger = mock.MagicMock()
+    runner.restore_caches(logger, caches)
+
+    assert restored == {
+        "/root/.m2": create_tar({"file1": b"m2"}),
+        "/root/.npm": create_tar({"file1": b"npm"}),
+    }
+    assert sorted(call.args[0] for call in runner.run.call_args_list) == [
+        ["mkdir", "-p", "/root/.m2"],
+        ["mkdir", "-p", "/root/.npm"],
+    ]
+    messages = [call.args[0] for call in logger.info.call_args_list]
+    assert (
+        "[/root/.npm] Cache for destination path /root/.npm has already been matched "
+        f"and restored to the container, skipping {tmp_path / 'npm-def.tar'}"
+    ) in messages
+
+
+def test_remote_caches_are_fetched_concurrently(runner, tmp_path):
+    (tmp_path / "m2.tar").write_bytes(create_tar({"file1": b"m2"}))
+    (tmp_path / "npm.tar").write_bytes(create_tar({"file1": b"npm"}))
+    caches = OrderedDict([
+        (str(tmp_path / "m2.tar"), "/root/.m2"),
+        (str(tmp_path / "npm.tar"), "/root/.npm"),
+        (str(tmp_path / "pip.tar"), "/root/.pip"),
+    ])
+    # Each download waits for the others to start, which only happens when they are
+    # not serialized before the transfers
+    barrier = threading.Barrier(3, timeout=5)
+
+    def _fetch(_logger, _local_cache_archive_file, local_match):
+        barrier.wait()
+        return local_match
+
+    runner.docker_client.put_archive.return_value = True
+    with mock.patch("buildrunner.docker.runner.get_remote_cache") as get_remote_cache:
+        get_remote_cache.return_value.fetch.side_effect = _fetch
+        runner.restore_caches(mock.MagicMock(), caches)
+
+    assert get_remote_cache.return_value.fetch.call_count == 3
+    assert runner.docker_client.put_archive.call_count == 2
+    # Only the paths with a match are created
+    assert sorted(call.args[0] for call in runner.run.call_args_list) == [
+        ["mkdir", "-p", "/root/.m2"],
+        ["mkdir", "-p", "/root/.npm"],
+    ]
+
+
+def test_save_concurrently(runner, tmp_path):
+    barrier = threading.Barrier(2, timeout=10)
+
+    def _get_archive(_container, path):
+        barrier.wait()
+        return [create_tar({"file1": path.encode()})], {}
+
+    runner.docker_client.get_archive.side_effect = _get_archive
+    caches = OrderedDict([
+        (str(tmp_path / "m2.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-other.tar"), "/root/.m2"),
+        (str(tmp_path / "npm.tar"), "/root/.npm"),
+    ])
+    runner.save_caches(mock.MagicMock(), caches)
+
+    assert (tmp_path / "m2.tar").read_bytes() == create_tar({"file1": b"/root/.m2/."})
+    assert (tmp_path / "npm.tar").read_bytes() == create_tar({"file1": b"/root/.npm/."})
+    assert not (tmp_path / "m2-other.tar").exists()
+
+
+def test_transfer_timeout(runner, tmp_path):
+    runner.docker_client.get_archive.return_value = ([b"chunk"], {})
+    caches = OrderedDict([(str(tmp_path / "m2.tar"), "/root/.m2")])
+    with (
+        mock.patch("buildrunner.docker.runner.CACHE_TIMEOUT_SECONDS", -1),
+        pytest.raises(Exception, match="Timed out after -1 seconds saving /root/.m2"),
+    ):
+        runner.save_caches(mock.MagicMock(), caches)
+    assert runner.docker_client.get_archive.call_count == 2
+    assert not (tmp_path / "m2.tar").exists()
+
+
+def test_cache_client_timeout():
+    # The cache transfers use a client with a socket timeout
+    with mock.patch("buildrunner.docker.runner.new_client") as new_client:
+        new_client.return_value.images.return_value = []
+        DockerRunner(DockerRunner.ImageConfig("busybox", pull_image=False))
+    assert (
+        mock.call(dockerd_url=None, timeout=CACHE_TIMEOUT_SECONDS)
+        in new_client.call_args_list
+    )
+
+
+def test_stalled_transfer_times_out(runner, tmp_path):
+    reader, writer = socket.socketpair()
+
+    def _stalled_chunks():
+        yield b"chunk"
+        # Blocks until the socket timeout, nothing is ever sent
+        yield reader.recv(1024)
+
+    with reader, writer:
+        reader.settimeout(0.1)
+        runner.docker_client.get_archive.side_effect = lambda *_: (
+            _stalled_chunks(),
+            {},
+        )
+        caches = OrderedDict([(str(tmp_path / "m2.tar"), "/root/.m2")])
+        with pytest.raises(Exception, match="without progress saving /root/.m2"):
+            runner.save_caches(mock.MagicMock(), caches)
+    assert runner.docker_client.get_archive.call_count == 2
+    assert not (tmp_path / "m2.tar").exists()
+
+
+def test_stalled_restore_is_retried(runner, tmp_path):
+    (tmp_path / "m2.tar").write_bytes(create_tar({"file1": b"m2"}))
+    runner.docker_client.put_archive.side_effect = [
+        requests.exceptions.ConnectionError(
+            urllib3.exceptions.ProtocolError("Connection aborted.", socket.timeout())
+        ),
+        True,
+    ]
+    caches = OrderedDict([(str(tmp_path / "m2.tar"), "/root/.m2")])
+    runner.restore_caches(mock.MagicMock(), caches)
+    assert runner.docker_client.put_archive.call_count == 2
+
+
+def test_timeout_is_retried(runner, tmp_path):
+    (tmp_path / "m2.tar").write_bytes(create_tar({"file1": b"m2"}))
+    runner.docker_client.put_archive.side_effect = [
+        BuildRunnerCacheTimeout("timed out"),
+        True,
+    ]
+    caches = OrderedDict([(str(tmp_path / "m2.tar"), "/root/.m2")])
+    runner.restore_caches(mock.MagicMock(), caches)
+    assert runner.docker_client.put_archive.call_count == 2
+
+
+def test_save_all_keys(runner, tmp_path):
+    BuildRunnerConfig.get_instance().global_config.caches_root = str(tmp_path)
+    runner.docker_client.get_archive.return_value = ([create_tar({"file1": b"m2"})], {})
+    (tmp_path / "sub").mkdir()
+    caches = OrderedDict([
+        (str(tmp_path / "m2-abc.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-main-.tar"), "/root/.m2"),
+        (str(tmp_path / "sub" / "m2-.tar"), "/root/.m2"),
+        (str(tmp_path / "npm.tar"), "/root/.npm"),
+        (str(tmp_path / "npm-main-.tar"), "/root/.npm"),
+    ])
+    runner.save_caches(mock.MagicMock(), caches, save_all_paths={"/root/.m2"})
+
+    # A single transfer per docker path
+    assert runner.docker_client.get_archive.call_count == 2
+    inode = (tmp_path / "m2-abc.tar").stat().st_ino
+    assert (tmp_path / "m2-main-.tar").stat().st_ino == inode
+    assert (tmp_path / "sub" / "m2-.tar").stat().st_ino == inode
+    assert (tmp_path / "sub" / "m2-.tar").read_bytes() == create_tar({"file1": b"m2"})
+    assert not (tmp_path / "npm-main-.tar").exists()
+    linked_keys = {event["path"]: event["linked_keys"] for event in runner.cache_events}
+    assert linked_keys == {
+        "/root/.m2": ["m2-main-.tar", "sub/m2-.tar"],
+        "/root/.npm": [],
+    }
+
+    # The archives are copied when they cannot be linked
+    with mock.patch(
+        "buildrunner.docker.runner.os.link", side_effect=OSError("cross-device link")
+    ):
+        runner.save_caches(mock.MagicMock(), caches, save_all_paths={"/root/.m2"})
+    assert (tmp_path / "m2-main-.tar").stat().st_ino != (
+        tmp_path / "m2-abc.tar"
+    ).stat().st_ino
+    assert (tmp_path / "m2-main-.tar").read_bytes() == create_tar({"file1": b"m2"})
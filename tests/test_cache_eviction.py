@@ -0,0 +1,142 @@
+import os
+import time
+
+import portalocker
+import pytest
+
+from buildrunner.caches.eviction import (
+    CACHE_EVICTION_LOCK_FILE,
+    CACHE_TEMP_RETENTION_SECONDS,
+    CacheEvictor,
+    mark_cache_used,
+    parse_size,
+    record_cache_project,
+)
+from buildrunner.source.archive import hold_shared_lock, release_shared_lock
+
+
+def _create_archive(caches_root, name, size, age):
+    path = caches_root / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"0" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def _remaining(caches_root):
+    return sorted(
+        os.path.relpath(os.path.join(dir_path, file_name), caches_root)
+        for dir_path, _, file_names in os.walk(caches_root)
+        for file_name in file_names
+        if not file_name.startswith(".")
+    )
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, None),
+        (100, 100),
+        ("100", 100),
+        ("2k", 2048),
+        ("1.5G", 3 * 2**29),
+        ("20GiB", 20 * 2**30),
+        ("3 MB", 3 * 2**20),
+    ],
+)
+def test_parse_size(value, expected):
+    assert parse_size(value) == expected
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError, match='Invalid size "lots"'):
+        parse_size("lots")
+
+
+def test_no_quotas(tmp_path):
+    _create_archive(tmp_path, "cache1.tar", 100, 100)
+    assert CacheEvictor(str(tmp_path)).evict() == []
+    assert _remaining(tmp_path) == ["cache1.tar"]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    _create_archive(tmp_path, "oldest.tar", 100, 300)
+    _create_archive(tmp_path, "restored.tar.gz", 100, 200)
+    _create_archive(tmp_path, "sub/newest.tar", 100, 100)
+    _create_archive(tmp_path, "source/digest.tar", 1000, 1000)
+    (tmp_path / "cache_history.log").write_text("history")
+    # Restoring a cache makes it the most recently used without changing its mtime
+    mtime = os.path.getmtime(tmp_path / "restored.tar.gz")
+    mark_cache_used(str(tmp_path / "restored.tar.gz"))
+    assert os.path.getmtime(tmp_path / "restored.tar.gz") == mtime
+
+    evicted = CacheEvictor(str(tmp_path), max_size=200).evict()
+
+    assert [archive.archive for archive in evicted] == ["oldest.tar"]
+    assert _remaining(tmp_path) == [
+        "cache_history.log",
+        "restored.tar.gz",
+        "source/digest.tar",
+        "sub/newest.tar",
+    ]
+
+
+def test_per_project_quota(tmp_path):
+    for name, age in (("a1.tar", 400), ("a2.tar", 300), ("b1.tar", 500)):
+        path = _create_archive(tmp_path, name, 100, age)
+        record_cache_project(str(tmp_path), str(path), f"project-{name[0]}")
+    _create_archive(tmp_path, "unknown.tar", 100, 600)
+
+    evicted = CacheEvictor(str(tmp_path), max_project_size=100).evict()
+
+    assert [archive.archive for archive in evicted] == ["a1.tar"]
+    assert _remaining(tmp_path) == ["a2.tar", "b1.tar", "unknown.tar"]
+
+    # The global quota applies to all archives, the evicted archive is forgotten
+    evicted = CacheEvictor(str(tmp_path), max_size=150).evict()
+    assert sorted(archive.archive for archive in evicted) == [
+        "b1.tar",
+        "unknown.tar",
+    ]
+    assert CacheEvictor(str(tmp_path))._load_usage() == {"a2.tar": "project-a"}
+
+
+def test_skips_archives_in_use(tmp_path):
+    oldest = _create_archive(tmp_path, "oldest.tar", 100, 300)
+    _create_archive(tmp_path, "newest.tar", 100, 100)
+    lock_file_obj = hold_shared_lock(str(oldest))
+    try:
+        evicted = CacheEvictor(str(tmp_path), max_size=100).evict()
+    finally:
+        release_shared_lock(lock_file_obj)
+    assert [archive.archive for archive in evicted] == ["newest.tar"]
+    assert _remaining(tmp_path) == ["oldest.tar"]
+
+
+def test_removes_stale_temp_files(tmp_path):
+    stale = _create_archive(
+        tmp_path, ".cache.tar.1234.tmp", 100, CACHE_TEMP_RETENTION_SECONDS + 60
+    )
+    in_progress = _create_archive(tmp_path, ".cache.tar.5678.tmp", 100, 60)
+    CacheEvictor(str(tmp_path), max_size=1000).evict()
+    assert not stale.exists()
+    assert in_progress.exists()
+
+
+def test_single_evicting_process(tmp_path):
+    _create_archive(tmp_path, "cache.tar", 100, 100)
+    with open(tmp_path / CACHE_EVICTION_LOCK_FILE, "a") as lock_file_obj:
+        portalocker.lock(lock_file_obj, portalocker.LockFlags.EXCLUSIVE)
+        assert CacheEvictor(str(tmp_path), max_size=0).evict() == []
+    assert _remaining(tmp_path) == ["cache.tar"]
+
+
+def test_linked_archives_share_their_size(tmp_path):
+    _create_archive(tmp_path, "m2-abc.tar", 300, 100)
+    os.link(tmp_path / "m2-abc.tar", tmp_path / "m2-main-.tar")
+    _create_archive(tmp_path, "npm.tar", 100, 100)
+    sizes = {
+        archive.archive: archive.size for archive in CacheEvictor(str(tmp_path)).scan()
+    }
+    assert sizes == {"m2-abc.tar": 150, "m2-main-.tar": 150, "npm.tar": 100}
@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import time
+from unittest import mock
+
+from buildrunner.caches.index import (
+    CACHE_INDEX_FILE,
+    CACHE_INDEX_MAX_AGE_SECONDS,
+    CacheIndex,
+)
+from buildrunner.docker.runner import DockerRunner
+
+
+def _create_archive(cache_dir, name, age):
+    path = cache_dir / name
+    path.write_bytes(b"archive")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_find_latest(tmp_path):
+    _create_archive(tmp_path, "m2repo-abc.tar", 300)
+    newest = _create_archive(tmp_path, "m2repo-def.tar.gz", 100)
+    _create_archive(tmp_path, "npm-abc.tar", 10)
+    _create_archive(tmp_path, ".m2repo-ghi.tar.1234.tmp", 0)
+    (tmp_path / "cache_history.log").write_text("history")
+
+    index = CacheIndex(str(tmp_path))
+    assert index.find_latest("m2repo-") == str(newest)
+    assert index.find_latest("m2repo-abc") == str(tmp_path / "m2repo-abc.tar")
+    assert index.find_latest("maven") is None
+    assert (tmp_path / CACHE_INDEX_FILE).exists()
+
+
+def test_lookup_does_not_list_directory(tmp_path):
+    _create_archive(tmp_path, "m2repo-abc.tar", 300)
+    index = CacheIndex(str(tmp_path))
+    assert index.find_latest("m2repo-")
+
+    newer = _create_archive(tmp_path, "m2repo-def.tar", 0)
+    index.add(str(newer))
+    with mock.patch("buildrunner.caches.index.os.listdir") as listdir:
+        assert index.find_latest("m2repo-") == str(newer)
+    listdir.assert_not_called()
+
+
+def test_removed_archives_are_skipped(tmp_path):
+    older = _create_archive(tmp_path, "m2repo-abc.tar", 300)
+    newer = _create_archive(tmp_path, "m2repo-def.tar", 100)
+    index = CacheIndex(str(tmp_path))
+    assert index.find_latest("m2repo-") == str(newer)
+
+    newer.unlink()
+    assert index.find_latest("m2repo-") == str(older)
+    index.remove(str(older))
+    assert index.find_latest("m2repo-") is None
+
+
+def test_rebuilds_old_index(tmp_path):
+    index = CacheIndex(str(tmp_path))
+    assert index.find_latest("m2repo-") is None
+    # Archives written without updating the index are found once it is rebuilt
+    archive = _create_archive(tmp_path, "m2repo-abc.tar", 0)
+    assert index.find_latest("m2repo-") is None
+    with mock.patch(
+        "buildrunner.caches.index.time.time",
+        return_value=time.time() + CACHE_INDEX_MAX_AGE_SECONDS,
+    ):
+        assert index.find_latest("m2repo-") == str(archive)
+
+
+def test_runner_falls_back_to_scanning(tmp_path):
+    archive = _create_archive(tmp_path, "m2repo-abc.tar", 0)
+    with mock.patch(
+        "buildrunner.docker.runner.CacheIndex.find_latest",
+        side_effect=sqlite3.OperationalError("readonly database"),
+    ):
+        assert DockerRunner._get_cache_file_from_prefix(
+            mock.MagicMock(), str(tmp_path / "m2repo-.tar"), "/cache"
+        ) == str(archive)
@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.config import jinja_context, loader
+from buildrunner.docker.runner import DockerRunner
+from buildrunner.utils import lockfile_hash
+from tests.utils import create_tar
+
+
+@pytest.fixture(name="caches_root", autouse=True)
+def fixture_caches_root(initialize_config, tmp_path):  # pylint: disable=unused-argument
+    BuildRunnerConfig.get_instance().global_config.caches_root = str(tmp_path)
+
+
+@pytest.fixture(name="lockfiles")
+def fixture_lockfiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pom.xml").write_text("root")
+    (tmp_path / "sub" / "module").mkdir(parents=True)
+    (tmp_path / "sub" / "module" / "pom.xml").write_text("module")
+    return tmp_path
+
+
+def test_lockfile_hash(lockfiles):
+    key = lockfile_hash("**/pom.xml")
+    assert len(key) == 16
+    assert len(lockfile_hash("**/pom.xml", length=40)) == 40
+    # The order and overlap of the globs does not matter
+    assert lockfile_hash("pom.xml", "sub/**/pom.xml", "**/pom.xml") == key
+    assert lockfile_hash("pom.xml") != key
+
+    (lockfiles / "sub" / "module" / "pom.xml").rename(lockfiles / "sub" / "pom.xml")
+    assert lockfile_hash("**/pom.xml") != key
+    (lockfiles / "sub" / "pom.xml").rename(lockfiles / "sub" / "module" / "pom.xml")
+    assert lockfile_hash("**/pom.xml") == key
+    (lockfiles / "pom.xml").write_text("changed")
+    assert lockfile_hash("**/pom.xml") != key
+
+
+@pytest.mark.parametrize(
+    "args, kwargs, keys",
+    [
+        (
+            ("m2", "pom.xml"),
+            {},
+            ["m2-feature~x_{hash}", "m2-feature~x_", "m2-main_"],
+        ),
+        (("m2",), {"default_branch": "develop"}, ["m2-feature~x_", "m2-develop_"]),
+        (("m2", "pom.xml"), {"branch": "main"}, ["m2-main_{hash}", "m2-main_"]),
+        (
+            ("m_2", "pom.xml"),
+            {"branch": "fix_1 'quoted'"},
+            ["m-2-fix-1-quoted_{hash}", "m-2-fix-1-quoted_", "m-2-main_"],
+        ),
+        # Without a matching lockfile the hash would be the same for every build
+        (("m2", "missing.xml"), {}, ["m2-feature~x_", "m2-main_"]),
+    ],
+)
+def test_cache_keys(lockfiles, args, kwargs, keys):
+    _ = lockfiles
+    assert jinja_context.cache_keys(
+        {"VCSINFO_BRANCH": "feature/x"}, *args, **kwargs
+    ) == [key.format(hash=lockfile_hash("pom.xml")) for key in keys]
+
+
+@pytest.mark.parametrize(
+    "branch, other_branch",
+    [
+        ("feature", "feature-x"),
+        ("feature", "feature/login"),
+        ("main", "main-hotfix"),
+        ("feature/x", "feature-x"),
+        ("feature-x", "feature/x"),
+    ],
+)
+def test_cache_keys_of_other_branches_do_not_match(lockfiles, branch, other_branch):
+    _ = lockfiles
+    keys = jinja_context.cache_keys({}, "m2", "pom.xml", branch=branch)
+    other_keys = jinja_context.cache_keys({}, "m2", "pom.xml", branch=other_branch)
+    # Neither the exact key nor the prefix of the branch match the keys the other
+    # branch saves its caches to
+    for key in keys[:2]:
+        assert not any(other_key.startswith(key) for other_key in other_keys[:2])
+
+
+def test_lockfile_hash_without_files(lockfiles, caplog):
+    _ = lockfiles
+    with caplog.at_level("WARNING"):
+        lockfile_hash("missing.xml")
+    assert "No file matches missing.xml" in caplog.text
+
+
+def test_cache_keys_template(lockfiles):
+    config_file = lockfiles / "buildrunner.yaml"
+    config_file.write_text(
+        "steps:\n"
+        "  step1:\n"
+        "    run:\n"
+        "      caches:\n"
+        "        /root/.m2: {{ cache_keys('m2', '**/pom.xml') }}\n"
+        "        /root/.npm:\n"
+        "          - npm-{{ lockfile_hash('package-lock.json') }}\n"
+    )
+    config = loader._fetch_template(  # pylint: disable=protected-access
+        env={"VCSINFO_BRANCH": "release/1.0"},
+        build_time=0,
+        cfg_file=str(config_file),
+        log_file=False,
+    )
+    assert config["steps"]["step1"]["run"]["caches"] == {
+        "/root/.m2": [
+            f"m2-release~1.0_{lockfile_hash('**/pom.xml')}",
+            "m2-release~1.0_",
+            "m2-main_",
+        ],
+        "/root/.npm": [f"npm-{lockfile_hash()}"],
+    }
+
+
+def test_first_tier_with_a_match_wins(tmp_path):
+    with mock.patch("buildrunner.docker.runner.new_client") as new_client:
+        docker_client = new_client.return_value
+        docker_client.images.return_value = [{"Id": "id1", "RepoTags": ["busybox"]}]
+        runner = DockerRunner(DockerRunner.ImageConfig("busybox", pull_image=False))
+    runner.container = {"Id": "container1"}
+    runner.run = mock.MagicMock(return_value=0)
+    restored = []
+    docker_client.put_archive.side_effect = lambda _container, _path, data: (
+        restored.append(b"".join(data)) or True
+    )
+    # The caches of other branches are never used
+    (tmp_path / "m2-main-abc.tar").write_bytes(create_tar({"file1": b"main"}))
+    (tmp_path / "m2-feature-abc.tar").write_bytes(create_tar({"file1": b"feature"}))
+    (tmp_path / "m2-other-abc.tar").write_bytes(create_tar({"file1": b"other"}))
+    caches = OrderedDict([
+        (str(tmp_path / "m2-feature-def.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-feature-.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-main-.tar"), "/root/.m2"),
+    ])
+    logger = mock.MagicMock()
+    runner.restore_caches(logger, caches)
+
+    assert restored == [create_tar({"file1": b"feature"})]
+    event = runner.cache_events[0]
+    assert (event["tier"], event["tier_key"], event["archive"], event["result"]) == (
+        2,
+        "m2-feature-.tar",
+        "m2-feature-abc.tar",
+        "prefix",
+    )
+    messages = [call.args[0] for call in logger.info.call_args_list]
+    assert (
+        "[/root/.m2] Cache was put into the container from cache key tier 2 "
+        "[m2-feature-.tar]."
+    ) in messages
+
+    # The next tier is used when the matched archive is evicted before it is restored
+    restored.clear()
+    runner.cache_events.clear()
+    with mock.patch(
+        "buildrunner.docker.runner.acquire_flock_open_read_binary",
+        side_effect=[FileNotFoundError(), open(tmp_path / "m2-main-abc.tar", "rb")],
+    ):
+        runner.restore_caches(mock.MagicMock(), caches)
+    assert restored == [create_tar({"file1": b"main"})]
+    assert runner.cache_events[0]["tier"] == 3
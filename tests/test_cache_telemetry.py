@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.caches.telemetry import (
+    CACHE_TELEMETRY_FILE,
+    create_cache_event,
+    format_cache_report,
+    read_cache_events,
+    record_cache_event,
+    summarize_cache_events,
+)
+from tests.utils import create_tar
+
+
+@pytest.fixture(name="caches_root", autouse=True)
+def fixture_caches_root(initialize_config, tmp_path):  # pylint: disable=unused-argument
+    BuildRunnerConfig.get_instance().global_config.caches_root = str(
+        tmp_path / "caches"
+    )
+    (tmp_path / "caches").mkdir()
+
+
+@pytest.fixture(name="runner")
+def fixture_runner(runner):
+    docker_client = runner.docker_client
+    docker_client.put_archive.return_value = True
+    docker_client.get_archive.return_value = ([create_tar({"file1": b"saved"})], {})
+    return runner
+
+
+def _event(operation, path, result, **kwargs):
+    event = create_cache_event(operation, path, "key.tar", {"VCSINFO_NAME": "proj"})
+    event.update(result=result, **kwargs)
+    return event
+
+
+def test_restore_and_save_are_recorded(runner, tmp_path):
+    caches_root = tmp_path / "caches"
+    (caches_root / "m2-abc.tar").write_bytes(create_tar({"file1": b"m2"}))
+    (caches_root / "npm.tar").write_bytes(create_tar({"file1": b"npm"}))
+    caches = OrderedDict([
+        (str(caches_root / "m2-def.tar"), "/root/.m2"),
+        (str(caches_root / "m2-.tar"), "/root/.m2"),
+        (str(caches_root / "npm.tar"), "/root/.npm"),
+        (str(caches_root / "pip.tar"), "/root/.pip"),
+    ])
+    env_vars = {"BUILDRUNNER_STEP_NAME": "step1", "VCSINFO_NAME": "proj"}
+    runner.restore_caches(mock.MagicMock(), caches, env_vars)
+    runner.save_caches(mock.MagicMock(), caches, env_vars)
+
+    results = {
+        (event["operation"], event["path"]): (
+            event["key"],
+            event["archive"],
+            event["result"],
+        )
+        for event in runner.cache_events
+    }
+    assert results == {
+        ("restore", "/root/.m2"): ("m2-def.tar", "m2-abc.tar", "prefix"),
+        ("restore", "/root/.npm"): ("npm.tar", "npm.tar", "exact"),
+        ("restore", "/root/.pip"): ("pip.tar", None, "miss"),
+        ("save", "/root/.m2"): ("m2-def.tar", "m2-def.tar", "saved"),
+        ("save", "/root/.npm"): ("npm.tar", "npm.tar", "saved"),
+        ("save", "/root/.pip"): ("pip.tar", "pip.tar", "saved"),
+    }
+    for event in runner.cache_events:
+        assert event["step"] == "step1"
+        assert event["project"] == "proj"
+        assert event["seconds"] >= 0
+        if event["result"] != "miss":
+            assert event["bytes"] == len(create_tar({"file1": b"saved"}))
+    # Recorded in the caches root as well
+    assert list(read_cache_events(str(caches_root))) == runner.cache_events
+
+
+def test_failed_save_is_recorded(runner, tmp_path):
+    runner.docker_client.get_archive.side_effect = IOError("failed")
+    caches = OrderedDict([(str(tmp_path / "caches" / "m2.tar"), "/root/.m2")])
+    with pytest.raises(Exception, match="failed"):
+        runner.save_caches(mock.MagicMock(), caches)
+    assert [event["result"] for event in runner.cache_events] == ["error"]
+
+
+def test_rotation(tmp_path):
+    caches_root = str(tmp_path / "caches")
+    with mock.patch("buildrunner.caches.telemetry.CACHE_TELEMETRY_MAX_SIZE", 10):
+        record_cache_event(caches_root, {"index": 1})
+        record_cache_event(caches_root, {"index": 2})
+    record_cache_event(caches_root, {"index": 3})
+    # Records cut short are skipped
+    with open(
+        tmp_path / "caches" / CACHE_TELEMETRY_FILE, "a", encoding="utf-8"
+    ) as fobj:
+        fobj.write('{"index": ')
+    assert [event["index"] for event in read_cache_events(caches_root)] == [2, 3]
+
+
+def test_summary():
+    summary = summarize_cache_events([
+        _event("restore", "/root/.m2", "exact", bytes=300, seconds=1.0),
+        _event("restore", "/root/.m2", "prefix", bytes=100, seconds=1.0),
+        _event("restore", "/root/.m2", "miss"),
+        _event("restore", "/root/.npm", "miss", lock_wait_seconds=0.5),
+        _event("save", "/root/.m2", "saved", bytes=200, seconds=4.0),
+        _event("save", "/root/.npm", "unchanged", lock_wait_seconds=1.0),
+    ])
+    assert summary["restores"] == 4
+    assert summary["hit_rate"] == 0.5
+    assert summary["tiers"] == {1: 2}
+    assert summary["bytes_restored"] == 400
+    assert summary["seconds_saving"] == 4.0
+    assert summary["lock_wait_seconds"] == 1.5
+    assert summary["caches"]["proj /root/.m2"]["hit_rate"] == pytest.approx(2 / 3)
+    assert summary["caches"]["proj /root/.npm"] == {
+        "restores": 1,
+        "hits": 0,
+        "saves": 1,
+        "skipped": 1,
+        "hit_rate": 0.0,
+    }
+
+
+def test_report(tmp_path):
+    caches_root = str(tmp_path / "caches")
+    (tmp_path / "caches" / "small.tar").write_bytes(b"0" * 100)
+    (tmp_path / "caches" / "large.tar").write_bytes(b"0" * 4096)
+    record_cache_event(
+        caches_root,
+        _event("restore", "/root/.m2", "exact", bytes=4096, seconds=2.0),
+    )
+    record_cache_event(caches_root, _event("restore", "/root/.npm", "miss"))
+
+    report = format_cache_report(caches_root).splitlines()
+    assert "Restores: 2, hit rate 50% (1 exact, 0 prefix, 1 miss)" in report
+    assert "Restored 4.0K at 2.0K/s" in report
+    # The caches with the lowest hit rate and the largest archives come first
+    caches = report.index("Caches by hit rate (project, docker path):")
+    assert report[caches + 1].endswith("proj /root/.npm")
+    largest = report.index("Largest cache archives:")
+    assert report[largest + 1 :] == ["      4.0K large.tar", "    100.0B small.tar"]
+    # Nothing is recorded for a caches root that was never used
+    assert "Restores: 0, hit rate 0% (0 exact, 0 prefix, 0 miss)" in (
+        format_cache_report(str(tmp_path / "missing")).splitlines()
+    )
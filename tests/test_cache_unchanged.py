@@ -0,0 +1,123 @@
+import os
+import shlex
+import subprocess
+from collections import OrderedDict
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunnerConfig
+from buildrunner.docker.runner import CACHE_FINGERPRINT_COMMAND
+from tests.utils import create_tar
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+@pytest.fixture(name="runner")
+def fixture_runner(runner):
+    """
+    A runner whose container lists the files of each path from the "listings" dict of
+    the docker client.
+    """
+    docker_client = runner.docker_client
+    docker_client.listings = {}
+    docker_client.exec_create.side_effect = lambda _container, cmd, **kwargs: cmd[2]
+    docker_client.exec_start.side_effect = lambda cmd, stream: iter([
+        docker_client.listings[path].encode()
+        for path in docker_client.listings
+        if f"cd {path} " in cmd
+    ])
+    docker_client.exec_inspect.return_value = {"ExitCode": 0}
+    docker_client.put_archive.return_value = True
+    docker_client.get_archive.side_effect = lambda _container, path: (
+        [create_tar({"file1": path.encode()})],
+        {},
+    )
+    return runner
+
+
+def test_unchanged_cache_is_not_saved(runner, tmp_path):
+    (tmp_path / "m2.tar").write_bytes(create_tar({"file1": b"m2"}))
+    (tmp_path / "npm.tar").write_bytes(create_tar({"file1": b"npm"}))
+    caches = OrderedDict([
+        (str(tmp_path / "m2.tar"), "/root/.m2"),
+        (str(tmp_path / "npm.tar"), "/root/.npm"),
+    ])
+    runner.docker_client.listings = {
+        "/root/.m2": "./file1 2 100 200\n",
+        "/root/.npm": "./file1 3 100 200\n",
+    }
+    runner.restore_caches(mock.MagicMock(), caches)
+
+    # Only the npm cache changed
+    runner.docker_client.listings["/root/.npm"] = "./file1 3 300 300\n"
+    logger = mock.MagicMock()
+    runner.save_caches(logger, caches)
+
+    runner.docker_client.get_archive.assert_called_once_with(
+        "container1", "/root/.npm/."
+    )
+    assert (tmp_path / "m2.tar").read_bytes() == create_tar({"file1": b"m2"})
+    assert (tmp_path / "npm.tar").read_bytes() == create_tar({"file1": b"/root/.npm/."})
+    # No cache history is written for the skipped cache either
+    assert (tmp_path / "cache_history.log").read_text().count("was written") == 1
+    messages = [call.args[0] for call in logger.info.call_args_list]
+    assert (
+        "[/root/.m2] Cache /root/.m2 did not change since it was restored, "
+        f"skipping save to {tmp_path / 'm2.tar'}"
+    ) in messages
+
+
+def test_cache_restored_from_another_key_is_saved(runner, tmp_path):
+    (tmp_path / "m2-abc.tar").write_bytes(create_tar({"file1": b"m2"}))
+    caches = OrderedDict([
+        (str(tmp_path / "m2-def.tar"), "/root/.m2"),
+        (str(tmp_path / "m2-.tar"), "/root/.m2"),
+    ])
+    runner.docker_client.listings = {"/root/.m2": "./file1 2 100 200\n"}
+    runner.restore_caches(mock.MagicMock(), caches)
+    runner.save_caches(mock.MagicMock(), caches)
+
+    assert (tmp_path / "m2-def.tar").read_bytes() == create_tar({
+        "file1": b"/root/.m2/."
+    })
+
+
+@pytest.mark.parametrize("exit_code, skip_unchanged", [(1, True), (0, False)])
+def test_cache_is_saved_without_fingerprint(
+    runner, tmp_path, exit_code, skip_unchanged
+):
+    BuildRunnerConfig.get_instance().global_config.caches.skip_unchanged = (
+        skip_unchanged
+    )
+    (tmp_path / "m2.tar").write_bytes(create_tar({"file1": b"m2"}))
+    caches = OrderedDict([(str(tmp_path / "m2.tar"), "/root/.m2")])
+    runner.docker_client.listings = {"/root/.m2": "./file1 2 100 200\n"}
+    # e.g. the image does not have stat
+    runner.docker_client.exec_inspect.return_value = {"ExitCode": exit_code}
+    runner.restore_caches(mock.MagicMock(), caches)
+    runner.save_caches(mock.MagicMock(), caches)
+
+    assert (tmp_path / "m2.tar").read_bytes() == create_tar({"file1": b"/root/.m2/."})
+
+
+def _fingerprint(path) -> bytes:
+    return subprocess.run(
+        ["/bin/sh", "-c", CACHE_FINGERPRINT_COMMAND.format(path=shlex.quote(path))],
+        check=True,
+        capture_output=True,
+    ).stdout
+
+
+def test_fingerprint_has_sub_second_resolution(tmp_path):
+    cache_file = tmp_path / "file1"
+    cache_file.write_bytes(b"1")
+    os.utime(cache_file, ns=(1_000_000_000, 1_000_000_000))
+    listing = _fingerprint(str(tmp_path))
+    assert b"./file1 1 " in listing
+
+    # Rewritten with the same size within the same second
+    cache_file.write_bytes(b"2")
+    os.utime(cache_file, ns=(1_000_000_000, 1_500_000_000))
+    assert _fingerprint(str(tmp_path)) != listing
@@ -0,0 +1,166 @@
+from unittest import mock
+
+import pytest
+from docker.errors import APIError, NotFound
+
+from buildrunner.caches.volume import (
+    CACHE_VOLUME_CLAIM_SECONDS,
+    CACHE_VOLUME_LABEL,
+    CacheVolumes,
+)
+
+
+@pytest.fixture(name="docker_client")
+def fixture_docker_client():
+    """
+    A docker client keeping its volumes in memory, volumes in the "in_use" set cannot
+    be removed.
+    """
+    client = mock.MagicMock()
+    client.volumes_store = {}
+    client.in_use = set()
+
+    def _create_volume(name, labels):
+        client.volumes_store[name] = labels
+
+    def _inspect_volume(name):
+        if name not in client.volumes_store:
+            raise NotFound(name)
+        return {"Name": name}
+
+    def _remove_volume(name):
+        if name not in client.volumes_store:
+            raise NotFound(name)
+        if name in client.in_use:
+            raise APIError(f"volume {name} is in use")
+        del client.volumes_store[name]
+
+    client.create_volume.side_effect = _create_volume
+    client.inspect_volume.side_effect = _inspect_volume
+    client.remove_volume.side_effect = _remove_volume
+    client.volumes.side_effect = lambda filters: {
+        "Volumes": [{"Name": name} for name in client.volumes_store]
+    }
+    # The contents of each volume, copied by the clone containers
+    client.contents = {}
+    client.create_host_config.side_effect = lambda binds: binds
+    client.create_container.side_effect = lambda image, command, labels, host_config: {
+        "Id": host_config
+    }
+
+    def _wait(binds):
+        source, volume = binds
+        client.contents[volume] = client.contents.get(source)
+        return {"StatusCode": client.clone_status}
+
+    client.clone_status = 0
+    client.wait.side_effect = _wait
+    return client
+
+
+def test_claim_and_promote(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+
+    volume, matched_key = cache_volumes.claim(["m2-abc", "m2-"])
+    assert matched_key is None
+    assert docker_client.volumes_store[volume] == {CACHE_VOLUME_LABEL: "m2-abc"}
+    docker_client.create_container.assert_not_called()
+    docker_client.contents[volume] = "m2"
+    cache_volumes.promote("m2-abc", volume)
+
+    # A different key falls back to the prefix and mounts a copy of its volume
+    copy, matched_key = cache_volumes.claim(["m2-def", "m2-"])
+    assert matched_key == "m2-abc"
+    assert copy != volume
+    assert docker_client.contents[copy] == "m2"
+    assert docker_client.create_container.call_args.kwargs["host_config"] == {
+        volume: {"bind": "/cache", "ro": True},
+        copy: {"bind": "/clone", "ro": False},
+    }
+    docker_client.remove_container.assert_called_once()
+    cache_volumes.promote("m2-def", copy)
+    assert cache_volumes.claim(["m2-def"])[1] == "m2-def"
+    # Both keys keep their own volume
+    assert volume in docker_client.volumes_store
+    assert copy in docker_client.volumes_store
+
+
+def test_concurrent_claims_copy_the_volume(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+    volume, _ = cache_volumes.claim(["npm"])
+    docker_client.contents[volume] = "npm"
+    cache_volumes.promote("npm", volume)
+
+    # Steps using the cache at the same time each start from a copy of it
+    first, matched_key = cache_volumes.claim(["npm"])
+    assert matched_key == "npm"
+    second, matched_key = cache_volumes.claim(["npm"])
+    assert matched_key == "npm"
+    assert docker_client.contents[first] == docker_client.contents[second] == "npm"
+
+    # The step promoting last wins, the volumes it replaces are removed
+    cache_volumes.promote("npm", first)
+    cache_volumes.promote("npm", second)
+    assert list(docker_client.volumes_store) == [second]
+
+
+def test_failed_step_keeps_the_cache(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+    volume, _ = cache_volumes.claim(["npm"])
+    docker_client.contents[volume] = "npm"
+    cache_volumes.promote("npm", volume)
+
+    copy, matched_key = cache_volumes.claim(["npm"])
+    assert matched_key == "npm"
+    # Only the copy of the failed step is removed
+    cache_volumes.discard(copy)
+    assert list(docker_client.volumes_store) == [volume]
+    next_copy, matched_key = cache_volumes.claim(["npm"])
+    assert matched_key == "npm"
+    assert docker_client.contents[next_copy] == "npm"
+
+
+def test_failed_copy_starts_from_an_empty_volume(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+    volume, _ = cache_volumes.claim(["npm"])
+    cache_volumes.promote("npm", volume)
+
+    docker_client.clone_status = 1
+    copy, matched_key = cache_volumes.claim(["npm"])
+    assert matched_key is None
+    assert copy in docker_client.volumes_store
+    assert volume in docker_client.volumes_store
+
+
+def test_missing_volume_is_skipped(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+    volume, _ = cache_volumes.claim(["npm-old"])
+    cache_volumes.promote("npm-old", volume)
+    newer, _ = cache_volumes.claim(["npm-new"])
+    cache_volumes.promote("npm-new", newer)
+    # Removed outside of buildrunner
+    del docker_client.volumes_store[newer]
+
+    assert cache_volumes.claim(["npm-"])[1] == "npm-old"
+
+
+def test_prune(docker_client, tmp_path):
+    cache_volumes = CacheVolumes(docker_client, str(tmp_path))
+    current, _ = cache_volumes.claim(["current"])
+    cache_volumes.promote("current", current)
+    claimed, _ = cache_volumes.claim(["claimed"])
+    docker_client.create_volume("leaked", {CACHE_VOLUME_LABEL: "leaked"})
+    docker_client.create_volume("in-use", {CACHE_VOLUME_LABEL: "in-use"})
+    docker_client.in_use.add("in-use")
+
+    assert cache_volumes.prune() == ["leaked"]
+    with mock.patch(
+        "buildrunner.caches.volume.time.time",
+        return_value=CACHE_VOLUME_CLAIM_SECONDS * 10**6,
+    ):
+        # Claims expire, e.g. when the step was killed
+        assert cache_volumes.prune() == [claimed]
+
+    assert cache_volumes.prune(remove_all=True) == [current]
+    assert list(docker_client.volumes_store) == ["in-use"]
+    assert cache_volumes.claim(["current"])[1] is None
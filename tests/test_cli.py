@@ -1,5 +1,6 @@
 import argparse
 import os
+import sys
 
 import pytest
 import yaml
@@ -113,6 +114,8 @@ def test_clean_cache_with_platform(
     mock_args.security_scan_version = None
     mock_args.security_scan_config_file = None
     mock_args.security_scan_max_score_threshold = None
+    mock_args.evict_cache = False
+    mock_args.report_cache = False
     mock_parse_args.return_value = mock_args
 
     # Call clean_cache
@@ -158,6 +161,8 @@ def test_clean_cache_with_global_config_overrides(
     mock_args.security_scan_version = "0.50.0"
     mock_args.security_scan_config_file = None
     mock_args.security_scan_max_score_threshold = 7.5
+    mock_args.evict_cache = False
+    mock_args.report_cache = False
     mock_parse_args.return_value = mock_args
 
     # Call clean_cache
@@ -172,3 +177,30 @@ def test_clean_cache_with_global_config_overrides(
     assert overrides["security-scan"]["scanner"] == "trivy"
     assert overrides["security-scan"]["version"] == "0.50.0"
     assert overrides["security-scan"]["max-score-threshold"] == 7.5
+
+
+@mock.patch("buildrunner.cli.BuildRunner")
+@mock.patch("buildrunner.cli.BuildRunnerConfig")
+def test_clean_cache_evict(mock_config, mock_buildrunner, tmp_path):
+    """Test that buildrunner-cleanup --evict evicts caches instead of removing them all"""
+    with mock.patch.object(
+        sys, "argv", ["buildrunner-cleanup", "-d", str(tmp_path), "--evict"]
+    ):
+        cli.clean_cache()
+    mock_config.initialize_instance.assert_called_once()
+    mock_buildrunner.evict_cache.assert_called_once()
+    mock_buildrunner.clean_cache.assert_not_called()
+
+
+@mock.patch("buildrunner.cli.BuildRunner")
+@mock.patch("buildrunner.cli.BuildRunnerConfig")
+def test_clean_cache_report(mock_config, mock_buildrunner, tmp_path):
+    """Test that buildrunner-cleanup --report reports on caches instead of removing them"""
+    with mock.patch.object(
+        sys, "argv", ["buildrunner-cleanup", "-d", str(tmp_path), "--report"]
+    ):
+        cli.clean_cache()
+    mock_config.initialize_instance.assert_called_once()
+    mock_buildrunner.report_cache.assert_called_once()
+    mock_buildrunner.clean_cache.assert_not_called()
+    mock_buildrunner.evict_cache.assert_not_called()
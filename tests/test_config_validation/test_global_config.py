@@ -120,6 +120,97 @@ def fixture_override_master_config_file(tmp_path):
                 "disable-multi-platform:  Input should be a valid boolean, unable to interpret input (bool_parsing)"
             ],
         ),
+        (
+            """
+          source:
+            incremental: true
+            reuse-image: true
+            provider: volume
+            volume-read-only: false
+          """,
+            [],
+        ),
+        (
+            """
+          source:
+            provider: bogus
+          """,
+            ['Invalid source provider "bogus"'],
+        ),
+        (
+            """
+          caches:
+            codec: zstd
+            level: 10
+            threads: -1
+          """,
+            [],
+        ),
+        (
+            """
+          caches:
+            codec: lz4
+          """,
+            ['Invalid cache codec "lz4"'],
+        ),
+        (
+            """
+          caches:
+            storage: volume
+            skip-unchanged: false
+            save-all-keys: true
+          """,
+            [],
+        ),
+        (
+            """
+          caches:
+            storage: s3
+          """,
+            ['Invalid cache storage "s3"'],
+        ),
+        (
+            """
+          caches:
+            backend:
+              type: s3
+              url: http://minio:9000
+              bucket: caches
+              part-size: 16M
+          """,
+            [],
+        ),
+        (
+            """
+          caches:
+            backend:
+              type: http
+          """,
+            ['The "http" cache backend requires a url'],
+        ),
+        (
+            """
+          artifacts:
+            compress-on-host: true
+            threads: 8
+            checksums: [sha256, md5]
+          """,
+            [],
+        ),
+        (
+            """
+          artifacts:
+            checksums: [crc32]
+          """,
+            ['Invalid artifact checksum "crc32"'],
+        ),
+        (
+            """
+          artifacts:
+            threads: -1
+          """,
+            ['Invalid artifact compression threads "-1"'],
+        ),
         (
             """
           platform-builders:
@@ -352,6 +352,43 @@ from buildrunner.config.models_step import StepPushCommit, StepPypiPush
     """,
             [],
         ),
+        (
+            """
+    steps:
+      build:
+        run:
+          image: mytest-reg/buildrunner-test
+          caches:
+            maven: /root/.m2/repository
+            /root/.npm:
+              - npm-{{ checksum("package-lock.json") }}
+              - npm-
+            /root/.gradle:
+              keys: gradle
+              storage: volume
+            /root/.m2:
+              keys: [m2-main-abc, m2-main-]
+              save-all-keys: true
+    """,
+            [],
+        ),
+        (
+            """
+    steps:
+      build:
+        run:
+          image: mytest-reg/buildrunner-test
+          caches:
+            /root/.gradle:
+              keys: [gradle]
+              storage: s3
+    """,
+            [
+                "Input should be a valid string",
+                "Input should be a valid list",
+                'Invalid cache storage "s3"',
+            ],
+        ),
     ],
 )
 def test_config_data(
@@ -0,0 +1,142 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+from unittest import mock
+
+import pytest
+
+from buildrunner.docker import builder
+from buildrunner.docker.context import (
+    get_context_files,
+    read_dockerignore,
+    stream_context,
+)
+
+
+def _write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fobj:
+        fobj.write(content)
+
+
+def _names(data, compressed=False):
+    if compressed:
+        data = gzip.decompress(data)
+    with tarfile.open(fileobj=io.BytesIO(data)) as tfile:
+        return {
+            member.name: tfile.extractfile(member).read().decode()
+            if member.isfile()
+            else None
+            for member in tfile.getmembers()
+        }
+
+
+@pytest.fixture(name="context_dir")
+def fixture_context_dir(tmp_path):
+    context_dir = str(tmp_path / "context")
+    _write(os.path.join(context_dir, "Dockerfile"), "FROM scratch\n")
+    _write(os.path.join(context_dir, "src", "main.py"), "main")
+    _write(os.path.join(context_dir, "build", "output.bin"), "output")
+    _write(os.path.join(context_dir, ".dockerignore"), "# comment\nbuild\n\n*.log\n")
+    _write(os.path.join(context_dir, "debug.log"), "log")
+    return context_dir
+
+
+def test_dockerignore(context_dir):
+    patterns = read_dockerignore(context_dir)
+    assert patterns == ["build", "*.log"]
+    files = get_context_files(context_dir, patterns)
+    assert "src/main.py" in files
+    assert "Dockerfile" in files
+    assert "debug.log" not in files
+    assert not any(path.startswith("build") for path in files)
+    # The patterns are not modified
+    assert patterns == ["build", "*.log"]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_stream_context(context_dir, tmp_path, compressed):
+    injected = str(tmp_path / "injected.txt")
+    _write(injected, "injected")
+    data = b"".join(
+        stream_context(
+            path=context_dir,
+            files=get_context_files(context_dir, read_dockerignore(context_dir)),
+            inject=[(injected, "extra/injected.txt")],
+            extra_files=[("Dockerfile", "FROM busybox\n")],
+            gzip=compressed,
+        )
+    )
+    names = _names(data, compressed)
+    assert names["src/main.py"] == "main"
+    assert names["extra/injected.txt"] == "injected"
+    # Extra files replace context files with the same name
+    assert names["Dockerfile"] == "FROM busybox\n"
+    assert "debug.log" not in names
+
+
+def test_stream_context_error(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        b"".join(stream_context(inject=[(str(tmp_path / "missing"), "missing")]))
+
+
+def test_stream_context_closed_early(context_dir):
+    chunks = stream_context(path=context_dir, files=["src/main.py"])
+    next(chunks)
+    # Closing the generator stops the producer thread without hanging
+    chunks.close()
+
+
+@pytest.mark.parametrize(
+    "base_url, compressed",
+    [("http+docker://localhost", False), ("https://remote:2376", True)],
+)
+def test_builder_streams_context(context_dir, tmp_path, base_url, compressed):
+    docker_client = mock.MagicMock(base_url=base_url)
+    contexts = {}
+
+    def _build(**kwargs):
+        contexts["data"] = b"".join(kwargs["fileobj"])
+        contexts["kwargs"] = kwargs
+        return [json.dumps({"stream": "Successfully built 0123abcd\n"}).encode()]
+
+    docker_client.build.side_effect = _build
+    injected = str(tmp_path / "injected.txt")
+    _write(injected, "injected")
+    with mock.patch.object(builder, "new_client", return_value=docker_client):
+        docker_builder = builder.DockerBuilder(
+            context_dir, inject={injected: "injected.txt"}
+        )
+        assert docker_builder.build() == 0
+    assert docker_builder.image == "0123abcd"
+    kwargs = contexts["kwargs"]
+    assert kwargs["custom_context"]
+    assert kwargs["encoding"] == ("gzip" if compressed else None)
+    names = _names(contexts["data"], compressed)
+    assert "injected.txt" in names
+    assert "src/main.py" in names
+    # The .dockerignore is honored when injecting files
+    assert "debug.log" not in names
+
+
+def test_builder_dockerfile_outside_context(context_dir, tmp_path):
+    docker_client = mock.MagicMock(base_url="http+docker://localhost")
+    contexts = {}
+
+    def _build(**kwargs):
+        contexts["data"] = b"".join(kwargs["fileobj"])
+        contexts["kwargs"] = kwargs
+        return []
+
+    docker_client.build.side_effect = _build
+    dockerfile = str(tmp_path / "Other.Dockerfile")
+    _write(dockerfile, "FROM other\n")
+    with mock.patch.object(builder, "new_client", return_value=docker_client):
+        builder.DockerBuilder(context_dir, dockerfile=dockerfile).build()
+    dockerfile_name = contexts["kwargs"]["dockerfile"]
+    assert dockerfile_name.startswith(".dockerfile.")
+    names = _names(contexts["data"])
+    assert names[dockerfile_name] == "FROM other\n"
+    assert dockerfile_name in names[".dockerignore"].splitlines()
@@ -0,0 +1,116 @@
+from unittest import mock
+
+import pytest
+
+from buildrunner.config.models_step import StepRun
+from buildrunner.docker.helper import HELPER_CONTAINER_LABEL, HelperContainer
+from buildrunner.errors import BuildRunnerProcessingError
+from buildrunner.steprunner.tasks.run import RunBuildStepRunnerTask
+
+
+pytestmark = pytest.mark.usefixtures("initialize_config")
+
+
+@pytest.fixture(name="docker_runner")
+def fixture_docker_runner():
+    with mock.patch("buildrunner.docker.helper.DockerRunner") as docker_runner_class:
+        runner = docker_runner_class.return_value
+        runner.container = {"Id": "helper1"}
+        runner.run_with_output.return_value = (0, b"")
+        yield runner
+
+
+def test_helper_container_is_started_once(docker_runner):
+    helper_container = HelperContainer(
+        "docker.io", volumes={"source1": "/source:ro"}, working_dir="/source"
+    )
+    assert helper_container.container is None
+
+    assert helper_container.run_with_output("ls") == (0, b"")
+    helper_container.stream_archive("/source/file1")
+    helper_container.run_to_file("tar -c dir1", mock.MagicMock())
+
+    docker_runner.start.assert_called_once_with(
+        shell="/bin/sh",
+        volumes={"source1": "/source:ro"},
+        working_dir="/source",
+        labels={HELPER_CONTAINER_LABEL: "true"},
+    )
+    assert helper_container.container == "helper1"
+    docker_runner.stream_archive.assert_called_once_with("/source/file1")
+
+    helper_container.remove()
+    docker_runner.cleanup.assert_called_once()
+
+
+def test_helper_container_networks(docker_runner):
+    helper_container = HelperContainer("docker.io")
+    docker_client = docker_runner.docker_client
+
+    helper_container.connect("network1")
+    helper_container.connect("network1")
+    helper_container.connect(None)
+    docker_client.connect_container_to_network.assert_called_once_with(
+        "helper1", "network1"
+    )
+
+    helper_container.disconnect("network2")
+    helper_container.disconnect("network1")
+    docker_client.disconnect_container_from_network.assert_called_once_with(
+        "helper1", "network1", force=True
+    )
+
+
+@pytest.mark.parametrize("exit_code, is_open", [(0, True), (1, False), (124, False)])
+def test_helper_container_probe_port(docker_runner, exit_code, is_open):
+    docker_runner.run_with_output.return_value = (exit_code, b"")
+    assert HelperContainer("docker.io").probe_port("10.0.0.2", "8080") is is_open
+    command = docker_runner.run_with_output.call_args.args[0]
+    assert command[-1] == "exec 3<>/dev/tcp/10.0.0.2/8080"
+
+
+def _create_task(container_status="running"):
+    step_runner = mock.MagicMock()
+    step_runner.network_name = "network1"
+    task = RunBuildStepRunnerTask.__new__(RunBuildStepRunnerTask)
+    task.step_runner = step_runner
+    task.step = StepRun(image="image1")
+    task._helper_container = None  # pylint: disable=protected-access
+    task._probe_natively = False  # pylint: disable=protected-access
+    task._docker_client = mock.MagicMock()  # pylint: disable=protected-access
+    task._docker_client.inspect_container.return_value = {
+        "NetworkSettings": {"Networks": {"network1": {"IPAddress": "10.0.0.2"}}},
+        "State": {"Status": container_status},
+    }
+    return task
+
+
+def test_wait_probes_in_helper_container():
+    task = _create_task()
+    helper_container = task.step_runner.build_runner.get_helper_container.return_value
+    helper_container.probe_port.side_effect = [False, True]
+    with mock.patch("buildrunner.steprunner.tasks.run.time.sleep") as sleep:
+        task.wait("service1", {"port": 8080, "timeout": 10})
+
+    helper_container.connect.assert_called_once_with("network1")
+    helper_container.probe_port.assert_called_with("10.0.0.2", 8080)
+    assert helper_container.probe_port.call_count == 2
+    sleep.assert_called_once()
+
+    # The helper container leaves the step network when the step is cleaned up
+    task.runner = None
+    task._claimed_cache_volumes = {}  # pylint: disable=protected-access
+    task._service_runners = {}  # pylint: disable=protected-access
+    task._sshagent = None  # pylint: disable=protected-access
+    task._source_container = None  # pylint: disable=protected-access
+    task.images_to_remove = []
+    task.cleanup({})
+    helper_container.disconnect.assert_called_once_with("network1")
+    task.step_runner.network_name = None
+
+
+def test_wait_stopped_container():
+    task = _create_task("exited")
+    with pytest.raises(BuildRunnerProcessingError):
+        task.wait("service1", 8080)
+    task.step_runner.network_name = None
@@ -884,3 +884,65 @@ def test_cleanup_intermediate_images_on_exit_integration():
 
     found = docker.image.list(filters={"reference": image_ref})
     assert len(found) == 0, "Intermediate image should be removed after exit"
+
+
+@patch("buildrunner.docker.multiplatform_image_builder.docker.image.remove")
+@patch("buildrunner.docker.multiplatform_image_builder.docker.push")
+@patch(
+    "buildrunner.docker.multiplatform_image_builder.docker.buildx.imagetools.inspect"
+)
+@patch("buildrunner.docker.multiplatform_image_builder.docker.buildx.build")
+def test_build_with_inject_shares_context(
+    mock_build, mock_imagetools_inspect, mock_push, mock_remove, tmp_path
+):
+    _ = mock_push
+    _ = mock_remove
+    mock_imagetools_inspect.return_value = MagicMock()
+    mock_imagetools_inspect.return_value.config.digest = "myfakeimageid"
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "Dockerfile").write_text("FROM source\n")
+    (source_dir / "file.txt").write_text("file")
+    (source_dir / "injected.txt").write_text("injected")
+    other_dockerfile = tmp_path / "Other.Dockerfile"
+    other_dockerfile.write_text("FROM other\n")
+
+    contexts = []
+
+    def _build(context_dir, **_kwargs):
+        contexts.append(context_dir)
+        assert (
+            open(os.path.join(context_dir, "Dockerfile"), encoding="utf-8").read()
+            == "FROM other\n"
+        )
+        assert (
+            open(os.path.join(context_dir, "sub", "injected.txt"), encoding="utf-8")
+            .read()
+            .strip()
+            == "injected"
+        )
+        # Context files are linked rather than copied
+        assert (
+            os.stat(os.path.join(context_dir, "file.txt")).st_ino
+            == (source_dir / "file.txt").stat().st_ino
+        )
+        return iter([])
+
+    mock_build.side_effect = _build
+    mpib = MultiplatformImageBuilder(
+        build_registry="registry.example.com", temp_dir=str(tmp_path)
+    )
+    built_image = mpib.build_multiple_images(
+        platforms=["linux/amd64", "linux/arm64"],
+        path=str(source_dir),
+        file=str(other_dockerfile),
+        inject={"injected.txt": "sub/injected.txt"},
+        use_threading=False,
+    )
+
+    assert len(built_image.built_images) == 2
+    # The context is created once, shared by all platforms and removed afterwards
+    assert len(contexts) == 2 and contexts[0] == contexts[1]
+    assert not os.path.exists(contexts[0])
+    # Replacing the Dockerfile in the context does not modify the linked source file
+    assert (source_dir / "Dockerfile").read_text() == "FROM source\n"
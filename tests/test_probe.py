@@ -0,0 +1,179 @@
+import http.server
+import itertools
+import socket
+import threading
+from unittest import mock
+
+import pytest
+
+from buildrunner.config.models_step import StepRun
+from buildrunner.docker.probe import (
+    can_probe_natively,
+    get_backoff_delays,
+    probe_http,
+    probe_port,
+)
+from buildrunner.errors import BuildRunnerProcessingError
+from buildrunner.steprunner.tasks.run import RunBuildStepRunnerTask
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.send_response(200 if self.path == "/health" else 503)
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(name="server_port")
+def fixture_server_port():
+    server = http.server.HTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(name="closed_port")
+def fixture_closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_probe_port(server_port, closed_port):
+    assert probe_port("127.0.0.1", server_port) is True
+    assert probe_port("127.0.0.1", str(server_port)) is True
+    assert probe_port("127.0.0.1", closed_port) is False
+    with mock.patch(
+        "buildrunner.docker.probe.socket.create_connection",
+        side_effect=OSError("No route to host"),
+    ):
+        assert probe_port("172.17.0.2", server_port) is None
+
+
+def test_probe_http(server_port, closed_port):
+    assert probe_http("127.0.0.1", server_port, "/health") is True
+    assert probe_http("127.0.0.1", server_port, "/starting") is False
+    assert probe_http("127.0.0.1", closed_port, "/health") is False
+
+
+@pytest.mark.parametrize(
+    "system, docker_host, native",
+    [
+        ("Linux", None, True),
+        ("Linux", "unix:///var/run/docker.sock", True),
+        ("Linux", "tcp://docker:2376", False),
+        ("Darwin", None, False),
+    ],
+)
+def test_can_probe_natively(system, docker_host, native, monkeypatch):
+    monkeypatch.setattr("buildrunner.docker.probe.platform.system", lambda: system)
+    if docker_host:
+        monkeypatch.setenv("DOCKER_HOST", docker_host)
+    else:
+        monkeypatch.delenv("DOCKER_HOST", raising=False)
+    assert can_probe_natively() is native
+
+
+def test_get_backoff_delays():
+    delays = list(itertools.islice(get_backoff_delays(0.1, 1.0), 8))
+    for delay, maximum in zip(delays, (0.1, 0.2, 0.4, 0.8, 1.0, 1.0, 1.0, 1.0)):
+        assert maximum / 2 <= delay <= maximum
+
+
+def _create_task(probe_natively=True):
+    step_runner = mock.MagicMock()
+    step_runner.network_name = "network1"
+    task = RunBuildStepRunnerTask.__new__(RunBuildStepRunnerTask)
+    task.step_runner = step_runner
+    task.step = StepRun(image="image1")
+    task._helper_container = None  # pylint: disable=protected-access
+    task._probe_natively = probe_natively  # pylint: disable=protected-access
+    task._docker_client = mock.MagicMock()  # pylint: disable=protected-access
+    task._docker_client.inspect_container.return_value = {
+        "NetworkSettings": {"Networks": {"network1": {"IPAddress": "127.0.0.1"}}},
+        "State": {"Status": "running"},
+    }
+    return task
+
+
+def test_wait_probes_natively(server_port):
+    task = _create_task()
+    with mock.patch("buildrunner.steprunner.tasks.run.time.sleep") as sleep:
+        task.wait("service1", {"port": server_port, "http-get": "/health"})
+    sleep.assert_not_called()
+    # The helper container is not needed and the status is only checked once
+    task.step_runner.build_runner.get_helper_container.assert_not_called()
+    assert task._docker_client.inspect_container.call_count == 2  # pylint: disable=protected-access
+    task.step_runner.network_name = None
+
+
+def test_wait_backs_off_until_ready(server_port):
+    task = _create_task()
+    docker_client = task._docker_client  # pylint: disable=protected-access
+    docker_client.exec_inspect.side_effect = [{"ExitCode": 1}, {"ExitCode": 0}]
+    with mock.patch("buildrunner.steprunner.tasks.run.time.sleep") as sleep:
+        task.wait("service1", {"port": server_port, "command": "pg_isready"})
+
+    # The readiness command runs in the service container until it succeeds
+    assert sleep.call_count == 1
+    assert sleep.call_args.args[0] <= 0.1
+    docker_client.exec_create.assert_called_with(
+        "service1", ["/bin/sh", "-c", "pg_isready"], stdout=False, stderr=False
+    )
+    task.step_runner.network_name = None
+
+
+def test_wait_falls_back_to_helper_container(server_port):
+    task = _create_task()
+    helper_container = task.step_runner.build_runner.get_helper_container.return_value
+    helper_container.probe_http.return_value = True
+    with mock.patch("buildrunner.steprunner.tasks.run.probe_http", return_value=None):
+        task.wait("service1", {"port": server_port, "http-get": "/health"})
+
+    helper_container.connect.assert_called_once_with("network1")
+    helper_container.probe_http.assert_called_once_with(
+        "127.0.0.1", server_port, "/health"
+    )
+    # Later probes go straight to the helper container
+    assert task._probe_natively is False  # pylint: disable=protected-access
+    task.step_runner.network_name = None
+
+
+def test_wait_timeout(closed_port):
+    task = _create_task()
+    with mock.patch("buildrunner.steprunner.tasks.run.time.sleep") as sleep:
+        with mock.patch(
+            "buildrunner.steprunner.tasks.run.time.time",
+            side_effect=itertools.count(),
+        ):
+            with pytest.raises(BuildRunnerProcessingError, match="Timed out"):
+                task.wait("service1", {"port": closed_port, "timeout": 10})
+    # The container status is checked every few seconds, not on every probe
+    assert sleep.call_count == 5
+    assert task._docker_client.inspect_container.call_count == 3  # pylint: disable=protected-access
+    task.step_runner.network_name = None
+
+
+def test_wait_readiness_command_hangs(server_port):
+    task = _create_task()
+    docker_client = task._docker_client  # pylint: disable=protected-access
+    docker_client.exec_inspect.return_value = {"Running": True}
+    with mock.patch("buildrunner.steprunner.tasks.run.time.sleep"):
+        with mock.patch(
+            "buildrunner.steprunner.tasks.run.time.time",
+            side_effect=itertools.count(),
+        ):
+            with pytest.raises(BuildRunnerProcessingError, match="to be ready"):
+                task.wait(
+                    "service1",
+                    {"port": server_port, "command": "sleep 3600", "timeout": 10},
+                )
+    # The command is started once and given up on at the wait timeout
+    docker_client.exec_start.assert_called_once_with(
+        docker_client.exec_create.return_value, detach=True
+    )
+    task.step_runner.network_name = None
@@ -0,0 +1,224 @@
+import os
+import tarfile
+import time
+from unittest import mock
+
+import pytest
+
+from buildrunner.source import archive
+from buildrunner.source.archive import SourceArchiver
+
+
+def _write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fobj:
+        fobj.write(content)
+
+
+@pytest.fixture(name="source_dir")
+def fixture_source_dir(tmp_path):
+    source_dir = tmp_path / "src"
+    _write(str(source_dir / "README.md"), "readme")
+    _write(str(source_dir / "pkg" / "module.py"), "print('hi')")
+    _write(str(source_dir / "pkg" / "sub" / "data.txt"), "data")
+    _write(str(source_dir / "node_modules" / "dep" / "index.js"), "dep")
+    os.symlink("README.md", str(source_dir / "link.md"))
+    return str(source_dir)
+
+
+@pytest.fixture(name="caches_root")
+def fixture_caches_root(tmp_path):
+    return str(tmp_path / "caches")
+
+
+def _archiver(source_dir, caches_root, exclude=None):
+    return SourceArchiver(
+        build_dir=source_dir,
+        caches_root=caches_root,
+        project_name="project",
+        exclude=exclude,
+    )
+
+
+def test_archive_contents(source_dir, caches_root):
+    archiver = _archiver(source_dir, caches_root)
+    try:
+        archive_path = archiver.create()
+        with tarfile.open(archive_path) as tfile:
+            members = tfile.getmembers()
+    finally:
+        archiver.release()
+
+    names = [member.name for member in members]
+    assert names == sorted(names)
+    assert "pkg/sub/data.txt" in names
+    assert "pkg/sub" in names
+    link = [member for member in members if member.name == "link.md"][0]
+    assert link.issym() and link.linkname == "README.md"
+    for member in members:
+        assert member.mtime == archive.SOURCE_ARCHIVE_MTIME
+        assert member.uid == 0 and member.gid == 0
+        assert member.uname == "" and member.gname == ""
+
+
+def test_archive_is_deterministic(source_dir, caches_root, tmp_path):
+    archiver1 = _archiver(source_dir, caches_root)
+    archiver1.create()
+    archiver1.release()
+    with open(archiver1.archive_path, "rb") as fobj:
+        data1 = fobj.read()
+
+    # Touching files changes mtimes but not the archive
+    for root, _, files in os.walk(source_dir):
+        for file_name in files:
+            os.utime(os.path.join(root, file_name), (1000, 1000), follow_symlinks=False)
+    archiver2 = _archiver(source_dir, str(tmp_path / "other-caches"))
+    archiver2.create()
+    archiver2.release()
+    with open(archiver2.archive_path, "rb") as fobj:
+        data2 = fobj.read()
+
+    assert archiver1.digest == archiver2.digest
+    assert data1 == data2
+
+
+def test_unchanged_tree_reuses_archive(source_dir, caches_root):
+    archiver = _archiver(source_dir, caches_root)
+    first_path = archiver.create()
+    archiver.release()
+
+    archiver = _archiver(source_dir, caches_root)
+    with (
+        mock.patch.object(archive, "hash_file") as hash_mock,
+        mock.patch.object(SourceArchiver, "_write_archive") as write_mock,
+    ):
+        assert archiver.create() == first_path
+    archiver.release()
+    hash_mock.assert_not_called()
+    write_mock.assert_not_called()
+
+
+def test_changed_file_is_only_file_rehashed(source_dir, caches_root):
+    archiver = _archiver(source_dir, caches_root)
+    first_path = archiver.create()
+    archiver.release()
+
+    _write(os.path.join(source_dir, "pkg", "module.py"), "print('changed')")
+    archiver = _archiver(source_dir, caches_root)
+    with mock.patch.object(
+        archive, "hash_file", side_effect=archive.hash_file
+    ) as hash_mock:
+        second_path = archiver.create()
+    archiver.release()
+
+    assert second_path != first_path
+    hash_mock.assert_called_once_with(os.path.join(source_dir, "pkg/module.py"))
+    with tarfile.open(second_path) as tfile:
+        assert tfile.extractfile("pkg/module.py").read() == b"print('changed')"
+
+
+def _assert_consistent(archiver, other_caches_root):
+    with tarfile.open(archiver.archive_path) as tfile:
+        assert tfile.extractfile("pkg/module.py").read() == b"print('changed')"
+    archiver.release()
+    # The archive is published under the digest of its content
+    fresh = _archiver(archiver.build_dir, other_caches_root)
+    fresh.create()
+    fresh.release()
+    assert fresh.digest == archiver.digest
+    assert [
+        name for name in os.listdir(archiver.archive_dir) if name.endswith(".tmp")
+    ] == []
+
+
+def test_file_changed_after_hashing_is_rescanned(source_dir, caches_root, tmp_path):
+    hash_entries = SourceArchiver._hash_entries
+    changed = []
+
+    def _hash_and_change(self, *args):
+        hashed = hash_entries(self, *args)
+        if not changed:
+            changed.append(True)
+            _write(os.path.join(source_dir, "pkg", "module.py"), "print('changed')")
+        return hashed
+
+    archiver = _archiver(source_dir, caches_root)
+    with (
+        mock.patch.object(SourceArchiver, "_hash_entries", _hash_and_change),
+        mock.patch("retry.api.time.sleep") as sleep_mock,
+    ):
+        archiver.create()
+    sleep_mock.assert_called_once()
+    _assert_consistent(archiver, str(tmp_path / "other-caches"))
+
+
+def test_file_truncated_while_archived_is_rescanned(source_dir, caches_root, tmp_path):
+    module_path = os.path.join(source_dir, "pkg", "module.py")
+    check_unchanged = archive._check_unchanged
+    truncated = []
+
+    def _check_and_truncate(entry, file_stat):
+        check_unchanged(entry, file_stat)
+        if entry.path == "pkg/module.py" and not truncated:
+            truncated.append(True)
+            _write(module_path, "print(")
+
+    archiver = _archiver(source_dir, caches_root)
+    with (
+        mock.patch.object(archive, "_check_unchanged", _check_and_truncate),
+        # The file is completely written by the time the tree is scanned again
+        mock.patch(
+            "retry.api.time.sleep",
+            side_effect=lambda _: _write(module_path, "print('changed')"),
+        ) as sleep_mock,
+    ):
+        archiver.create()
+    sleep_mock.assert_called_once()
+    _assert_consistent(archiver, str(tmp_path / "other-caches"))
+
+
+def test_excluded_directories_are_pruned(source_dir, caches_root):
+    visited = []
+
+    def _exclude(name, is_dir):
+        visited.append(name)
+        return is_dir and name == "node_modules"
+
+    archiver = _archiver(source_dir, caches_root, exclude=_exclude)
+    archive_path = archiver.create()
+    archiver.release()
+
+    assert "node_modules" in visited
+    assert not [name for name in visited if name.startswith("node_modules/")]
+    with tarfile.open(archive_path) as tfile:
+        assert not [
+            name for name in tfile.getnames() if name.startswith("node_modules")
+        ]
+
+
+def test_old_unlocked_archives_are_pruned(source_dir, caches_root):
+    archiver = _archiver(source_dir, caches_root)
+    first_path = archiver.create()
+    archiver.release()
+    old_time = time.time() - archive.SOURCE_ARCHIVE_RETENTION_SECONDS - 10
+    os.utime(first_path, (old_time, old_time))
+
+    _write(os.path.join(source_dir, "new.txt"))
+    archiver = _archiver(source_dir, caches_root)
+    archiver.create()
+    archiver.release()
+    assert not os.path.exists(first_path)
+
+
+def test_locked_archives_are_not_pruned(source_dir, caches_root):
+    in_use = _archiver(source_dir, caches_root)
+    first_path = in_use.create()
+    old_time = time.time() - archive.SOURCE_ARCHIVE_RETENTION_SECONDS - 10
+    os.utime(first_path, (old_time, old_time))
+
+    _write(os.path.join(source_dir, "new.txt"))
+    archiver = _archiver(source_dir, caches_root)
+    archiver.create()
+    archiver.release()
+    in_use.release()
+    assert os.path.exists(first_path)
@@ -0,0 +1,149 @@
+import os
+import subprocess
+import tarfile
+from unittest import mock
+
+import pytest
+
+from buildrunner.source import archive
+from buildrunner.source.archive import SourceArchiver
+from buildrunner.source.git import GIT_CONTENT_ID_PREFIX, get_clean_blobs, list_files
+
+
+def _git(repo_dir, *args):
+    subprocess.run(
+        [
+            "git",
+            "-C",
+            repo_dir,
+            "-c",
+            "user.name=test",
+            "-c",
+            "user.email=test@example.com",
+            *args,
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as fobj:
+        fobj.write(content)
+
+
+@pytest.fixture(name="repo_dir")
+def fixture_repo_dir(tmp_path):
+    repo_dir = str(tmp_path / "repo")
+    for name in ("clean.txt", "modified.txt", "assumed.txt", "filtered.bin"):
+        _write(os.path.join(repo_dir, "sub", name), name)
+    _write(os.path.join(repo_dir, ".gitattributes"), "*.bin filter=custom\n")
+    _git(repo_dir, "init", "-q")
+    _git(repo_dir, "config", "core.autocrlf", "false")
+    _git(repo_dir, "add", ".")
+    _git(repo_dir, "commit", "-q", "-m", "initial")
+    _git(repo_dir, "update-index", "--assume-unchanged", "sub/assumed.txt")
+    _write(os.path.join(repo_dir, "sub", "modified.txt"), "changed")
+    _write(os.path.join(repo_dir, "sub", "untracked.txt"), "untracked")
+    return repo_dir
+
+
+def test_clean_blobs(repo_dir):
+    blobs = get_clean_blobs(repo_dir)
+    assert sorted(blobs) == [".gitattributes", "sub/clean.txt"]
+    assert blobs["sub/clean.txt"].startswith(GIT_CONTENT_ID_PREFIX)
+
+
+def test_clean_blobs_subdirectory(repo_dir):
+    assert list(get_clean_blobs(os.path.join(repo_dir, "sub"))) == ["clean.txt"]
+
+
+def test_clean_blobs_autocrlf(repo_dir):
+    _git(repo_dir, "config", "core.autocrlf", "input")
+    assert not get_clean_blobs(repo_dir)
+
+
+def test_clean_blobs_not_a_repo(tmp_path):
+    assert not get_clean_blobs(str(tmp_path))
+
+
+def test_archiver_uses_git_index(repo_dir, tmp_path):
+    archiver = SourceArchiver(
+        build_dir=repo_dir,
+        caches_root=str(tmp_path / "caches"),
+        project_name="project",
+        exclude=lambda name, _: name == ".git",
+        use_git_index=True,
+    )
+    with mock.patch.object(
+        archive, "hash_file", side_effect=archive.hash_file
+    ) as hash_file:
+        archive_path = archiver.create()
+    try:
+        hashed = sorted(
+            os.path.relpath(call.args[0], repo_dir) for call in hash_file.call_args_list
+        )
+        assert hashed == [
+            "sub/assumed.txt",
+            "sub/filtered.bin",
+            "sub/modified.txt",
+            "sub/untracked.txt",
+        ]
+        with tarfile.open(archive_path) as tfile:
+            assert tfile.extractfile("sub/modified.txt").read().decode() == "changed"
+            assert "sub/untracked.txt" in tfile.getnames()
+    finally:
+        archiver.release()
+
+
+def test_list_files(repo_dir):
+    _write(os.path.join(repo_dir, ".gitignore"), "build/\n")
+    _write(os.path.join(repo_dir, "build", "output.txt"), "output")
+    _write(os.path.join(repo_dir, "nested", "file.txt"), "nested")
+    _git(os.path.join(repo_dir, "nested"), "init", "-q")
+    assert sorted(list_files(repo_dir)) == [
+        ".gitattributes",
+        ".gitignore",
+        "nested/",
+        "sub/assumed.txt",
+        "sub/clean.txt",
+        "sub/filtered.bin",
+        "sub/modified.txt",
+        "sub/untracked.txt",
+    ]
+    assert list_files(str(os.path.dirname(repo_dir))) is None
+
+
+@pytest.mark.parametrize("include_git_ignored", [False, True])
+def test_archiver_lists_files_with_git(repo_dir, tmp_path, include_git_ignored):
+    _write(os.path.join(repo_dir, ".gitignore"), "build/\n")
+    _write(os.path.join(repo_dir, "build", "output.txt"), "output")
+    _write(os.path.join(repo_dir, "nested", "file.txt"), "nested")
+    _git(os.path.join(repo_dir, "nested"), "init", "-q")
+    archiver = SourceArchiver(
+        build_dir=repo_dir,
+        caches_root=str(tmp_path / "caches"),
+        project_name="project",
+        use_git_index=True,
+        include_git_ignored=include_git_ignored,
+    )
+    with mock.patch.object(
+        archive.os, "scandir", side_effect=archive.os.scandir
+    ) as scandir:
+        names = [entry.path for entry in archiver.scan()]
+    walked = {os.path.relpath(call.args[0], repo_dir) for call in scandir.mock_calls}
+
+    # The git directory and untracked nested repositories are walked
+    assert "nested/file.txt" in names
+    assert "nested/.git/HEAD" in names
+    assert ".git/HEAD" in names
+    assert "sub/untracked.txt" in names
+    if include_git_ignored:
+        assert "build/output.txt" in names
+        assert "." in walked
+    else:
+        # Ignored directories are never walked
+        assert "build" not in names
+        assert "build/output.txt" not in names
+        assert {path.split("/")[0] for path in walked} == {".git", "nested"}
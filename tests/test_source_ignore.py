@@ -0,0 +1,68 @@
+import pytest
+
+from buildrunner.source.ignore import IgnoreMatcher
+
+
+@pytest.mark.parametrize(
+    "patterns, path, is_dir, excluded",
+    [
+        # Unanchored patterns match at any level
+        (["node_modules"], "node_modules", True, True),
+        (["node_modules"], "web/node_modules", True, True),
+        (["*.pyc"], "pkg/sub/module.pyc", False, True),
+        (["*.pyc"], "pkg/sub/module.py", False, False),
+        # Patterns containing a slash are anchored to the root
+        (["/build"], "build", True, True),
+        (["/build"], "sub/build", True, False),
+        (["docs/*.md"], "docs/index.md", False, True),
+        (["docs/*.md"], "docs/api/index.md", False, False),
+        (["docs/*.md"], "other/docs/index.md", False, False),
+        # Wildcards do not cross directories
+        (["a/*/c"], "a/b/c", False, True),
+        (["a/*/c"], "a/b/x/c", False, False),
+        (["fil?.txt"], "file.txt", False, True),
+        (["fil?.txt"], "fil/.txt", False, False),
+        (["[abc].txt"], "b.txt", False, True),
+        (["[!abc].txt"], "b.txt", False, False),
+        (["[!abc].txt"], "d.txt", False, True),
+        # Double asterisks
+        (["**/logs"], "logs", True, True),
+        (["**/logs"], "a/b/logs", True, True),
+        (["**/logs/debug.log"], "a/logs/debug.log", False, True),
+        (["logs/**"], "logs/a/b.txt", False, True),
+        (["logs/**"], "logs", True, False),
+        (["a/**/b"], "a/b", False, True),
+        (["a/**/b"], "a/x/y/b", False, True),
+        (["a/**/b"], "c/a/x/b", False, False),
+        # Directory only patterns
+        (["out/"], "out", True, True),
+        (["out/"], "x/out", True, True),
+        (["out/"], "out", False, False),
+        # Negation, the last matching pattern wins
+        (["*.log", "!keep.log"], "keep.log", False, False),
+        (["*.log", "!keep.log"], "other.log", False, True),
+        (["*.log", "!keep.log", "keep.log"], "keep.log", False, True),
+        # Comments, blank lines and escapes
+        (["# comment", "", "   "], "# comment", False, False),
+        (["\\#file"], "#file", False, True),
+        (["\\!file"], "!file", False, True),
+        (["trailing   "], "trailing", False, True),
+    ],
+)
+def test_match(patterns, path, is_dir, excluded):
+    assert IgnoreMatcher(patterns).match(path, is_dir) == excluded
+
+
+def test_empty_matcher():
+    matcher = IgnoreMatcher(["", "# only comments"])
+    assert not matcher
+    assert not matcher.match("anything")
+
+
+def test_from_file(tmp_path):
+    ignore_file = tmp_path / ".buildignore"
+    ignore_file.write_text("*.tmp\n!important.tmp\n")
+    matcher = IgnoreMatcher.from_file(str(ignore_file))
+    assert matcher.match("a.tmp")
+    assert not matcher.match("important.tmp")
+    assert not IgnoreMatcher.from_file(str(tmp_path / "missing"))
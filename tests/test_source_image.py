@@ -0,0 +1,103 @@
+import os
+import time
+from unittest import mock
+
+from docker.errors import ImageNotFound
+import pytest
+
+from buildrunner.source.image import SOURCE_IMAGE_REPOSITORY, SourceImageCache
+
+
+@pytest.fixture(name="docker_client")
+def fixture_docker_client():
+    images = {"docker.io/busybox:latest"}
+    client = mock.MagicMock()
+
+    def _inspect_image(image):
+        if image not in images:
+            raise ImageNotFound(image)
+        return {"Id": f"sha256:{image}"}
+
+    def _tag(_image_id, repository, tag):
+        images.add(f"{repository}:{tag}")
+
+    def _remove_image(image, **_kwargs):
+        images.remove(image)
+
+    client.inspect_image.side_effect = _inspect_image
+    client.tag.side_effect = _tag
+    client.remove_image.side_effect = _remove_image
+    client.images = images
+    return client
+
+
+@pytest.fixture(name="dockerfile")
+def fixture_dockerfile(tmp_path):
+    dockerfile = tmp_path / "Dockerfile"
+    dockerfile.write_text("FROM busybox\n")
+    return str(dockerfile)
+
+
+def _new_cache(docker_client, tmp_path):
+    return SourceImageCache(
+        docker_client, str(tmp_path / "caches"), "docker.io/busybox:latest"
+    )
+
+
+def test_build_then_reuse(docker_client, dockerfile, tmp_path):
+    build = mock.MagicMock(return_value="sha256:built")
+    cache = _new_cache(docker_client, tmp_path)
+    image = cache.get("digest1", dockerfile, build)
+    assert image == f"{SOURCE_IMAGE_REPOSITORY}:{cache.key}"
+    assert image in docker_client.images
+    build.assert_called_once()
+    cache.release()
+
+    other_cache = _new_cache(docker_client, tmp_path)
+    assert other_cache.get("digest1", dockerfile, build) == image
+    build.assert_called_once()
+    other_cache.release()
+
+    # A different source digest gets a different image
+    assert other_cache.get("digest2", dockerfile, build) != image
+    assert build.call_count == 2
+
+
+def test_key_depends_on_base_image_and_dockerfile(docker_client, dockerfile, tmp_path):
+    cache = _new_cache(docker_client, tmp_path)
+    key = cache.get_key("digest", dockerfile)
+    with open(dockerfile, "a", encoding="utf-8") as fobj:
+        fobj.write("RUN true\n")
+    assert cache.get_key("digest", dockerfile) != key
+
+    docker_client.images.add("docker.io/busybox:1")
+    other_base = SourceImageCache(
+        docker_client, str(tmp_path / "caches"), "docker.io/busybox:1"
+    )
+    assert other_base.get_key("digest", dockerfile) != cache.get_key(
+        "digest", dockerfile
+    )
+
+
+def test_prune_respects_references(docker_client, dockerfile, tmp_path):
+    build = mock.MagicMock(return_value="sha256:built")
+    in_use = _new_cache(docker_client, tmp_path)
+    in_use_image = in_use.get("in-use", dockerfile, build)
+    unused = _new_cache(docker_client, tmp_path)
+    unused_image = unused.get("unused", dockerfile, build)
+    unused.release()
+    current = _new_cache(docker_client, tmp_path)
+    current_image = current.get("current", dockerfile, build)
+    current.release()
+
+    # Make every image old enough to be pruned
+    old = time.time() - 7200
+    for file_name in os.listdir(current.lock_dir):
+        os.utime(os.path.join(current.lock_dir, file_name), (old, old))
+
+    current.prune()
+    assert in_use_image in docker_client.images
+    assert unused_image not in docker_client.images
+    assert current_image in docker_client.images
+    assert not os.path.exists(os.path.join(current.lock_dir, f"{unused.key}.lock"))
+    in_use.release()
@@ -0,0 +1,80 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from buildrunner import BuildRunner
+
+
+def _step(run=False, remote=False, build=False):
+    return SimpleNamespace(
+        run=mock.MagicMock() if run else None,
+        remote=mock.MagicMock() if remote else None,
+        build=mock.MagicMock() if build else None,
+    )
+
+
+@pytest.fixture(name="build_runner")
+def fixture_build_runner():
+    build_runner = BuildRunner.__new__(BuildRunner)
+    build_runner.buildrunner_config = SimpleNamespace(
+        run_config=SimpleNamespace(
+            steps={
+                "build": _step(build=True),
+                "test": _step(run=True),
+                "deploy": _step(remote=True),
+            }
+        )
+    )
+    build_runner.steps_to_run = None
+    build_runner._log = mock.MagicMock()
+    build_runner._source_lock = threading.RLock()
+    build_runner._source_thread = None
+    build_runner.get_source_archive_path = mock.MagicMock()
+    build_runner.get_source_image = mock.MagicMock()
+    build_runner.get_source_volume = mock.MagicMock(return_value=None)
+    return build_runner
+
+
+def test_plan_source(build_runner):
+    assert build_runner._plan_source() == ["test", "deploy"]
+    build_runner.steps_to_run = ["build", "deploy"]
+    assert build_runner._plan_source() == ["deploy"]
+    build_runner.steps_to_run = ["build"]
+    assert build_runner._plan_source() == []
+
+
+def test_no_source_needed(build_runner):
+    build_runner.steps_to_run = ["build"]
+    build_runner._start_source_preparation()
+    assert build_runner._source_thread is None
+    build_runner.get_source_archive_path.assert_not_called()
+
+
+def test_background_source_image(build_runner):
+    build_runner._start_source_preparation()
+    build_runner._source_thread.join()
+    build_runner.get_source_image.assert_called_once()
+
+
+def test_background_source_archive_only(build_runner):
+    build_runner.steps_to_run = ["build", "deploy"]
+    build_runner._start_source_preparation()
+    build_runner._source_thread.join()
+    build_runner.get_source_archive_path.assert_called_once()
+    build_runner.get_source_image.assert_not_called()
+
+
+def test_first_step_needs_source(build_runner):
+    build_runner.steps_to_run = ["test"]
+    build_runner._start_source_preparation()
+    # Created on demand by the step itself
+    assert build_runner._source_thread is None
+
+
+def test_background_failure_is_ignored(build_runner):
+    build_runner.get_source_image.side_effect = Exception("failed")
+    build_runner._start_source_preparation()
+    build_runner._source_thread.join()
+    build_runner.get_source_image.assert_called_once()
@@ -0,0 +1,50 @@
+from unittest import mock
+
+import pytest
+
+from buildrunner.errors import BuildRunnerProcessingError
+from buildrunner.source.volume import SOURCE_VOLUME_LABEL, SourceVolume
+
+
+@pytest.fixture(name="docker_client")
+def fixture_docker_client():
+    client = mock.MagicMock()
+    client.create_container.return_value = {"Id": "helper-id"}
+    client.create_host_config.side_effect = lambda **kwargs: kwargs
+    client.put_archive.return_value = True
+    return client
+
+
+def test_create_and_remove(docker_client, tmp_path):
+    archive = tmp_path / "source.tar"
+    archive.write_bytes(b"archive")
+    source_volume = SourceVolume(
+        docker_client, "docker.io", "/source", {"label1": "value1"}
+    )
+    name = source_volume.create(str(archive))
+
+    labels = {"label1": "value1", SOURCE_VOLUME_LABEL: "true"}
+    docker_client.create_volume.assert_called_once_with(name=name, labels=labels)
+    _, kwargs = docker_client.create_container.call_args
+    assert kwargs["host_config"] == {"binds": {name: {"bind": "/source", "ro": False}}}
+    # The helper is only used to copy the archive, it is never started
+    docker_client.start.assert_not_called()
+    container, path, _ = docker_client.put_archive.call_args[0]
+    assert (container, path) == ("helper-id", "/source")
+    assert source_volume.container == "helper-id"
+
+    source_volume.remove()
+    docker_client.remove_container.assert_called_once_with("helper-id", force=True)
+    docker_client.remove_volume.assert_called_once_with(name, force=True)
+    assert source_volume.name is None
+
+
+def test_put_archive_failure(docker_client, tmp_path):
+    archive = tmp_path / "source.tar"
+    archive.write_bytes(b"archive")
+    docker_client.put_archive.return_value = False
+    source_volume = SourceVolume(docker_client, "docker.io", "/source")
+    with pytest.raises(BuildRunnerProcessingError):
+        source_volume.create(str(archive))
+    source_volume.remove()
+    docker_client.remove_volume.assert_called_once()
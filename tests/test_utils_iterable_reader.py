@@ -0,0 +1,22 @@
+import io
+
+from buildrunner.utils import IterableReader
+
+
+def test_iterable_reader():
+    reader = io.BufferedReader(IterableReader([b"abc", b"", b"defgh", b"i"]), 4)
+    assert reader.read(2) == b"ab"
+    assert reader.read(5) == b"cdefg"
+    assert reader.read() == b"hi"
+    assert reader.read() == b""
+
+
+def test_iterable_reader_is_lazy():
+    chunks = iter([b"abc", b"def"])
+    reader = IterableReader(chunks)
+    buffer = bytearray(2)
+    assert reader.readinto(buffer) == 2
+    assert reader.readinto(buffer) == 1
+    assert bytes(buffer[:1]) == b"c"
+    # The second chunk is only read once the first one is consumed
+    assert next(chunks) == b"def"
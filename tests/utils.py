@@ -0,0 +1,16 @@
+import io
+import tarfile
+from typing import Dict
+
+
+def create_tar(files: Dict[str, bytes]) -> bytes:
+    """
+    Returns an uncompressed tar archive of the given file names and contents.
+    """
+    tar_bytes = io.BytesIO()
+    with tarfile.open(fileobj=tar_bytes, mode="w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return tar_bytes.getvalue()